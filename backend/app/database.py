@@ -1,5 +1,6 @@
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
 from dotenv import load_dotenv
 
@@ -7,7 +8,55 @@ load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./ids_database.db")
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# Connection pool per process (API and each job worker) for server databases
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Reconnect before the server or a proxy drops idle connections
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# SQLite: the write-ahead log lets status polls read while a worker writes,
+# and writers wait up to the busy timeout for each other instead of failing
+SQLITE_WAL = os.getenv("SQLITE_WAL", "true").lower() == "true"
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "10000"))
+
+
+def _sqlite_pragmas(wal: bool, busy_timeout_ms: int):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA busy_timeout = {int(busy_timeout_ms)}")
+        if wal:
+            cursor.execute("PRAGMA journal_mode = WAL")
+            # Durable at each checkpoint rather than each commit; safe with WAL
+            cursor.execute("PRAGMA synchronous = NORMAL")
+        cursor.close()
+    return on_connect
+
+
+def make_engine(url: str = None, **options):
+    """
+    Engine for url (default DATABASE_URL), tuned for its backend.
+
+    SQLite gets WAL mode and a busy timeout on every connection; other
+    databases get a sized pool with pre-ping and recycling. options are
+    passed on to create_engine and override the defaults.
+    """
+    url = make_url(url or DATABASE_URL)
+    if url.get_backend_name() == "sqlite":
+        in_memory = url.database in (None, "", ":memory:")
+        engine = create_engine(url, **{"connect_args": {"check_same_thread": False}, **options})
+        event.listen(engine, "connect", _sqlite_pragmas(SQLITE_WAL and not in_memory, SQLITE_BUSY_TIMEOUT_MS))
+        return engine
+    return create_engine(url, **{
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+        **options,
+    })
+
+
+engine = make_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -17,3 +66,28 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def add_missing_columns(bind=engine):
+    """
+    Add columns declared on the models that existing tables lack.
+
+    create_all() only creates missing tables, so databases created by an older
+    version would never pick up new columns (or new indexes). Added columns
+    must be nullable or have a server_default.
+    """
+    inspector = inspect(bind)
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=bind.dialect)}"
+                    if column.server_default is not None:
+                        ddl += f" DEFAULT {column.server_default.arg}"
+                    if not column.nullable and column.server_default is not None:
+                        ddl += " NOT NULL"
+                    conn.execute(text(ddl))
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
@@ -0,0 +1,217 @@
+"""
+Live ingestion: detect on a packet stream while it is being captured.
+
+Packets are read from stdin, a named pipe or a growing capture file (classic
+pcap format), folded into flows by the same FlowTable/FlowState code as
+uploads, and finished flows are scored in micro-batches. Verdicts are
+aggregated per time window and each closed window is stored as a
+live_windows row.
+
+    tcpdump -i eth0 -U -w - | python -m app.live - --name span0
+    python -m app.live /run/ids/span0.fifo --follow
+    python -m app.live /data/rolling.pcap --follow
+
+Run from backend/ (like `python -m app.worker`).
+"""
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from functools import partial
+import numpy as np
+from app.database import Base, SessionLocal, add_missing_columns, engine
+from app.models import LiveWindow
+from app.utils.features import feature_groups_for, feature_indices
+from app.utils.flow_state import FlowState
+from app.utils.flow_table import FlowTable
+from app.utils.model_predictor import PredictionSummary, predict_batch
+from app.utils.model_registry import model_features, registry
+from app.utils.packet_decoder import decode_records, format_ip, iter_stream_frames
+from app.worker import MODEL_PATH, SCALAR_PATH
+
+# Length of a verdict window, in capture time
+LIVE_WINDOW_SECONDS = float(os.getenv("LIVE_WINDOW_SECONDS", "60"))
+# Finished flows are scored once this many are waiting...
+LIVE_BATCH_FLOWS = int(os.getenv("LIVE_BATCH_FLOWS", "1024"))
+# ...or the oldest has waited this long (wall clock)
+LIVE_BATCH_SECONDS = float(os.getenv("LIVE_BATCH_SECONDS", "1"))
+# Packets buffered between the reader thread and the flow table
+LIVE_QUEUE_PACKETS = 65536
+
+
+class LiveDetector:
+    """
+    Flow table, micro-batch scorer and window aggregator for one packet stream.
+
+    Time is capture time: it advances with packet timestamps, and while the
+    link is quiet by the wall-clock time since the last packet, so idle flows
+    still time out and windows still close.
+    """
+
+    def __init__(self, source: str, model_path: str = None, scaler_path: str = None, window_seconds: float = None,
+                 batch_flows: int = None, batch_seconds: float = None, is_multiclass: bool = False):
+        self.source = source
+        self.model_path = model_path or MODEL_PATH
+        self.scaler_path = scaler_path or SCALAR_PATH
+        self.window_seconds = window_seconds or LIVE_WINDOW_SECONDS
+        self.batch_flows = batch_flows or LIVE_BATCH_FLOWS
+        self.batch_seconds = batch_seconds or LIVE_BATCH_SECONDS
+        self.is_multiclass = is_multiclass
+
+        # Only the features (and feature passes) the model uses, as for uploads
+        self.feature_names = model_features(registry.get(self.model_path))
+        self.columns = feature_indices(self.feature_names)
+        self.table = FlowTable(flow_factory=partial(FlowState, groups=feature_groups_for(self.feature_names)))
+
+        self.pending = []  # finished flows waiting to be scored
+        self.pending_since = None
+        self.clock = None  # capture time of the last packet (or tick)
+        self.window_start = None
+        self._reset_window()
+
+    def _reset_window(self):
+        self.summary = PredictionSummary(self.is_multiclass)
+        self.anomalous_sources = Counter()
+
+    def add(self, ts: float, length: int, headers):
+        if self.window_start is None:
+            self.window_start = ts - ts % self.window_seconds
+        self._advance(ts)
+        self.table.add(ts, length, headers)
+        self._collect()
+
+    def tick(self, idle_seconds: float):
+        """Advance capture time while no packets arrive."""
+        if self.clock is None:
+            return
+        self._advance(self.clock + idle_seconds)
+        self.table.sweep(self.clock)
+        self._collect()
+
+    def _advance(self, now: float):
+        # Flows that finished before a window boundary belong to that window
+        while now >= self.window_start + self.window_seconds:
+            self._score()
+            self._close_window()
+            # Windows with no traffic at all are skipped
+            self.window_start = max(self.window_start + self.window_seconds, now - now % self.window_seconds)
+        self.clock = max(now, self.clock or now)
+
+    def _collect(self):
+        if self.table.finished:
+            if not self.pending:
+                self.pending_since = time.monotonic()
+            self.pending.extend(self.table.drain())
+        if len(self.pending) >= self.batch_flows or (self.pending and time.monotonic() - self.pending_since >= self.batch_seconds):
+            self._score()
+
+    def _score(self):
+        if not self.pending:
+            return
+        flows, self.pending = self.pending, []
+        # Looked up per batch so a model replaced on disk takes effect
+        model, scaler = registry.get(self.model_path), registry.get(self.scaler_path)
+        features = np.array([flow.features() for _, flow in flows], dtype=np.float64)[:, self.columns]
+        labels, confidences = predict_batch(np.nan_to_num(features), model, scaler)
+        self.summary.update(labels, confidences)
+        for (_, flow), label in zip(flows, labels):
+            if label != 0:  # 0 = BENIGN in both label sets
+                self.anomalous_sources[format_ip(flow.initiator >> 16)] += 1
+
+    def _close_window(self):
+        if self.summary.n_samples == 0:
+            return  # nothing finished in this window
+        result = self.summary.result()
+        result["top_anomalous_sources"] = self.anomalous_sources.most_common(5)
+        anomalies = sum(self.anomalous_sources.values())
+        window_start = datetime.utcfromtimestamp(self.window_start)
+        window = LiveWindow(
+            source=self.source,
+            window_start=window_start,
+            window_end=datetime.utcfromtimestamp(self.window_start + self.window_seconds),
+            flows=self.summary.n_samples,
+            anomalies=anomalies,
+            prediction=result["prediction"],
+            threat_level=result["threat_level"],
+            result=json.dumps(result),
+        )
+        db = SessionLocal()
+        try:
+            db.add(window)
+            db.commit()
+        finally:
+            db.close()
+        icon = "🚨" if result["prediction"] == "malicious" else "🟢"
+        print(f"{icon} {self.source} {window_start.isoformat()}: {self.summary.n_samples} flows, {anomalies} anomalous, {result['prediction']}")
+        self._reset_window()
+
+    def finish(self):
+        """End of stream: end every open flow and close the last window."""
+        self.pending.extend(self.table.flush())
+        self._score()
+        if self.window_start is not None:
+            self._close_window()
+
+
+def _read_packets(stream, follow: bool, packets: queue.Queue):
+    # Reading blocks on the pipe/file; a thread keeps the detector ticking meanwhile
+    try:
+        for record in decode_records(iter_stream_frames(stream, follow)):
+            packets.put(record)
+        packets.put(None)
+    except Exception as e:
+        packets.put(e)
+
+
+def run(stream, detector: LiveDetector, follow: bool = False):
+    """Feed a classic pcap byte stream to detector until it ends."""
+    packets = queue.Queue(maxsize=LIVE_QUEUE_PACKETS)
+    threading.Thread(target=_read_packets, args=(stream, follow, packets), name="live-reader", daemon=True).start()
+    last_arrival = time.monotonic()
+    while True:
+        try:
+            record = packets.get(timeout=detector.batch_seconds)
+        except queue.Empty:
+            now = time.monotonic()
+            detector.tick(now - last_arrival)
+            last_arrival = now
+            continue
+        if record is None:
+            break
+        if isinstance(record, Exception):
+            raise record
+        last_arrival = time.monotonic()
+        detector.add(*record)
+    detector.finish()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="pcap stream: '-' for stdin, a named pipe or a capture file")
+    parser.add_argument("--follow", action="store_true", help="keep waiting for data at end of stream (growing file)")
+    parser.add_argument("--name", help="source name stored with each window (default: the source path)")
+    parser.add_argument("--window", type=float, default=None, help=f"window length in seconds (default {LIVE_WINDOW_SECONDS:g})")
+    parser.add_argument("--multiclass", action="store_true", help="the model predicts attack classes")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    add_missing_columns(engine)
+    name = args.name or ("stdin" if args.source == "-" else args.source)
+    detector = LiveDetector(name, window_seconds=args.window, is_multiclass=args.multiclass)
+    print(f"📡 Live detection on {name} ({args.window or LIVE_WINDOW_SECONDS:g}s windows)")
+    stream = sys.stdin.buffer if args.source == "-" else open(args.source, "rb")
+    try:
+        run(stream, detector, args.follow)
+    except KeyboardInterrupt:
+        detector.finish()
+    finally:
+        stream.close()
+
+
+if __name__ == "__main__":
+    main()
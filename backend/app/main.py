@@ -1,11 +1,16 @@
 import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.database import engine, Base
-from app.routes import upload, status, result, history
+from app.database import engine, Base, add_missing_columns
+from app.routes import upload, status, result, history, registry
+from app.utils.model_registry import registry as model_registry
+from app.utils import job_events
+from app.utils.upload_store import UploadSizeLimit
+from app.worker import JOB_WORKERS, WorkerPool, recover_jobs
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
+add_missing_columns(engine)
 
 app = FastAPI(
     title="IDS Backend API",
@@ -13,6 +18,10 @@ app = FastAPI(
     version="2.0.0"
 )
 
+# Oversized uploads are refused before their multipart body is parsed
+# (added first so its 413 still passes through CORS)
+app.add_middleware(UploadSizeLimit, paths=("/upload", "/upload-chunk"))
+
 # CORS configuration
 app.add_middleware(
     CORSMiddleware,
@@ -31,6 +40,27 @@ app.include_router(upload.router, tags=["Upload"])
 app.include_router(status.router, tags=["Status"])
 app.include_router(result.router, tags=["Results"])
 app.include_router(history.router, tags=["History"])
+app.include_router(registry.router, tags=["Models"])
+
+@app.on_event("startup")
+def load_models():
+    # Deserialize models once per process instead of once per job
+    model_registry.preload()
+
+# PCAP analysis runs in worker processes, not in the API process
+worker_pool = WorkerPool(JOB_WORKERS)
+
+@app.on_event("startup")
+def start_workers():
+    recover_jobs()
+    # Before the workers start: they inherit the broker's address
+    job_events.start_broker()
+    worker_pool.start()
+
+@app.on_event("shutdown")
+def stop_workers():
+    worker_pool.stop()
+    job_events.stop_broker()
 
 @app.get("/")
 def read_root():
@@ -40,8 +70,10 @@ def read_root():
         "endpoints": {
             "upload": "/upload",
             "status": "/status/{job_id}",
+            "status_stream": "/status/{job_id}/stream",
             "result": "/result/{job_id}",
-            "history": "/history"
+            "history": "/history",
+            "models": "/models"
         }
     }
 
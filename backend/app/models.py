@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey
+from sqlalchemy import BigInteger, Column, Integer, String, DateTime, Text, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.database import Base
@@ -16,16 +16,63 @@ class User(Base):
 
 class PcapFile(Base):
     __tablename__ = "pcap_files"
+    # /history lists a user's jobs newest first
+    __table_args__ = (Index("ix_pcap_files_user_id_created_at", "user_id", "created_at"),)
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     filename = Column(String, nullable=False)
     filepath = Column(String, nullable=False)
     csv_path = Column(String, nullable=True)
+    features_path = Column(String, nullable=True)  # Parquet flow store (feature_store.py)
+    verdicts_path = Column(String, nullable=True)  # Parquet per-flow predictions (feature_store.py)
+    sha256 = Column(String(64), nullable=True, index=True)  # of the uploaded file
+    upload_id = Column(String, nullable=True, unique=True, index=True)  # chunked upload analysed while arriving
+    size_bytes = Column(BigInteger, nullable=True)
     status = Column(String, default="pending")  # pending, processing, completed, failed
     result = Column(Text, nullable=True)  # JSON string from Gemini
+    # Summary of result, kept in step with it so /history need not parse it
+    threats_detected = Column(Integer, nullable=True)
+    risk_score = Column(Integer, nullable=True)
+    severity = Column(String, nullable=True)  # High, Medium, Low
+    report_status = Column(String, nullable=True)  # pending (Gemini report on its way), ready, fallback; None = final
     error = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     completed_at = Column(DateTime, nullable=True)
+    # Job queue (app/worker.py): processing attempts so far and the worker lease
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    lease_owner = Column(String, nullable=True)
+    lease_expires = Column(DateTime, nullable=True, index=True)
     
     user = relationship("User", back_populates="pcap_files")
+
+class LiveWindow(Base):
+    """Verdict for one time window of a live capture (app/live.py)"""
+    __tablename__ = "live_windows"
+
+    id = Column(Integer, primary_key=True, index=True)
+    source = Column(String, nullable=False, index=True)  # capture name, e.g. the SPAN interface
+    window_start = Column(DateTime, nullable=False, index=True)  # capture time (UTC)
+    window_end = Column(DateTime, nullable=False)
+    flows = Column(Integer, nullable=False)
+    anomalies = Column(Integer, nullable=False)
+    prediction = Column(String, nullable=False)  # benign, malicious
+    threat_level = Column(String, nullable=False)
+    result = Column(Text, nullable=True)  # JSON prediction summary for the window
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class AnalysisCache(Base):
+    """Finished analysis of a capture, reused for identical uploads (result_cache.py)"""
+    __tablename__ = "analysis_cache"
+    __table_args__ = (UniqueConstraint("sha256", "version"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    sha256 = Column(String(64), nullable=False)  # of the capture file
+    version = Column(String, nullable=False)  # result_cache.analysis_version()
+    result = Column(Text, nullable=False)  # JSON, as stored on PcapFile.result
+    features_path = Column(String, nullable=True)  # cached Parquet flow store
+    verdicts_path = Column(String, nullable=True)  # cached per-flow predictions
+    size_bytes = Column(BigInteger, nullable=False, default=0)
+    hits = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_used_at = Column(DateTime, default=datetime.utcnow, index=True)
@@ -1,54 +1,80 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from typing import List
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session, load_only
+from typing import List, Optional
 from app.database import get_db
 from app.auth import get_current_user
 from app.models import User, PcapFile
 from app.schemas import HistoryItem
-import json
+from app.worker import set_result
 
 router = APIRouter()
 
+HISTORY_COLUMNS = (
+    PcapFile.id, PcapFile.filename, PcapFile.status, PcapFile.threats_detected,
+    PcapFile.severity, PcapFile.created_at
+)
+
+
+def _parse_cursor(cursor: str):
+    # "<created_at ISO timestamp>_<id>" of the last item on the previous page
+    try:
+        created_at, pcap_id = cursor.rsplit("_", 1)
+        return datetime.fromisoformat(created_at), int(pcap_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _backfill_summaries(db: Session, pcap_files: list):
+    """Fill the summary columns of results stored before they existed; the caller commits"""
+    missing = [pcap.id for pcap in pcap_files if pcap.threats_detected is None and pcap.status == "completed"]
+    if not missing:
+        return
+    for pcap in db.query(PcapFile).filter(PcapFile.id.in_(missing), PcapFile.result.isnot(None)):
+        set_result(pcap, pcap.result)
+
+
 @router.get("/history", response_model=List[HistoryItem])
 def get_user_history(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Page size (default: everything)"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
     user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get all PCAP analysis history for the current user"""
-    
-    pcap_files = db.query(PcapFile).filter(
-        PcapFile.user_id == user.id
-    ).order_by(PcapFile.created_at.desc()).all()
-    
-    history = []
-    for pcap in pcap_files:
-        threats_detected = 0
-        severity = "Low"
-        
-        # Parse result to get threat info
-        if pcap.result:
-            try:
-                result_data = json.loads(pcap.result)
-                threats_detected = result_data.get("summary", {}).get("totalThreats", 0)
-                
-                # Determine severity based on risk score
-                risk_score = result_data.get("summary", {}).get("riskScore", 0)
-                if risk_score >= 70:
-                    severity = "High"
-                elif risk_score >= 40:
-                    severity = "Medium"
-                else:
-                    severity = "Low"
-            except:
-                pass
-        
-        history.append(HistoryItem(
+    """
+    Get PCAP analysis history for the current user, newest first.
+
+    With limit, a full page sets the X-Next-Cursor header; pass it back as
+    cursor for the next page.
+    """
+    query = db.query(PcapFile).options(load_only(*HISTORY_COLUMNS)).filter(PcapFile.user_id == user.id)
+    if cursor:
+        created_at, pcap_id = _parse_cursor(cursor)
+        query = query.filter(or_(
+            PcapFile.created_at < created_at,
+            and_(PcapFile.created_at == created_at, PcapFile.id < pcap_id)
+        ))
+    query = query.order_by(PcapFile.created_at.desc(), PcapFile.id.desc())
+    pcap_files = query.limit(limit).all() if limit else query.all()
+
+    _backfill_summaries(db, pcap_files)
+
+    if limit and len(pcap_files) == limit:
+        last = pcap_files[-1]
+        response.headers["X-Next-Cursor"] = f"{last.created_at.isoformat()}_{last.id}"
+
+    history = [
+        HistoryItem(
             pcap_id=pcap.id,
             filename=pcap.filename,
             status=pcap.status,
-            threats_detected=threats_detected,
-            severity=severity,
+            threats_detected=pcap.threats_detected or 0,
+            severity=pcap.severity or "Low",
             timestamp=pcap.created_at
-        ))
-    
+        )
+        for pcap in pcap_files
+    ]
+    db.commit()  # backfilled summaries
     return history
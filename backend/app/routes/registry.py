@@ -0,0 +1,16 @@
+from fastapi import APIRouter, Depends
+from app.auth import get_current_user
+from app.models import User
+from app.utils.model_registry import registry
+from app.utils.model_predictor import inference_stats
+
+router = APIRouter()
+
+@router.get("/models")
+def list_loaded_models(user: User = Depends(get_current_user)):
+    """Models and scalers held in memory, with their load time and footprint"""
+    return {
+        "models_dir": registry.models_dir,
+        "models": registry.stats(),
+        "inference": inference_stats()
+    }
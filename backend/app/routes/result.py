@@ -1,11 +1,15 @@
+import os
 import re
 import json
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.auth import get_current_user
 from app.models import User, PcapFile
-from app.schemas import ResultResponse
+from app.schemas import FlowVerdict, FlowVerdictPage, ResultResponse
+from app.utils.feature_store import read_flow_verdicts
 
 router = APIRouter()
 
@@ -86,5 +90,58 @@ def get_job_result(
             "totalThreats": 0,
             "riskScore": 0,
             "recommendation": "No analysis available"
-        })
+        }),
+        report=pcap_file.report_status or "ready"
     )
+
+@router.get("/result/{job_id}/flows", response_model=FlowVerdictPage)
+async def get_job_flows(
+    job_id: int,
+    label: Optional[str] = Query(None, description="Predicted class name, e.g. ATTACK or DDoS"),
+    ip: Optional[str] = Query(None, description="Source or destination IP"),
+    port: Optional[int] = Query(None, ge=0, le=65535, description="Source or destination port"),
+    flagged_only: bool = True,
+    page: int = Query(1, ge=1),
+    page_size: int = Query(100, ge=1, le=1000),
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Page through the per-flow verdicts of a completed job (flagged flows by default)"""
+    pcap_file = db.query(PcapFile).filter(
+        PcapFile.id == job_id,
+        PcapFile.user_id == user.id
+    ).first()
+
+    if not pcap_file:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    if pcap_file.status != "completed":
+        raise HTTPException(
+            status_code=400,
+            detail=f"Job is not completed yet. Current status: {pcap_file.status}"
+        )
+
+    if not pcap_file.verdicts_path or not os.path.exists(pcap_file.verdicts_path):
+        raise HTTPException(status_code=404, detail="No per-flow verdicts stored for this job")
+
+    total, verdicts = await run_in_threadpool(
+        read_flow_verdicts, pcap_file.verdicts_path, flagged_only, label, ip, port,
+        (page - 1) * page_size, page_size
+    )
+    flows = [
+        FlowVerdict(
+            sourceIP=row["Source IP"],
+            sourcePort=row["Source Port"],
+            destinationIP=row["Destination IP"],
+            destinationPort=row["Destination Port"],
+            protocol=row["Protocol"],
+            timestamp=row["Timestamp"],
+            duration=row["Duration"],
+            label=row["Label"],
+            className=row["Class"],
+            confidence=row["Confidence"],
+            flagged=row["Flagged"],
+        )
+        for row in verdicts.to_dict("records")
+    ]
+    return FlowVerdictPage(job_id=pcap_file.id, total=total, page=page, page_size=page_size, flows=flows)
@@ -1,12 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.database import get_db
+import asyncio
+import json
+import os
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session, load_only
+from app.database import SessionLocal, get_db
 from app.auth import get_current_user
 from app.models import User, PcapFile
 from app.schemas import StatusResponse
+from app.utils import job_events
+
+# A status stream re-reads its job from the database when no event arrived for
+# this long (events are best effort), and sends a keep-alive otherwise
+STATUS_STREAM_RECHECK_SECONDS = float(os.getenv("STATUS_STREAM_RECHECK_SECONDS", "5"))
 
 router = APIRouter()
 
+def _find_job(db: Session, job_id: int, user: User):
+    # Polled every few seconds per open job: skip the result blob
+    return db.query(PcapFile).options(
+        load_only(PcapFile.id, PcapFile.status, PcapFile.filename)
+    ).filter(
+        PcapFile.id == job_id,
+        PcapFile.user_id == user.id
+    ).first()
+
 @router.get("/status/{job_id}", response_model=StatusResponse)
 def get_job_status(
     job_id: int,
@@ -15,10 +34,7 @@ def get_job_status(
 ):
     """Get the current status of a PCAP file processing job"""
     
-    pcap_file = db.query(PcapFile).filter(
-        PcapFile.id == job_id,
-        PcapFile.user_id == user.id
-    ).first()
+    pcap_file = _find_job(db, job_id, user)
     
     if not pcap_file:
         raise HTTPException(status_code=404, detail="Job not found")
@@ -28,3 +44,72 @@ def get_job_status(
         status=pcap_file.status,
         filename=pcap_file.filename
     )
+
+def _current_status(job_id: int):
+    db = SessionLocal()
+    try:
+        row = db.query(PcapFile.status).filter(PcapFile.id == job_id).first()
+        return row.status if row else None
+    finally:
+        db.close()
+
+def _sse(event: dict) -> str:
+    return f"event: status\ndata: {json.dumps(event)}\n\n"
+
+@router.get("/status/{job_id}/stream")
+async def stream_job_status(
+    job_id: int,
+    request: Request,
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Server-Sent Events stream of a job's status and progress.
+
+    Each "status" event carries the job's latest state: status, and while it
+    is processing stage (parsing, scoring, storing...), progress (0-100) and
+    counters such as packets and flows. The stream ends once the job has
+    completed or failed.
+    """
+    pcap_file = await run_in_threadpool(_find_job, db, job_id, user)
+    if not pcap_file:
+        raise HTTPException(status_code=404, detail="Job not found")
+    status = pcap_file.status
+    db.close()  # not held for the life of the stream
+
+    async def events():
+        subscriber, latest = job_events.hub.subscribe(job_id)
+        queue = subscriber[1]
+        try:
+            # The hub's last event is fresher than the row read above, unless the
+            # row is already final (the event saying so may have been lost)
+            event = {"job_id": job_id, "status": status}
+            if latest and status not in job_events.TERMINAL_STATUSES:
+                event = {**event, **latest}
+            yield _sse(event)
+            status_sent = event.get("status")
+            while status_sent not in job_events.TERMINAL_STATUSES:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=STATUS_STREAM_RECHECK_SECONDS)
+                    while not queue.empty():  # each event is a full snapshot: skip to the newest
+                        event = queue.get_nowait()
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    current = await run_in_threadpool(_current_status, job_id)
+                    if current is None:
+                        return
+                    if current == status_sent:
+                        yield ": keep-alive\n\n"
+                        continue
+                    event = {"job_id": job_id, "status": current}
+                yield _sse(event)
+                status_sent = event.get("status", status_sent)
+        finally:
+            job_events.hub.unsubscribe(job_id, subscriber)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
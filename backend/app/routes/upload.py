@@ -1,78 +1,68 @@
 import os
 import uuid
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, BackgroundTasks, FastAPI, UploadFile, Form, Depends, HTTPException
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, FastAPI, UploadFile, Form, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.auth import get_current_user
 from app.models import User, PcapFile
 from app.schemas import UploadResponse
-from app.utils.pcap_converter import convert_pcap_to_csv
-from app.utils.model_predictor import predict_from_csv
-from app.utils.gemini_formatter import format_with_gemini
+from app.utils.feature_store import FEATURE_FOLDER
+from app.utils.packet_decoder import is_pcap_stream
+from app.utils.upload_store import MAX_UPLOAD_BYTES, UploadTooLarge, save_upload
+from app.utils.chunked_upload import CHUNK_DIR, PIPELINED_UPLOADS, ChunkedUpload, ChunkUploadError
+from app.utils import job_events, result_cache
+from app.worker import CSV_FOLDER, MODEL_PATH, SCALAR_PATH, set_result
 from datetime import datetime
-import shutil, os, uuid, json
-import json
+from typing import Optional
+import os, uuid
 
 
 
 router = APIRouter()
 
 UPLOAD_FOLDER = os.getenv("UPLOAD_FOLDER", "uploads")
-CSV_FOLDER = os.getenv("CSV_FOLDER", "csv_files")
-MODEL_PATH = os.getenv("MODEL_PATH", "model.joblib")
-SCALAR_PATH = os.getenv("SCALAR_PATH", "scalar.joblib")
-CHUNK_DIR = "upload_chunks"
+CACHED_MESSAGE = "File uploaded successfully. An identical capture was already analysed; its result was reused."
 os.makedirs(CHUNK_DIR, exist_ok=True)
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(CSV_FOLDER, exist_ok=True)
+os.makedirs(FEATURE_FOLDER, exist_ok=True)
 
-def process_pcap_file(pcap_id: int, pcap_path: str, filename: str):
-    """Background task to process PCAP file"""
-    db = next(get_db())
-    
+def create_job(db: Session, user: User, filename: str, path: str, size: int, sha256: str) -> PcapFile:
+    """
+    Record an uploaded capture as a job.
+
+    If the same content was already analysed with the current model, the job
+    is completed right away from the result cache; otherwise it is queued.
+    """
+    pcap_file = PcapFile(
+        user_id=user.id,
+        filename=filename,
+        filepath=path,
+        sha256=sha256,
+        size_bytes=size,
+        status="pending"
+    )
     try:
-        # Get PCAP record
-        pcap_file = db.query(PcapFile).filter(PcapFile.id == pcap_id).first()
-        if not pcap_file:
-            return
-        
-        # Update status to processing
-        pcap_file.status = "processing"
-        db.commit()
-        
-        # Step 1: Convert PCAP to CSV
-        print("Converting PCAP to CSV")
-        csv_path = convert_pcap_to_csv(pcap_path, CSV_FOLDER)
-        pcap_file.csv_path = csv_path
-        db.commit()
-        
-        print("Successfully Converted to CSV: ${csv_path}")
-        # Step 2: Run model prediction
-        print("SENT FOR MODEL EVALUATION")
-        model_output = predict_from_csv(csv_path, MODEL_PATH, SCALAR_PATH)
-        print(model_output)
-        # Step 3: Format with Gemini
-        gemini_result = format_with_gemini(model_output, filename)
-        
-        # Step 4: Store result
-        pcap_file.result = json.dumps(gemini_result)
+        cached = result_cache.lookup(db, sha256, result_cache.analysis_version(MODEL_PATH, SCALAR_PATH))
+    except Exception as e:
+        print(f"⚠️ Result cache lookup failed: {e}")
+        cached = None
+    if cached:
+        set_result(pcap_file, cached.result)
         pcap_file.status = "completed"
         pcap_file.completed_at = datetime.utcnow()
-        db.commit()
-        
-    except Exception as e:
-        # Handle errors
-        pcap_file = db.query(PcapFile).filter(PcapFile.id == pcap_id).first()
-        if pcap_file:
-            pcap_file.status = "failed"
-            pcap_file.error = str(e)
-            db.commit()
-    finally:
-        db.close()
+        pcap_file.features_path = result_cache.link_features(cached, path, FEATURE_FOLDER)
+        pcap_file.verdicts_path = result_cache.link_verdicts(cached, path, FEATURE_FOLDER)
+    db.add(pcap_file)
+    db.commit()
+    db.refresh(pcap_file)
+    job_events.publish(pcap_file.id, pcap_file.status, **({"progress": 100} if cached else {}))
+    return pcap_file
 
 @router.post("/upload", response_model=UploadResponse)
 async def upload_pcap(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -88,27 +78,21 @@ async def upload_pcap(
     unique_name = f"{uuid.uuid4().hex}{file_ext}"
     save_path = os.path.join(UPLOAD_FOLDER, unique_name)
     
-    # Save file
+    # Save file: streamed to disk and hashed chunk by chunk, off the event loop
+    if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=str(UploadTooLarge(MAX_UPLOAD_BYTES)))
     try:
-        contents = await file.read()
-        with open(save_path, "wb") as f:
-            f.write(contents)
+        size, sha256 = await run_in_threadpool(save_upload, file.file, save_path)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
     
-    # Create database record
-    pcap_file = PcapFile(
-        user_id=user.id,
-        filename=file.filename,
-        filepath=save_path,
-        status="pending"
-    )
-    db.add(pcap_file)
-    db.commit()
-    db.refresh(pcap_file)
-    
-    # Start background processing
-    background_tasks.add_task(process_pcap_file, pcap_file.id, save_path, file.filename)
+    # Create database record; a worker process (app/worker.py) picks the job up.
+    # Off the event loop: the cache lookup may load the model and link files
+    pcap_file = await run_in_threadpool(create_job, db, user, file.filename, save_path, size, sha256)
+    if pcap_file.status == "completed":
+        return UploadResponse(job_id=pcap_file.id, message=CACHED_MESSAGE)
     
     return UploadResponse(
         job_id=pcap_file.id,
@@ -116,6 +100,12 @@ async def upload_pcap(
     )
 
 
+def _chunked_upload(uploadId: str) -> ChunkedUpload:
+    try:
+        return ChunkedUpload(uploadId)
+    except ChunkUploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
 @router.post("/upload-chunk")
 async def upload_chunk(
     chunk: UploadFile = File(...),
@@ -123,55 +113,106 @@ async def upload_chunk(
     chunkIndex: int = Form(...),
     totalChunks: int = Form(...),
     uploadId: str = Form(...),
+    chunkSize: int = Form(...),
+    fileSize: Optional[int] = Form(None),
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Receive a file chunk; chunks may arrive in parallel and in any order"""
+    upload = _chunked_upload(uploadId)
+    try:
+        manifest = await run_in_threadpool(upload.start, user.id, filename, totalChunks, chunkSize, fileSize)
+        size = await run_in_threadpool(upload.write_chunk, manifest, chunkIndex, chunk.file)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ChunkUploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+    if PIPELINED_UPLOADS and chunkIndex == 0 and totalChunks > 1:
+        await run_in_threadpool(start_pipelined_job, db, user, upload, filename)
+    return {"status": "ok", "chunk": chunkIndex, "bytes": size}
+
+def start_pipelined_job(db: Session, user: User, upload: ChunkedUpload, filename: str):
+    """
+    Queue a chunked upload for analysis once its first chunk is in.
+
+    The worker parses the file while the remaining chunks arrive (see
+    UploadPrefixReader). Only classic pcap can be parsed as a stream; pcapng
+    uploads are analysed after merge-chunks as usual.
+    """
+    with open(upload.part_path, "rb") as f:
+        if not is_pcap_stream(f.read(4)):
+            return
+    pcap_file = PcapFile(
+        user_id=user.id,
+        filename=filename,
+        filepath=upload.part_path,
+        upload_id=upload.upload_id,
+        status="pending"
+    )
+    db.add(pcap_file)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()  # chunk 0 was sent twice; the job already exists
+
+@router.get("/upload-chunk/{uploadId}")
+def get_chunk_upload_status(
+    uploadId: str,
     user: User = Depends(get_current_user)
 ):
-    """Receive a file chunk"""
-    user_dir = os.path.join(CHUNK_DIR, uploadId)
-    os.makedirs(user_dir, exist_ok=True)
-    chunk_path = os.path.join(user_dir, f"chunk_{chunkIndex:05d}")
-    with open(chunk_path, "wb") as buffer:
-        shutil.copyfileobj(chunk.file, buffer)
-    return {"status": "ok", "chunk": chunkIndex}
+    """Which chunks of an upload have arrived, so an interrupted upload can resume"""
+    upload = _chunked_upload(uploadId)
+    try:
+        if upload.manifest()["user_id"] != user.id:
+            raise ChunkUploadError("Upload not found", 404)
+        return upload.status()
+    except ChunkUploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
 
 @router.post("/merge-chunks", response_model=UploadResponse)
 async def merge_chunks(
     payload: dict,
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
-    background_tasks: BackgroundTasks = None
+    user: User = Depends(get_current_user)
 ):
-    """Merge chunks and start background processing"""
+    """Finish a chunked upload and queue the file for processing"""
     filename = payload.get("filename")
     uploadId = payload.get("uploadId")
     if not filename or not uploadId:
         raise HTTPException(status_code=400, detail="Missing filename or uploadId")
 
-    user_dir = os.path.join(CHUNK_DIR, uploadId)
-    if not os.path.exists(user_dir):
-        raise HTTPException(status_code=404, detail="Chunks not found")
-
-    unique_name = f"{uuid.uuid4().hex}_{filename}"
+    upload = _chunked_upload(uploadId)
+    unique_name = f"{uuid.uuid4().hex}_{os.path.basename(filename)}"
     final_path = os.path.join(UPLOAD_FOLDER, unique_name)
 
-    with open(final_path, "wb") as merged:
-        for chunk_file in sorted(os.listdir(user_dir)):
-            with open(os.path.join(user_dir, chunk_file), "rb") as cf:
-                shutil.copyfileobj(cf, merged)
-
-    shutil.rmtree(user_dir)
-
-    # Create DB record
-    pcap_file = PcapFile(
-        user_id=user.id,
-        filename=filename,
-        filepath=final_path,
-        status="pending"
-    )
-    db.add(pcap_file)
-    db.commit()
-    db.refresh(pcap_file)
-
-    # Start background processing
-    background_tasks.add_task(process_pcap_file, pcap_file.id, final_path, filename)
+    # The chunks were written in place: finishing is a rename, not a copy
+    try:
+        if upload.manifest()["user_id"] != user.id:
+            raise ChunkUploadError("Chunks not found", 404)
+        size = await run_in_threadpool(upload.finish, final_path)
+    except ChunkUploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+    pcap_file, pipelined = await run_in_threadpool(merged_job, db, user, uploadId, filename, final_path, size)
+    if pipelined:
+        return UploadResponse(job_id=pcap_file.id, message="File uploaded successfully; processing is already under way.")
+    return UploadResponse(job_id=pcap_file.id, message="File uploaded successfully and processing started.")
+
+def merged_job(db: Session, user: User, upload_id: str, filename: str, path: str, size: int):
+    """Job for a merged chunked upload, and whether it was already queued (pipelined)"""
+    # Pipelined upload: the job was queued with the first chunk and may be
+    # well under way; it just needs the file's final location
+    pcap_file = db.query(PcapFile).filter(
+        PcapFile.upload_id == upload_id,
+        PcapFile.user_id == user.id
+    ).first()
+    if pcap_file:
+        pcap_file.filepath = path
+        pcap_file.size_bytes = size
+        db.commit()
+        return pcap_file, True
 
-    return UploadResponse(job_id=pcap_file.id, message="File uploaded successfully and processing started.")
\ No newline at end of file
+    # Create DB record; a worker process (app/worker.py) picks the job up and
+    # hashes the file (for the result cache) there, off the API
+    return create_job(db, user, filename, path, size, None), False
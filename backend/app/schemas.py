@@ -32,6 +32,27 @@ class ResultResponse(BaseModel):
     status: str
     threats: List[ThreatDetail]
     summary: ResultSummary
+    report: str = "ready"  # pending: model-based report, the Gemini one is on its way
+
+class FlowVerdict(BaseModel):
+    sourceIP: str
+    sourcePort: int
+    destinationIP: str
+    destinationPort: int
+    protocol: int
+    timestamp: float  # flow start, seconds since the epoch
+    duration: float  # seconds
+    label: int
+    className: str
+    confidence: float
+    flagged: bool
+
+class FlowVerdictPage(BaseModel):
+    job_id: int
+    total: int
+    page: int
+    page_size: int
+    flows: List[FlowVerdict]
 
 class HistoryItem(BaseModel):
     pcap_id: int
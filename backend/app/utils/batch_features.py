@@ -0,0 +1,531 @@
+import mmap
+import os
+import struct
+from array import array
+from itertools import islice
+import numpy as np
+from tqdm import tqdm
+from app.utils.features import ALL_78_FEATURES, ALL_FEATURE_GROUPS
+from app.utils.flow_state import ACTIVITY_TIMEOUT
+from app.utils.flow_table import FLOW_ACTIVE_TIMEOUT, FLOW_IDLE_TIMEOUT, TCP_FIN, TCP_RST
+from app.utils.packet_decoder import (
+    DLT_EN10MB, DLT_IPV4, DLT_IPV6, DLT_LINUX_SLL, DLT_LINUX_SLL2, DLT_LOOP, DLT_NULL, DLT_RAW,
+    ETH_P_IP, ETH_P_IPV6, IPV4_MAPPED, IPV6_AH, IPV6_EXT_HEADERS, IPV6_FRAGMENT,
+    PCAP_GLOBAL_HEADER_LEN, PCAP_RECORD_HEADER_LEN, PROTO_TCP, PROTO_UDP, VLAN_ETHERTYPES,
+    decode_frame, is_pcap_stream, iter_packet_records, pcap_format,
+)
+
+# Packets decoded between two conversions to NumPy columns
+DECODE_BATCH_PACKETS = 65536
+# Link types whose headers are decoded with array operations (classic pcap)
+VECTOR_LINKTYPES = (DLT_EN10MB, DLT_RAW, DLT_IPV4, DLT_IPV6, DLT_NULL, DLT_LOOP, DLT_LINUX_SLL, DLT_LINUX_SLL2)
+_LOW_64 = (1 << 64) - 1
+
+
+class HeaderColumns:
+    """
+    Decoded header fields of every packet in a capture, as NumPy arrays in
+    capture order. Addresses (see packet_decoder.IPV4_MAPPED) are split into
+    their high and low 64 bits; flags is 0 for non-TCP packets.
+    """
+
+    FIELDS = ("ts", "length", "src_hi", "src_lo", "dst_hi", "dst_lo", "sport", "dport", "proto", "flags", "hdr_len", "window")
+
+    def __init__(self, **arrays):
+        for name in self.FIELDS:
+            setattr(self, name, arrays[name])
+
+    def __len__(self):
+        return len(self.ts)
+
+
+def _split_addresses(addresses: list):
+    """High and low 64 bits of integer addresses, as two uint64 arrays."""
+    try:
+        # IPv4 (mapped) addresses fit in 64 bits
+        return np.zeros(len(addresses), dtype=np.uint64), np.array(addresses, dtype=np.uint64)
+    except OverflowError:
+        wide = np.array(addresses, dtype=object)
+        return (wide >> 64).astype(np.uint64), (wide & _LOW_64).astype(np.uint64)
+
+
+def _header_batch(records: list) -> dict:
+    # Column by column: transposing with zip(*records) builds a tuple per packet first
+    n = len(records)
+    headers = [record[2] for record in records]
+    src_hi, src_lo = _split_addresses([h[0] for h in headers])
+    dst_hi, dst_lo = _split_addresses([h[1] for h in headers])
+    columns = dict(
+        ts=np.fromiter((record[0] for record in records), np.float64, n),
+        length=np.fromiter((record[1] for record in records), np.int64, n),
+        src_hi=src_hi, src_lo=src_lo, dst_hi=dst_hi, dst_lo=dst_lo,
+        flags=np.fromiter((h[5] or 0 for h in headers), np.int64, n),
+    )
+    for name, index in (("sport", 2), ("dport", 3), ("proto", 4), ("hdr_len", 6), ("window", 7)):
+        columns[name] = np.fromiter((h[index] for h in headers), np.int64, n)
+    return columns
+
+
+def _pcap_record_offsets(buf, endian: str) -> np.ndarray:
+    """Offsets of every complete record in a classic pcap buffer; only record lengths are read."""
+    incl_len = struct.Struct(endian + "I").unpack_from
+    size, offset = len(buf), PCAP_GLOBAL_HEADER_LEN
+    offsets = array("q")
+    while offset + PCAP_RECORD_HEADER_LEN <= size:
+        end = offset + PCAP_RECORD_HEADER_LEN + incl_len(buf, offset + 8)[0]
+        if end > size:
+            break  # truncated last record
+        offsets.append(offset)
+        offset = end
+    return np.frombuffer(offsets, dtype=np.int64)
+
+
+def _decode_pcap_buffer(data: np.ndarray, endian: str, scale: int, linktype: int) -> dict:
+    """
+    decode_records for a whole classic pcap file held in a uint8 array: each
+    header field is gathered for all packets at once. Frames whose headers
+    need a loop (IPv6 extension headers) go through decode_frame one by one.
+    """
+    offsets = _pcap_record_offsets(data, endian)
+
+    def u8(pos):
+        return data[pos].astype(np.int64)
+
+    def be(pos, size):
+        value = np.zeros(len(pos), dtype=np.uint64)
+        for i in range(size):
+            value = value << np.uint64(8) | data[pos + i]
+        return value.astype(np.int64) if size < 8 else value
+
+    def record_u32(pos):
+        if endian == ">":
+            return be(pos, 4)
+        return u8(pos) | u8(pos + 1) << 8 | u8(pos + 2) << 16 | u8(pos + 3) << 24
+
+    sec, frac, length = record_u32(offsets), record_u32(offsets + 4), record_u32(offsets + 8)
+    if scale == 1_000_000:
+        ts = (sec * scale + frac) / scale  # exact in float64, as in iter_raw_frames
+    else:
+        ts = np.fromiter(((s * scale + f) / scale for s, f in zip(sec.tolist(), frac.tolist())), np.float64, len(sec))
+    frame = offsets + PCAP_RECORD_HEADER_LEN
+    end = frame + length
+
+    # Network header: ethertype and offset, per link type (see _network_offset)
+    last = len(data) - 1
+    def at(pos, valid):
+        return np.where(valid, pos, 0).clip(0, last)
+    ethertype = np.zeros(len(offsets), dtype=np.int64)
+    if linktype == DLT_EN10MB:
+        valid = length >= 14
+        ethertype = np.where(valid, be(at(frame + 12, valid), 2), 0)
+        net = frame + 14
+        while True:
+            vlan = np.isin(ethertype, VLAN_ETHERTYPES) & (end >= net + 4)
+            if not vlan.any():
+                break
+            ethertype[vlan] = be(net[vlan] + 2, 2)
+            net[vlan] += 4
+    elif linktype in (DLT_RAW, DLT_IPV4, DLT_IPV6, DLT_NULL, DLT_LOOP):
+        header = 4 if linktype in (DLT_NULL, DLT_LOOP) else 0
+        valid = length >= header + 1
+        version = np.where(valid, u8(at(frame + header, valid)) >> 4, 0)
+        ethertype = np.select([valid & (version == 4), valid & (version == 6)], [ETH_P_IP, ETH_P_IPV6], 0)
+        net = frame + header
+    elif linktype == DLT_LINUX_SLL:
+        valid = length >= 16
+        ethertype = np.where(valid, be(at(frame + 14, valid), 2), 0)
+        net = frame + 16
+    else:  # DLT_LINUX_SLL2
+        valid = length >= 20
+        ethertype = np.where(valid, be(at(frame, valid), 2), 0)
+        net = frame + 20
+
+    ip4 = (ethertype == ETH_P_IP) & (end >= net + 20)
+    ip6 = (ethertype == ETH_P_IPV6) & (end >= net + 40)
+    n4, n6 = at(net, ip4), at(net, ip6)
+    proto = np.where(ip4, u8(at(n4 + 9, ip4)), np.where(ip6, u8(at(n6 + 6, ip6)), 0))
+    src_hi = np.where(ip6, be(at(n6 + 8, ip6), 8), np.uint64(0))
+    src_lo = np.where(ip6, be(at(n6 + 16, ip6), 8), be(at(n4 + 12, ip4), 4).astype(np.uint64) | np.uint64(IPV4_MAPPED))
+    dst_hi = np.where(ip6, be(at(n6 + 24, ip6), 8), np.uint64(0))
+    dst_lo = np.where(ip6, be(at(n6 + 32, ip6), 8), be(at(n4 + 16, ip4), 4).astype(np.uint64) | np.uint64(IPV4_MAPPED))
+    # Only the first fragment carries the transport header
+    first_fragment = ~ip4 | (be(at(n4 + 6, ip4), 2) & 0x1FFF == 0)
+    l4 = np.where(ip4, net + (u8(at(n4, ip4)) & 0x0F) * 4, net + 40)
+    tcp = (ip4 | ip6) & first_fragment & (proto == PROTO_TCP) & (end >= l4 + 16)
+    udp = (ip4 | ip6) & first_fragment & (proto == PROTO_UDP) & (end >= l4 + 4)
+    ports = tcp | udp
+    sport = np.where(ports, be(at(l4, ports), 2), 0)
+    dport = np.where(ports, be(at(l4 + 2, ports), 2), 0)
+    offset_byte = np.where(tcp, u8(at(l4 + 12, tcp)), 0)
+    flags = np.where(tcp, (offset_byte & 0x01) << 8 | u8(at(l4 + 13, tcp)), 0)
+    hdr_len = np.where(tcp, (offset_byte >> 4) * 4, 0)
+    window = np.where(tcp, be(at(l4 + 14, tcp), 2), 0)
+    columns = dict(ts=ts, length=length, src_hi=src_hi, src_lo=src_lo, dst_hi=dst_hi, dst_lo=dst_lo,
+                   sport=sport, dport=dport, proto=proto, flags=flags, hdr_len=hdr_len, window=window)
+
+    keep = ip4 | ip6
+    extended = np.flatnonzero(ip6 & np.isin(proto, IPV6_EXT_HEADERS + (IPV6_FRAGMENT, IPV6_AH)))
+    if len(extended):
+        decoded = [decode_frame(linktype, data[f:e].tobytes()) for f, e in zip(frame[extended].tolist(), end[extended].tolist())]
+        keep[extended[[headers is None for headers in decoded]]] = False
+        found = [(i, headers) for i, headers in zip(extended.tolist(), decoded) if headers is not None]
+        if found:
+            rows = [i for i, _ in found]
+            batch = _header_batch([(0.0, 0, headers) for _, headers in found])
+            for name in ("src_hi", "src_lo", "dst_hi", "dst_lo", "sport", "dport", "proto", "flags", "hdr_len", "window"):
+                columns[name][rows] = batch[name]
+    return {name: column[keep] for name, column in columns.items()}
+
+
+def _read_pcap_columns(pcap_path: str):
+    """Columns of a classic pcap file with a link type decoded here, else None."""
+    with open(pcap_path, "rb") as f:
+        header = f.read(PCAP_GLOBAL_HEADER_LEN)
+        if len(header) < PCAP_GLOBAL_HEADER_LEN or not is_pcap_stream(header):
+            return None
+        endian, scale, linktype = pcap_format(header)
+        if linktype not in VECTOR_LINKTYPES or struct.unpack_from(endian + "I", header, 20)[0] != linktype:
+            return None
+        if os.fstat(f.fileno()).st_size == PCAP_GLOBAL_HEADER_LEN:
+            return _header_batch([])
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            data = np.frombuffer(mm, dtype=np.uint8)
+            try:
+                return _decode_pcap_buffer(data, endian, scale, linktype)
+            finally:
+                del data  # release the buffer before the map closes
+
+
+def read_header_columns(pcap_path: str) -> HeaderColumns:
+    """
+    Decode a capture into HeaderColumns.
+
+    Classic pcap with a common link type is decoded with array operations
+    over the memory-mapped file; anything else (pcapng, other link types)
+    goes through decode_records in one pass, DECODE_BATCH_PACKETS packets at
+    a time.
+    """
+    columns = _read_pcap_columns(pcap_path)
+    if columns is not None:
+        return HeaderColumns(**columns)
+    records = iter(tqdm(iter_packet_records(pcap_path), desc="Processing packets", unit="pkt"))
+    batches = []
+    while True:
+        batch = list(islice(records, DECODE_BATCH_PACKETS))
+        if not batch:
+            break
+        batches.append(_header_batch(batch))
+    if not batches:
+        batches.append(_header_batch([]))
+    return HeaderColumns(**{name: np.concatenate([batch[name] for batch in batches]) for name in HeaderColumns.FIELDS})
+
+
+class PacketColumns:
+    """
+    Per-packet arrays for a whole capture, grouped by flow id (flows in
+    canonical key order, packets in capture order within a flow), plus
+    per-flow arrays indexed by flow id.
+    """
+
+    def __init__(self, flow_id, ts, length, forward, flags, hdr_len, window, flow_dport, flow_start, flow_initiator, flow_key):
+        self.flow_id = flow_id
+        # Packets older than their flow's latest packet are counted at that time, as in FlowTable
+        self.ts = ts
+        self.length = length
+        self.forward = forward
+        self.flags = flags
+        self.hdr_len = hdr_len
+        self.window = window
+        self.flow_dport = flow_dport
+        self.flow_start = flow_start
+        # (n_flows, 3) uint64 columns: address high bits, low bits, port
+        self.flow_initiator = flow_initiator
+        # (n_flows, 7) uint64 columns: low endpoint (3), high endpoint (3), proto
+        self.flow_key = flow_key
+
+    def __len__(self):
+        return len(self.flow_start)
+
+
+def _running_max(values: np.ndarray, segment_starts: np.ndarray):
+    """
+    Running maximum of values restarting at each segment start, as rank
+    positions into np.sort(values) (strictly increasing across segments) and
+    the maxima themselves.
+    """
+    n = len(values)
+    by_value = np.argsort(values, kind="stable")
+    rank = np.empty(n, dtype=np.int64)
+    rank[by_value] = np.arange(n)
+    offset = (np.cumsum(segment_starts) - 1) * n
+    ranked = np.maximum.accumulate(rank + offset)
+    return ranked, values[by_value][ranked - offset]
+
+
+def _first_past(start: np.ndarray, timeout: float) -> np.ndarray:
+    """Smallest float x with x - start > timeout, elementwise (FlowTable's test, with its rounding)."""
+    x = start + timeout
+    while True:
+        short = x - start <= timeout
+        if not short.any():
+            break
+        x[short] = np.nextafter(x[short], np.inf)
+    while True:
+        lower = np.nextafter(x, -np.inf)
+        over = lower - start > timeout
+        if not over.any():
+            return x
+        x[over] = lower[over]
+
+
+def assign_flows(headers: HeaderColumns, active_timeout: float = None, idle_timeout: float = None) -> PacketColumns:
+    """
+    Split packets into flows with the same rules as FlowTable, using array
+    operations only.
+
+    Packets are grouped by canonical bidirectional key (a stable lexsort over
+    the split endpoint columns, so capture order is kept within a key). A key's
+    packet sequence is cut after a FIN or RST, before a packet that comes more
+    than the idle timeout after the latest earlier one, and before the first
+    packet past the active timeout from the flow's first packet. Active
+    timeout cuts are chained one round per cut, each round a searchsorted
+    over the flows still being cut.
+    """
+    active_timeout = FLOW_ACTIVE_TIMEOUT if active_timeout is None else active_timeout
+    idle_timeout = FLOW_IDLE_TIMEOUT if idle_timeout is None else idle_timeout
+    h = headers
+    n = len(h)
+
+    # Canonical key: (low endpoint, high endpoint, proto), endpoints compared as (address, port)
+    src_first = (h.src_hi < h.dst_hi) | ((h.src_hi == h.dst_hi) & ((h.src_lo < h.dst_lo) | ((h.src_lo == h.dst_lo) & (h.sport <= h.dport))))
+    sport, dport = h.sport.astype(np.uint64), h.dport.astype(np.uint64)
+    key = np.column_stack([
+        np.where(src_first, h.src_hi, h.dst_hi), np.where(src_first, h.src_lo, h.dst_lo), np.where(src_first, sport, dport),
+        np.where(src_first, h.dst_hi, h.src_hi), np.where(src_first, h.dst_lo, h.src_lo), np.where(src_first, dport, sport),
+        h.proto.astype(np.uint64),
+    ])
+    order = np.lexsort(key.T[::-1])
+    key = key[order]
+    ts = h.ts[order]
+    flags = h.flags[order]
+
+    new_key = np.ones(n, dtype=bool)
+    new_key[1:] = (key[1:] != key[:-1]).any(axis=1)
+    # A FIN or RST ends the flow; the key's next packet opens a new one
+    closes = (flags & (TCP_FIN | TCP_RST)) != 0
+    segment_start = new_key.copy()
+    segment_start[1:] |= closes[:-1]
+    # Latest time so far within each segment (= the flow's last_seen)
+    ranked, latest = _running_max(ts, segment_start)
+    starts = segment_start.copy()
+    starts[1:] |= ts[1:] - latest[:-1] > idle_timeout
+
+    # Active timeout: the first packet later than start + timeout opens a flow
+    sorted_ts = np.sort(ts)
+    segment_offset = (np.cumsum(segment_start) - 1) * n
+    cur = np.flatnonzero(starts)
+    end = np.r_[cur[1:], n]
+    while len(cur):
+        limit = np.searchsorted(sorted_ts, _first_past(ts[cur], active_timeout))
+        cut = np.searchsorted(ranked, segment_offset[cur] + limit, side="left")
+        cutting = cut < end
+        cur, end = cut[cutting], end[cutting]
+        starts[cur] = True
+
+    first = np.flatnonzero(starts)
+    flow_id = np.cumsum(starts) - 1
+    src_hi, src_lo, src_port = h.src_hi[order], h.src_lo[order], sport[order]
+    initiator = np.column_stack([src_hi[first], src_lo[first], src_port[first]])
+    forward = (src_hi == initiator[flow_id, 0]) & (src_lo == initiator[flow_id, 1]) & (src_port == initiator[flow_id, 2])
+    return PacketColumns(
+        flow_id=flow_id, ts=latest, length=h.length[order], forward=forward, flags=flags,
+        hdr_len=h.hdr_len[order], window=h.window[order],
+        flow_dport=h.dport[order][first], flow_start=ts[first], flow_initiator=initiator, flow_key=key[first],
+    )
+
+
+def build_packet_columns(pcap_path: str, active_timeout: float = None, idle_timeout: float = None) -> PacketColumns:
+    """
+    Read a capture into PacketColumns.
+
+    Header fields are decoded into arrays in one pass; flow boundaries are
+    then assigned with array operations (assign_flows) following FlowTable's
+    rules, so both engines agree on which packets make up each flow.
+    """
+    return assign_flows(read_header_columns(pcap_path), active_timeout, idle_timeout)
+
+
+def _segment_starts(groups: np.ndarray) -> np.ndarray:
+    return np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]]) if len(groups) else groups
+
+
+def group_stats(values: np.ndarray, groups: np.ndarray, n_groups: int):
+    """
+    Per-group count, sum, mean, std, variance, min and max via segment reductions.
+
+    groups must be sorted (values of a group contiguous). Groups without values
+    get zeros, and std/variance are 0 for groups with fewer than two values,
+    matching RunningStats.
+    """
+    count = np.bincount(groups, minlength=n_groups)
+    total, mean, m2, lo, hi = (np.zeros(n_groups) for _ in range(5))
+    if len(values):
+        starts = _segment_starts(groups)
+        ids = groups[starts]
+        total[ids] = np.add.reduceat(values, starts)
+        mean[ids] = total[ids] / count[ids]
+        dev = values - mean[groups]
+        m2[ids] = np.add.reduceat(dev * dev, starts)
+        lo[ids] = np.minimum.reduceat(values, starts)
+        hi[ids] = np.maximum.reduceat(values, starts)
+    var = np.divide(m2, count, out=np.zeros(n_groups), where=count > 1)
+    return count, total, mean, np.sqrt(var), var, lo, hi
+
+
+def _within_group_diffs(values: np.ndarray, groups: np.ndarray):
+    """Consecutive differences inside each group (groups sorted) and their group ids."""
+    same = groups[1:] == groups[:-1]
+    return np.diff(values)[same], groups[1:][same]
+
+
+def compute_batch_features(columns: PacketColumns, activity_timeout: float = ACTIVITY_TIMEOUT, groups: frozenset = ALL_FEATURE_GROUPS) -> np.ndarray:
+    """
+    Compute the 78 features for every flow at once, in flow id order.
+
+    Packets come grouped by flow id (sorted by direction within a flow where
+    needed) and each statistic is a segment reduction over the sorted arrays;
+    there is no Python loop per flow or per packet. Definitions match
+    FlowState, including groups: features of skipped optional groups are 0.
+    """
+    n_flows = len(columns.flow_start)
+    fid = columns.flow_id
+    ts = columns.ts
+    length = columns.length.astype(np.float64)
+    forward = columns.forward
+    window = columns.window
+    if not len(fid):
+        return np.zeros((n_flows, len(ALL_78_FEATURES)))
+
+    def stats(values, ids):
+        return group_stats(values, ids, n_flows)
+
+    def per_flow_sum(weights):
+        return np.bincount(fid, weights=weights, minlength=n_flows)
+
+    # Lengths
+    _, _, len_mean, len_std, len_var, len_min, len_max = stats(length, fid)
+    fwd_order = np.lexsort((~forward, fid))  # forward packets first within each flow
+    fid_d, ts_d, len_d, fwd_d = fid[fwd_order], ts[fwd_order], length[fwd_order], forward[fwd_order]
+    fwd_n, fwd_total, fwd_mean, fwd_std, _, fwd_min, fwd_max = stats(len_d[fwd_d], fid_d[fwd_d])
+    bwd_n, bwd_total, bwd_mean, bwd_std, _, bwd_min, bwd_max = stats(len_d[~fwd_d], fid_d[~fwd_d])
+
+    zeros = np.zeros(n_flows)
+    if "iat" in groups or "active_idle" in groups:
+        flow_iat, flow_iat_fid = _within_group_diffs(ts, fid)
+
+    # Inter-arrival times
+    if "iat" in groups:
+        _, _, iat_mean, iat_std, _, iat_min, iat_max = stats(flow_iat, flow_iat_fid)
+        _, fwd_iat_total, fwd_iat_mean, fwd_iat_std, _, fwd_iat_min, fwd_iat_max = stats(*_within_group_diffs(ts_d[fwd_d], fid_d[fwd_d]))
+        _, bwd_iat_total, bwd_iat_mean, bwd_iat_std, _, bwd_iat_min, bwd_iat_max = stats(*_within_group_diffs(ts_d[~fwd_d], fid_d[~fwd_d]))
+    else:
+        iat_mean = iat_std = iat_min = iat_max = zeros
+        fwd_iat_total = fwd_iat_mean = fwd_iat_std = fwd_iat_min = fwd_iat_max = zeros
+        bwd_iat_total = bwd_iat_mean = bwd_iat_std = bwd_iat_min = bwd_iat_max = zeros
+
+    # Active/idle: gaps above the activity timeout are idle periods and split the
+    # flow into active periods; zero-length active periods are not counted
+    if "active_idle" in groups:
+        idle_gap = flow_iat > activity_timeout
+        _, _, idle_mean, idle_std, _, idle_min, idle_max = stats(flow_iat[idle_gap], flow_iat_fid[idle_gap])
+        period_start = np.r_[True, fid[1:] != fid[:-1]]
+        period_start[1:] |= ts[1:] - ts[:-1] > activity_timeout
+        first = np.flatnonzero(period_start)
+        last = np.r_[first[1:] - 1, len(ts) - 1] if len(first) else first
+        period = ts[last] - ts[first]
+        active = period > 0
+        _, _, active_mean, active_std, _, active_min, active_max = stats(period[active], fid[first][active])
+    else:
+        idle_mean = idle_std = idle_min = idle_max = zeros
+        active_mean = active_std = active_min = active_max = zeros
+
+    # Flags and header lengths
+    if "flags" in groups:
+        flags = columns.flags
+        bits = [((flags >> b) & 1).astype(np.float64) for b in range(8)]
+        fin, syn, rst, psh, ack, urg, ece, cwe = (per_flow_sum(bit) for bit in bits)
+        fwd_psh, fwd_urg = per_flow_sum(bits[3] * forward), per_flow_sum(bits[5] * forward)
+        bwd_psh, bwd_urg = psh - fwd_psh, urg - fwd_urg
+    else:
+        fin = syn = rst = psh = ack = urg = ece = cwe = zeros
+        fwd_psh = bwd_psh = fwd_urg = bwd_urg = zeros
+    if "header_len" in groups:
+        hdr_len = columns.hdr_len.astype(np.float64)
+        fwd_hdr_len = per_flow_sum(hdr_len * forward)
+        bwd_hdr_len = per_flow_sum(hdr_len * ~forward)
+    else:
+        fwd_hdr_len = bwd_hdr_len = zeros
+
+    # Initial windows: first packet of each direction
+    dir_first = _segment_starts(fid_d * 2 + ~fwd_d)
+    init_win_fwd, init_win_bwd = np.zeros(n_flows), np.zeros(n_flows)
+    dir_fwd = fwd_d[dir_first]
+    firsts = fwd_order[dir_first]
+    init_win_fwd[fid_d[dir_first][dir_fwd]] = window[firsts[dir_fwd]]
+    init_win_bwd[fid_d[dir_first][~dir_fwd]] = window[firsts[~dir_fwd]]
+
+    # Flow-level
+    starts = _segment_starts(fid)
+    ends = np.r_[starts[1:] - 1, len(fid) - 1] if len(starts) else starts
+    duration = ts[ends] - ts[starts]
+    total_pkts = fwd_n + bwd_n
+    total_len = fwd_total + bwd_total
+
+    def rate(num, den):
+        return np.divide(num, den, out=np.zeros(n_flows), where=den > 0)
+
+    dport = columns.flow_dport.astype(np.float64)
+
+    return np.column_stack([
+        dport, duration, fwd_n, bwd_n, fwd_total, bwd_total,
+        fwd_max, fwd_min, fwd_mean, fwd_std,
+        bwd_max, bwd_min, bwd_mean, bwd_std,
+        rate(total_len, duration), rate(total_pkts, duration),
+        iat_mean, iat_std, iat_max, iat_min,
+        fwd_iat_total, fwd_iat_mean, fwd_iat_std, fwd_iat_max, fwd_iat_min,
+        bwd_iat_total, bwd_iat_mean, bwd_iat_std, bwd_iat_max, bwd_iat_min,
+        fwd_psh, bwd_psh, fwd_urg, bwd_urg,
+        fwd_hdr_len, bwd_hdr_len, rate(fwd_n, duration), rate(bwd_n, duration),
+        len_min, len_max, len_mean, len_std, len_var,
+        fin, syn, rst, psh, ack, urg, cwe, ece,
+        rate(bwd_n, fwd_n),  # Down/Up Ratio
+        rate(total_len, total_pkts),  # Average Packet Size
+        fwd_mean, bwd_mean, fwd_hdr_len,
+        zeros, zeros, zeros, zeros, zeros, zeros,  # Bulk features are not computed
+        fwd_n, fwd_total, bwd_n, bwd_total,  # Subflow
+        init_win_fwd, init_win_bwd, fwd_n, fwd_min,
+        active_mean, active_std, active_max, active_min,
+        idle_mean, idle_std, idle_max, idle_min,
+    ]).astype(np.float64)
+
+
+def _endpoint(columns: np.ndarray) -> list:
+    """Integer endpoints (address << 16 | port) from (high, low, port) columns."""
+    return [(hi << 64 | lo) << 16 | port for hi, lo, port in columns.tolist()]
+
+
+def extract_flow_matrix_batch(pcap_path: str, active_timeout: float = None, idle_timeout: float = None, groups: frozenset = ALL_FEATURE_GROUPS):
+    """
+    Batch engine: (n_flows, 78) feature matrix ordered by (flow start, flow key),
+    plus one (key, initiator, start) tuple per row for the flow metadata.
+    """
+    columns = build_packet_columns(pcap_path, active_timeout, idle_timeout)
+    features = compute_batch_features(columns, groups=groups)
+    key = columns.flow_key
+    # Flows sharing a start and key keep their flow id (capture) order
+    order = np.lexsort((np.arange(len(columns)), *key.T[::-1], columns.flow_start))
+    key = key[order]
+    # Metadata keeps Python integer endpoints, as the streaming engine emits them
+    flows = zip(zip(_endpoint(key[:, 0:3]), _endpoint(key[:, 3:6]), key[:, 6].tolist()),
+                _endpoint(columns.flow_initiator[order]), columns.flow_start[order].tolist())
+    return features[order], list(flows)
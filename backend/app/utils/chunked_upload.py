@@ -0,0 +1,347 @@
+import hashlib
+import json
+import math
+import os
+import re
+import shutil
+import time
+from app.utils.upload_store import MAX_UPLOAD_BYTES, UPLOAD_CHUNK_SIZE, UploadTooLarge
+
+# In-progress chunked uploads; inside UPLOAD_FOLDER by default so that finishing
+# one is a rename on the same filesystem
+CHUNK_DIR = os.getenv("CHUNK_DIR", os.path.join(os.getenv("UPLOAD_FOLDER", "uploads"), ".incoming"))
+# Start analysing a chunked upload as soon as its first chunks arrive
+PIPELINED_UPLOADS = os.getenv("PIPELINED_UPLOADS", "false").lower() == "true"
+# A pipelined job gives up when its upload makes no progress for this long
+PIPELINE_STALL_SECONDS = float(os.getenv("PIPELINE_STALL_SECONDS", "300"))
+# Uploads never merged are removed once they have been idle this long
+CHUNK_UPLOAD_EXPIRY_SECONDS = float(os.getenv("CHUNK_UPLOAD_EXPIRY_SECONDS", str(24 * 3600)))
+
+# Client-chosen upload ids (the frontend uses crypto.randomUUID()) name directories
+UPLOAD_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+PART_NAME = "upload.part"
+MANIFEST_NAME = "manifest.json"
+
+
+class ChunkUploadError(ValueError):
+    """A chunk upload request that cannot be honoured; status_code is the HTTP status to answer with."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class ChunkedUpload:
+    """
+    A file uploaded as fixed-size chunks, possibly in parallel and out of order.
+
+    Every chunk is written straight into one preallocated file at
+    chunkIndex * chunkSize, and a marker file records it once its bytes are on
+    disk, so an interrupted upload can ask which chunks are still missing.
+    Finishing renames the file into place: nothing is copied again.
+
+    On disk, under <root>/<upload id>/: manifest.json (upload parameters and
+    owner), upload.part (the file being assembled) and chunk_NNNNN.done markers.
+    """
+
+    def __init__(self, upload_id: str, root: str = None):
+        if not UPLOAD_ID_PATTERN.match(upload_id or ""):
+            raise ChunkUploadError("Invalid uploadId")
+        self.upload_id = upload_id
+        self.dir = os.path.join(root or CHUNK_DIR, upload_id)
+        self.part_path = os.path.join(self.dir, PART_NAME)
+        self.manifest_path = os.path.join(self.dir, MANIFEST_NAME)
+
+    def manifest(self) -> dict:
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise ChunkUploadError("Upload not found", 404)
+
+    def start(self, user_id: int, filename: str, total_chunks: int, chunk_size: int, file_size: int = None) -> dict:
+        """
+        Create the upload on its first chunk, or check a later chunk's
+        parameters against it. Returns the manifest.
+        """
+        if total_chunks < 1 or chunk_size < 1:
+            raise ChunkUploadError("totalChunks and chunkSize must be positive")
+        if file_size is not None and total_chunks != max(1, math.ceil(file_size / chunk_size)):
+            raise ChunkUploadError("totalChunks does not match fileSize and chunkSize")
+        # Without fileSize the last chunk may be anything up to chunkSize
+        if (file_size if file_size is not None else total_chunks * chunk_size) > MAX_UPLOAD_BYTES:
+            raise UploadTooLarge(MAX_UPLOAD_BYTES)
+
+        if not os.path.exists(self.manifest_path):
+            os.makedirs(self.dir, exist_ok=True)
+            # The file exists before the manifest does, so any request that
+            # sees the manifest can write into it
+            fd = os.open(self.part_path, os.O_WRONLY | os.O_CREAT, 0o644)
+            try:
+                if file_size:
+                    try:
+                        os.posix_fallocate(fd, 0, file_size)
+                    except (AttributeError, OSError):
+                        os.ftruncate(fd, file_size)
+            finally:
+                os.close(fd)
+            manifest = {
+                "user_id": user_id,
+                "filename": filename,
+                "total_chunks": total_chunks,
+                "chunk_size": chunk_size,
+                "file_size": file_size,
+            }
+            # Parallel first chunks race here: link() publishes one complete manifest
+            tmp_path = f"{self.manifest_path}.{os.getpid()}.{id(manifest)}"
+            with open(tmp_path, "w") as f:
+                json.dump(manifest, f)
+            try:
+                os.link(tmp_path, self.manifest_path)
+            except FileExistsError:
+                pass
+            finally:
+                os.remove(tmp_path)
+
+        manifest = self.manifest()
+        if manifest["user_id"] != user_id:
+            raise ChunkUploadError("Upload not found", 404)
+        if (manifest["total_chunks"], manifest["chunk_size"]) != (total_chunks, chunk_size):
+            raise ChunkUploadError("Chunk parameters differ from the rest of the upload", 409)
+        return manifest
+
+    def _marker(self, index: int) -> str:
+        return os.path.join(self.dir, f"chunk_{index:05d}.done")
+
+    def write_chunk(self, manifest: dict, index: int, src) -> int:
+        """Write one chunk from a binary file object at its offset; returns its length."""
+        total_chunks, chunk_size, file_size = manifest["total_chunks"], manifest["chunk_size"], manifest["file_size"]
+        if not 0 <= index < total_chunks:
+            raise ChunkUploadError(f"chunkIndex must be between 0 and {total_chunks - 1}")
+        offset = index * chunk_size
+        buffer = bytearray(min(UPLOAD_CHUNK_SIZE, chunk_size))
+        view = memoryview(buffer)
+        written = 0
+        fd = os.open(self.part_path, os.O_WRONLY)
+        try:
+            while True:
+                n = src.readinto(buffer)
+                if not n:
+                    break
+                # Checked as bytes arrive, so an oversized chunk is never written out
+                if offset + written + n > MAX_UPLOAD_BYTES:
+                    raise UploadTooLarge(MAX_UPLOAD_BYTES)
+                if written + n > chunk_size:
+                    raise ChunkUploadError("Chunk is larger than chunkSize")
+                if file_size is not None and offset + written + n > file_size:
+                    raise ChunkUploadError("Chunk extends past fileSize")
+                done = 0
+                while done < n:
+                    done += os.pwrite(fd, view[done:n], offset + written + done)
+                written += n
+            if index < total_chunks - 1 and written != chunk_size:
+                raise ChunkUploadError(f"Chunk {index} has {written} bytes, expected {chunk_size}")
+            if index == total_chunks - 1 and file_size is not None and written != file_size - offset:
+                raise ChunkUploadError(f"Last chunk has {written} bytes, expected {file_size - offset}")
+            os.fdatasync(fd)
+        finally:
+            os.close(fd)
+        # Published atomically: readers of the marker always see the full length
+        marker_tmp = f"{self._marker(index)}.{os.getpid()}.tmp"
+        with open(marker_tmp, "w") as f:
+            f.write(str(written))
+        os.replace(marker_tmp, self._marker(index))
+        return written
+
+    def chunk_length(self, index: int) -> int:
+        with open(self._marker(index)) as f:
+            return int(f.read())
+
+    def received(self) -> list:
+        """Indexes of the chunks that are fully written."""
+        return sorted(
+            int(name[len("chunk_"):-len(".done")])
+            for name in os.listdir(self.dir)
+            if name.startswith("chunk_") and name.endswith(".done")
+        )
+
+    def status(self) -> dict:
+        manifest = self.manifest()
+        received = self.received()
+        have = set(received)
+        missing = [i for i in range(manifest["total_chunks"]) if i not in have]
+        return {
+            "uploadId": self.upload_id,
+            "filename": manifest["filename"],
+            "totalChunks": manifest["total_chunks"],
+            "chunkSize": manifest["chunk_size"],
+            "fileSize": manifest["file_size"],
+            "received": received,
+            "missing": missing,
+            "complete": not missing,
+        }
+
+    def finish(self, dest_path: str) -> int:
+        """Move the assembled file to dest_path (no copy on the same filesystem); returns its size."""
+        manifest = self.manifest()
+        status = self.status()
+        if status["missing"]:
+            raise ChunkUploadError(f"Missing chunks: {status['missing'][:20]}", 409)
+        size = manifest["file_size"]
+        if size is None:
+            last = manifest["total_chunks"] - 1
+            size = last * manifest["chunk_size"] + self.chunk_length(last)
+        os.truncate(self.part_path, size)
+        try:
+            os.replace(self.part_path, dest_path)
+        except OSError:
+            shutil.move(self.part_path, dest_path)  # different filesystem
+        self.discard()
+        return size
+
+    def discard(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+def _idle_seconds(path: str, now: float) -> float:
+    # Last activity: the newest of the upload directory and its files
+    latest = os.stat(path).st_mtime
+    for entry in os.scandir(path):
+        try:
+            latest = max(latest, entry.stat().st_mtime)
+        except FileNotFoundError:
+            pass
+    return now - latest
+
+
+def idle_uploads(min_idle: float, root: str = None) -> dict:
+    """Uploads in CHUNK_DIR with no activity for at least min_idle seconds: {upload id: idle seconds}."""
+    root = root or CHUNK_DIR
+    now = time.time()
+    idle = {}
+    try:
+        entries = list(os.scandir(root))
+    except FileNotFoundError:
+        return idle
+    for entry in entries:
+        if not entry.is_dir() or not UPLOAD_ID_PATTERN.match(entry.name):
+            continue
+        try:
+            seconds = _idle_seconds(entry.path, now)
+        except FileNotFoundError:
+            continue  # finished or removed meanwhile
+        if seconds >= min_idle:
+            idle[entry.name] = seconds
+    return idle
+
+
+def sweep_expired_uploads(finished=(), root: str = None) -> int:
+    """
+    Remove uploads that were never merged: those idle for
+    CHUNK_UPLOAD_EXPIRY_SECONDS, and pipelined uploads whose job has already
+    finished (upload ids in finished) once idle for PIPELINE_STALL_SECONDS.
+    Returns how many were removed.
+    """
+    finished = set(finished)
+    removed = 0
+    for upload_id, seconds in idle_uploads(min(PIPELINE_STALL_SECONDS, CHUNK_UPLOAD_EXPIRY_SECONDS), root).items():
+        if seconds >= CHUNK_UPLOAD_EXPIRY_SECONDS or upload_id in finished:
+            ChunkedUpload(upload_id, root).discard()
+            removed += 1
+    return removed
+
+
+def open_upload_stream(upload_id: str):
+    """UploadPrefixReader over an upload still in CHUNK_DIR, or None if it has been finished."""
+    try:
+        return UploadPrefixReader(ChunkedUpload(upload_id))
+    except (ChunkUploadError, FileNotFoundError):
+        return None
+
+
+class UploadPrefixReader:
+    """
+    Binary stream over a chunked upload that is still arriving.
+
+    Reads return bytes from the contiguous run of chunks received so far and
+    block while the next chunk is missing, so a sequential parser can work
+    through the file as it is uploaded. The stream ends once every chunk has
+    been read (or the upload was finished, which keeps this open file valid).
+    Everything read is hashed. Raises TimeoutError if the upload makes no
+    progress for stall_timeout seconds.
+    """
+
+    def __init__(self, upload: ChunkedUpload, stall_timeout: float = None, poll_interval: float = 0.5):
+        self.upload = upload
+        manifest = upload.manifest()
+        self.chunk_size = manifest["chunk_size"]
+        self.total_chunks = manifest["total_chunks"]
+        self.file_size = manifest["file_size"]  # None if the client did not say
+        self.stall_timeout = PIPELINE_STALL_SECONDS if stall_timeout is None else stall_timeout
+        self.poll_interval = poll_interval
+        self.file = open(upload.part_path, "rb")
+        self.position = 0
+        self.available = 0
+        self.complete = False
+        self.hasher = hashlib.sha256()
+
+    def _refresh(self):
+        try:
+            received = set(self.upload.received())
+            contiguous = 0
+            while contiguous in received:
+                contiguous += 1
+            if contiguous == self.total_chunks:
+                self.available = (contiguous - 1) * self.chunk_size + self.upload.chunk_length(contiguous - 1)
+                self.complete = True
+            else:
+                self.available = contiguous * self.chunk_size
+        except FileNotFoundError:
+            # finish() truncated the file to its final size and moved it
+            self.available = os.fstat(self.file.fileno()).st_size
+            self.complete = True
+
+    def readinto(self, buffer) -> int:
+        last_progress = time.monotonic()
+        while self.position >= self.available:
+            if self.complete:
+                return 0
+            self._refresh()
+            if self.position < self.available:
+                break
+            if self.complete:
+                return 0
+            if time.monotonic() - last_progress > self.stall_timeout:
+                raise TimeoutError(f"Upload {self.upload.upload_id} stalled waiting for chunk {self.position // self.chunk_size}")
+            time.sleep(self.poll_interval)
+        view = memoryview(buffer)[:self.available - self.position]
+        n = self.file.readinto(view)
+        self.hasher.update(view[:n])
+        self.position += n
+        return n
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            return self.drain()
+        buffer = bytearray(size)
+        n = self.readinto(buffer)
+        return bytes(buffer[:n])
+
+    def drain(self) -> bytes:
+        """Read (and hash) the rest of the upload; returns nothing, to bound memory."""
+        buffer = bytearray(UPLOAD_CHUNK_SIZE)
+        while self.readinto(buffer):
+            pass
+        return b""
+
+    def sha256(self) -> str:
+        return self.hasher.hexdigest()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,125 @@
+import json
+import os
+import threading
+import numpy as np
+from scipy.special import expit, softmax
+from app.utils.features import ALL_78_FEATURES
+from app.utils.model_registry import model_features
+
+# Score through compiled predictors (scaler folded into the model) when possible
+FAST_INFERENCE = os.getenv("FAST_INFERENCE", "true").lower() == "true"
+# Threads used by XGBoost's native predictor
+FAST_INFERENCE_THREADS = int(os.getenv("FAST_INFERENCE_THREADS", "0")) or os.cpu_count() or 1
+
+
+def _scaler_params(scaler, feature_names: list):
+    """Per-feature (mean, scale) of a StandardScaler, in feature_names order."""
+    scaler_features = list(getattr(scaler, "feature_names_in_", ALL_78_FEATURES))
+    columns = [scaler_features.index(name) for name in feature_names]
+    mean = getattr(scaler, "mean_", None)
+    scale = getattr(scaler, "scale_", None)
+    mean = np.zeros(len(columns)) if mean is None else np.asarray(mean, dtype=np.float64)[columns]
+    scale = np.ones(len(columns)) if scale is None else np.asarray(scale, dtype=np.float64)[columns]
+    return mean, scale
+
+
+class XGBoostFastPredictor:
+    """
+    XGBoost tree ensemble with the scaler folded into its split thresholds.
+
+    A split on a standardized feature, (x - mean) / scale < t, is the same
+    test as x < t * scale + mean (scale > 0), so the thresholds are rewritten
+    once and raw features go straight to the native predictor: no scaled copy
+    of the matrix, float32 input, multithreaded inplace_predict.
+    """
+
+    def __init__(self, model, scaler, threads: int = None):
+        import xgboost as xgb
+
+        self.feature_names = model_features(model)
+        self.classes_ = np.asarray(getattr(model, "classes_", [0, 1]))
+        mean, scale = _scaler_params(scaler, self.feature_names)
+
+        config = json.loads(model.get_booster().save_raw("json"))
+        for tree in config["learner"]["gradient_booster"]["model"]["trees"]:
+            thresholds = tree["split_conditions"]
+            for node, (left, feature) in enumerate(zip(tree["left_children"], tree["split_indices"])):
+                if left != -1:  # leaves keep their leaf value in split_conditions
+                    thresholds[node] = float(thresholds[node] * scale[feature] + mean[feature])
+        self.booster = xgb.Booster(model_file=bytearray(json.dumps(config).encode()))
+        self.booster.set_param({"nthread": threads or FAST_INFERENCE_THREADS})
+        # Same trees as model.predict_proba: stop at the early-stopping best iteration
+        try:
+            self.iteration_range = (0, model.best_iteration + 1)
+        except AttributeError:
+            self.iteration_range = (0, 0)
+
+    def predict_proba(self, features: np.ndarray) -> np.ndarray:
+        X = np.ascontiguousarray(features, dtype=np.float32)
+        probabilities = self.booster.inplace_predict(X, predict_type="value", iteration_range=self.iteration_range)
+        if probabilities.ndim == 1:  # binary:logistic returns P(class 1)
+            probabilities = np.column_stack([1.0 - probabilities, probabilities])
+        return probabilities
+
+
+class LinearFastPredictor:
+    """
+    Logistic regression with the scaler folded into its weights.
+
+    w . ((x - mean) / scale) + b == (w / scale) . x + (b - w . (mean / scale)),
+    so scoring is one matrix product on the raw features.
+    """
+
+    def __init__(self, model, scaler):
+        self.feature_names = model_features(model)
+        self.classes_ = np.asarray(model.classes_)
+        mean, scale = _scaler_params(scaler, self.feature_names)
+        coef = np.asarray(model.coef_, dtype=np.float64)
+        self.coef = (coef / scale).T
+        self.intercept = np.asarray(model.intercept_, dtype=np.float64) - coef @ (mean / scale)
+        self.ovr = getattr(model, "multi_class", "auto") == "ovr"
+
+    def predict_proba(self, features: np.ndarray) -> np.ndarray:
+        scores = np.asarray(features, dtype=np.float64) @ self.coef + self.intercept
+        if scores.shape[1] == 1:
+            positive = expit(scores[:, 0])
+            return np.column_stack([1.0 - positive, positive])
+        if self.ovr:
+            probabilities = expit(scores)
+            return probabilities / probabilities.sum(axis=1, keepdims=True)
+        return softmax(scores, axis=1)
+
+
+def compile_predictor(model, scaler):
+    """Compiled predictor for a model/scaler pair, or None if the pair is not supported."""
+    if type(scaler).__name__ != "StandardScaler":
+        return None
+    if type(model).__name__ in ("XGBClassifier", "XGBRFClassifier"):
+        booster_type = getattr(model, "booster", None) or "gbtree"
+        return XGBoostFastPredictor(model, scaler) if booster_type in ("gbtree", "dart") else None
+    if type(model).__name__ == "LogisticRegression":
+        return LinearFastPredictor(model, scaler)
+    return None
+
+
+_compiled = {}
+_compiled_lock = threading.Lock()
+
+
+def get_fast_predictor(model, scaler):
+    """
+    compile_predictor, cached per (model, scaler) object pair.
+
+    Registry reloads hand out new objects, which therefore get recompiled.
+    """
+    key = (id(model), id(scaler))
+    with _compiled_lock:
+        entry = _compiled.get(key)
+        if entry is not None and entry[0] is model and entry[1] is scaler:
+            return entry[2]
+        predictor = compile_predictor(model, scaler)
+        if len(_compiled) >= 8:
+            _compiled.pop(next(iter(_compiled)))
+        # Holding model and scaler keeps their ids from being reused while cached
+        _compiled[key] = (model, scaler, predictor)
+        return predictor
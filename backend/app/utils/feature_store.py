@@ -0,0 +1,175 @@
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from app.utils.features import ALL_78_FEATURES, FLOW_METADATA_COLUMNS
+
+FEATURE_FOLDER = os.getenv("FEATURE_FOLDER", "feature_store")
+# Parquet codec for stored flow features (zstd, snappy, gzip, none, ...)
+FEATURE_COMPRESSION = os.getenv("FEATURE_COMPRESSION", "zstd")
+# Flows per Parquet row group: the unit readers can skip or load on their own
+FEATURE_ROW_GROUP_SIZE = 256 * 1024
+# Metadata columns are stored under this prefix: "Destination Port" is both a
+# metadata column and a feature
+METADATA_PREFIX = "meta/"
+# Rows per batch when paging through verdicts
+VERDICT_SCAN_BATCH_ROWS = 16 * 1024
+
+
+def features_table(features: np.ndarray, flow_meta: pd.DataFrame, feature_names: list = None) -> pa.Table:
+    """
+    One Arrow table per capture: flow metadata columns followed by the feature
+    columns (ALL_78_FEATURES unless the matrix holds just feature_names).
+    """
+    table = pa.Table.from_pandas(flow_meta.add_prefix(METADATA_PREFIX), preserve_index=False)
+    for i, name in enumerate(ALL_78_FEATURES if feature_names is None else feature_names):
+        table = table.append_column(name, pa.array(features[:, i], type=pa.float64()))
+    return table
+
+
+def flow_store_path(pcap_path: str, output_dir: str = None) -> str:
+    """Where write_flow_features stores a capture's flows."""
+    base_name = os.path.splitext(os.path.basename(pcap_path))[0]
+    return os.path.join(output_dir or FEATURE_FOLDER, f"{base_name}_flows.parquet")
+
+
+def write_flow_features(features: np.ndarray, flow_meta: pd.DataFrame, pcap_path: str, output_dir: str = None, feature_names: list = None) -> str:
+    """
+    Store a capture's flow features as <output_dir>/<pcap name>_flows.parquet.
+
+    The file is written under a temporary name and renamed into place, so a
+    path that exists always points to a complete file.
+    """
+    store_path = flow_store_path(pcap_path, output_dir)
+    os.makedirs(os.path.dirname(store_path) or ".", exist_ok=True)
+    tmp_path = f"{store_path}.tmp"
+    pq.write_table(
+        features_table(features, flow_meta, feature_names),
+        tmp_path,
+        compression=FEATURE_COMPRESSION,
+        row_group_size=FEATURE_ROW_GROUP_SIZE,
+    )
+    os.replace(tmp_path, store_path)
+    print(f"✅ Saved flow features ({len(features)} flows): {store_path}")
+    return store_path
+
+
+def read_flow_features(store_path: str, columns: list = None) -> pd.DataFrame:
+    """
+    Load stored flows as a DataFrame; only the requested columns are read from
+    disk. Column names are as stored (metadata carries METADATA_PREFIX).
+    """
+    return pq.read_table(store_path, columns=columns, memory_map=True).to_pandas()
+
+
+def read_flow_metadata(store_path: str) -> pd.DataFrame:
+    """Load just the flow metadata, with the FLOW_METADATA_COLUMNS names."""
+    columns = [METADATA_PREFIX + name for name in FLOW_METADATA_COLUMNS]
+    return read_flow_features(store_path, columns).set_axis(FLOW_METADATA_COLUMNS, axis=1)
+
+
+def _batch_matrix(batch, columns: list) -> np.ndarray:
+    matrix = np.empty((batch.num_rows, len(columns)), dtype=np.float64)
+    for i, name in enumerate(columns):
+        matrix[:, i] = batch.column(name).to_numpy()
+    return matrix
+
+
+def read_feature_matrix(store_path: str, columns: list = None) -> np.ndarray:
+    """
+    Load stored features as a float64 (n_flows, len(columns)) matrix.
+
+    columns defaults to ALL_78_FEATURES; pass a model's own feature list to read
+    just the columns it needs.
+    """
+    columns = list(columns or ALL_78_FEATURES)
+    return _batch_matrix(pq.read_table(store_path, columns=columns, memory_map=True), columns)
+
+
+def iter_feature_batches(store_path: str, columns: list = None, batch_size: int = 65536):
+    """Like read_feature_matrix, but yields matrices of at most batch_size flows."""
+    columns = list(columns or ALL_78_FEATURES)
+    parquet_file = pq.ParquetFile(store_path, memory_map=True)
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+        yield _batch_matrix(batch, columns)
+
+
+def flow_verdicts_path(pcap_path: str, output_dir: str = None) -> str:
+    """Where write_flow_verdicts stores a capture's per-flow predictions."""
+    base_name = os.path.splitext(os.path.basename(pcap_path))[0]
+    return os.path.join(output_dir or FEATURE_FOLDER, f"{base_name}_verdicts.parquet")
+
+
+def write_flow_verdicts(flow_meta: pd.DataFrame, labels: np.ndarray, confidences: np.ndarray, class_names: list, pcap_path: str, output_dir: str = None) -> str:
+    """
+    Store one verdict per flow as <output_dir>/<pcap name>_verdicts.parquet:
+    the flow metadata (FLOW_METADATA_COLUMNS) followed by Label, Class,
+    Confidence and Flagged (any label but 0 = BENIGN).
+
+    Rows are in flow order, like the flow store. Written under a temporary
+    name and renamed into place.
+    """
+    verdicts = flow_meta.reset_index(drop=True).copy()
+    verdicts["Label"] = np.asarray(labels, dtype=np.int64)
+    verdicts["Class"] = class_names
+    verdicts["Confidence"] = np.asarray(confidences, dtype=np.float64)
+    verdicts["Flagged"] = verdicts["Label"] != 0
+    store_path = flow_verdicts_path(pcap_path, output_dir)
+    os.makedirs(os.path.dirname(store_path) or ".", exist_ok=True)
+    tmp_path = f"{store_path}.tmp"
+    pq.write_table(
+        pa.Table.from_pandas(verdicts, preserve_index=False),
+        tmp_path,
+        compression=FEATURE_COMPRESSION,
+        row_group_size=FEATURE_ROW_GROUP_SIZE,
+    )
+    os.replace(tmp_path, store_path)
+    print(f"✅ Saved flow verdicts ({len(verdicts)} flows, {int(verdicts['Flagged'].sum())} flagged): {store_path}")
+    return store_path
+
+
+def read_flow_verdicts(store_path: str, flagged_only: bool = True, label: str = None, ip: str = None, port: int = None,
+                       offset: int = 0, limit: int = 100):
+    """
+    Page through stored verdicts, filtered on the Parquet scan.
+
+    label matches the class name (case-insensitive); ip matches either
+    endpoint and port either port. Returns (total matching flows, DataFrame
+    of at most limit of them, starting at offset). Only the rows up to
+    offset + limit are materialized; the total is counted on the filter
+    columns alone.
+    """
+    conditions = []
+    if flagged_only:
+        conditions.append(ds.field("Flagged"))
+    if label:
+        conditions.append(pc.utf8_lower(ds.field("Class")) == label.lower())
+    if ip:
+        conditions.append((ds.field("Source IP") == ip) | (ds.field("Destination IP") == ip))
+    if port is not None:
+        conditions.append((ds.field("Source Port") == port) | (ds.field("Destination Port") == port))
+    condition = None
+    for c in conditions:
+        condition = c if condition is None else condition & c
+
+    dataset = ds.dataset(store_path, format="parquet")
+    total = dataset.count_rows(filter=condition)
+    # Page within the scan: batches before offset are dropped as they come,
+    # and reading stops once the page is full
+    batches, skip, needed = [], offset, min(limit, max(total - offset, 0))
+    if needed:
+        scanner = dataset.scanner(filter=condition, batch_size=max(VERDICT_SCAN_BATCH_ROWS, limit))
+        for batch in scanner.to_batches():
+            if skip >= batch.num_rows:
+                skip -= batch.num_rows
+                continue
+            batch = batch.slice(skip, needed)
+            skip = 0
+            batches.append(batch)
+            needed -= batch.num_rows
+            if not needed:
+                break
+    return total, pa.Table.from_batches(batches, schema=dataset.schema).to_pandas()
@@ -0,0 +1,68 @@
+# ALL 78 CICIDS features in EXACT order expected by the model
+ALL_78_FEATURES = [
+    "Destination Port", "Flow Duration", "Total Fwd Packets", "Total Backward Packets",
+    "Total Length of Fwd Packets", "Total Length of Bwd Packets", "Fwd Packet Length Max",
+    "Fwd Packet Length Min", "Fwd Packet Length Mean", "Fwd Packet Length Std",
+    "Bwd Packet Length Max", "Bwd Packet Length Min", "Bwd Packet Length Mean",
+    "Bwd Packet Length Std", "Flow Bytes/s", "Flow Packets/s", "Flow IAT Mean",
+    "Flow IAT Std", "Flow IAT Max", "Flow IAT Min", "Fwd IAT Total", "Fwd IAT Mean",
+    "Fwd IAT Std", "Fwd IAT Max", "Fwd IAT Min", "Bwd IAT Total", "Bwd IAT Mean",
+    "Bwd IAT Std", "Bwd IAT Max", "Bwd IAT Min", "Fwd PSH Flags", "Bwd PSH Flags",
+    "Fwd URG Flags", "Bwd URG Flags", "Fwd Header Length", "Bwd Header Length",
+    "Fwd Packets/s", "Bwd Packets/s", "Min Packet Length", "Max Packet Length",
+    "Packet Length Mean", "Packet Length Std", "Packet Length Variance",
+    "FIN Flag Count", "SYN Flag Count", "RST Flag Count", "PSH Flag Count",
+    "ACK Flag Count", "URG Flag Count", "CWE Flag Count", "ECE Flag Count",
+    "Down/Up Ratio", "Average Packet Size", "Avg Fwd Segment Size",
+    "Avg Bwd Segment Size", "Fwd Header Length.1", "Fwd Avg Bytes/Bulk",
+    "Fwd Avg Packets/Bulk", "Fwd Avg Bulk Rate", "Bwd Avg Bytes/Bulk",
+    "Bwd Avg Packets/Bulk", "Bwd Avg Bulk Rate", "Subflow Fwd Packets",
+    "Subflow Fwd Bytes", "Subflow Bwd Packets", "Subflow Bwd Bytes",
+    "Init_Win_bytes_forward", "Init_Win_bytes_backward", "act_data_pkt_fwd",
+    "min_seg_size_forward", "Active Mean", "Active Std", "Active Max",
+    "Active Min", "Idle Mean", "Idle Std", "Idle Max", "Idle Min"
+]
+
+# Per-flow identification kept alongside the features (CICFlowMeter column
+# names; Duration in seconds)
+FLOW_METADATA_COLUMNS = [
+    "Source IP", "Source Port", "Destination IP", "Destination Port", "Protocol", "Timestamp", "Duration"
+]
+
+# Optional extraction passes and the features that need them. Everything else
+# comes from packet counts, lengths and initial windows, which are always computed.
+FEATURE_GROUPS = {
+    "iat": [
+        "Flow IAT Mean", "Flow IAT Std", "Flow IAT Max", "Flow IAT Min",
+        "Fwd IAT Total", "Fwd IAT Mean", "Fwd IAT Std", "Fwd IAT Max", "Fwd IAT Min",
+        "Bwd IAT Total", "Bwd IAT Mean", "Bwd IAT Std", "Bwd IAT Max", "Bwd IAT Min",
+    ],
+    "active_idle": [
+        "Active Mean", "Active Std", "Active Max", "Active Min",
+        "Idle Mean", "Idle Std", "Idle Max", "Idle Min",
+    ],
+    "header_len": ["Fwd Header Length", "Bwd Header Length", "Fwd Header Length.1"],
+    "flags": [
+        "Fwd PSH Flags", "Bwd PSH Flags", "Fwd URG Flags", "Bwd URG Flags",
+        "FIN Flag Count", "SYN Flag Count", "RST Flag Count", "PSH Flag Count",
+        "ACK Flag Count", "URG Flag Count", "CWE Flag Count", "ECE Flag Count",
+    ],
+}
+ALL_FEATURE_GROUPS = frozenset(FEATURE_GROUPS)
+
+
+def feature_groups_for(feature_names) -> frozenset:
+    """Optional groups (FEATURE_GROUPS keys) needed to compute the given features."""
+    if feature_names is None:
+        return ALL_FEATURE_GROUPS
+    names = set(feature_names)
+    return frozenset(group for group, members in FEATURE_GROUPS.items() if names.intersection(members))
+
+
+def feature_indices(feature_names) -> list:
+    """Positions of the given features in ALL_78_FEATURES."""
+    index = {name: i for i, name in enumerate(ALL_78_FEATURES)}
+    try:
+        return [index[name] for name in feature_names]
+    except KeyError as e:
+        raise ValueError(f"Unknown feature: {e.args[0]}") from None
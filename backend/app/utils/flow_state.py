@@ -0,0 +1,189 @@
+import math
+from app.utils.features import ALL_FEATURE_GROUPS
+
+# Gap (seconds) after which a flow is considered idle, as in CICFlowMeter
+ACTIVITY_TIMEOUT = 5.0
+
+
+class RunningStats:
+    """Online count/sum/min/max plus Welford mean and (population) variance."""
+
+    __slots__ = ("n", "total", "mean", "m2", "min", "max")
+
+    def __init__(self):
+        self.n = 0
+        self.total = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = 0
+        self.max = 0
+
+    def add(self, x):
+        n = self.n + 1
+        self.n = n
+        self.total += x
+        delta = x - self.mean
+        self.mean += delta / n
+        self.m2 += delta * (x - self.mean)
+        if n == 1:
+            self.min = self.max = x
+        elif x < self.min:
+            self.min = x
+        elif x > self.max:
+            self.max = x
+
+    def std(self) -> float:
+        return math.sqrt(self.m2 / self.n) if self.n > 1 else 0.0
+
+    def var(self) -> float:
+        return self.m2 / self.n if self.n > 1 else 0.0
+
+
+class FlowState:
+    """
+    Per-flow accumulators updated as each packet arrives.
+
+    No packets are retained: lengths, inter-arrival times, active/idle periods,
+    TCP flags, header lengths and initial windows are folded into running
+    counters, so finalizing a flow with features() is O(1).
+
+    groups selects the optional passes (see features.FEATURE_GROUPS) to run;
+    features of a skipped group are left at 0.
+    """
+
+    __slots__ = (
+        "initiator", "dport", "activity_timeout", "with_iat", "with_active_idle", "with_header_len", "with_flags", "start", "last_seen", "fwd_last", "bwd_last",
+        "active_start", "active_end",
+        "lengths", "fwd_lens", "bwd_lens", "flow_iat", "fwd_iat", "bwd_iat", "active", "idle",
+        "fin", "syn", "rst", "psh", "ack", "urg", "ece", "cwe",
+        "fwd_psh", "bwd_psh", "fwd_urg", "bwd_urg", "fwd_hdr_len", "bwd_hdr_len",
+        "init_win_fwd", "init_win_bwd",
+    )
+
+    def __init__(self, initiator: int, dport: int, ts: float, activity_timeout: float = ACTIVITY_TIMEOUT, groups: frozenset = ALL_FEATURE_GROUPS):
+        # Endpoint (address << 16 | port) that sent the first packet; its packets are forward
+        self.initiator = initiator
+        self.dport = dport
+        self.activity_timeout = activity_timeout
+        self.with_iat = "iat" in groups
+        self.with_active_idle = "active_idle" in groups
+        self.with_header_len = "header_len" in groups
+        self.with_flags = "flags" in groups
+        self.start = self.last_seen = ts
+        self.fwd_last = self.bwd_last = None
+        self.active_start = self.active_end = ts
+
+        self.lengths = RunningStats()
+        self.fwd_lens = RunningStats()
+        self.bwd_lens = RunningStats()
+        self.flow_iat = RunningStats()
+        self.fwd_iat = RunningStats()
+        self.bwd_iat = RunningStats()
+        self.active = RunningStats()
+        self.idle = RunningStats()
+
+        self.fin = self.syn = self.rst = self.psh = self.ack = self.urg = self.ece = self.cwe = 0
+        self.fwd_psh = self.bwd_psh = self.fwd_urg = self.bwd_urg = 0
+        self.fwd_hdr_len = self.bwd_hdr_len = 0
+        self.init_win_fwd = self.init_win_bwd = 0
+
+    def add(self, ts: float, length: int, forward: bool, flags, hdr_len: int, window: int):
+        """
+        Fold one packet into the flow. flags is None for non-TCP packets.
+
+        ts must not be older than the flow's last packet (FlowTable clamps it).
+        """
+        if self.lengths.n:
+            if self.with_iat:
+                self.flow_iat.add(ts - self.last_seen)
+            # Active/idle periods
+            if self.with_active_idle:
+                if ts - self.active_end > self.activity_timeout:
+                    if self.active_end > self.active_start:
+                        self.active.add(self.active_end - self.active_start)
+                    self.idle.add(ts - self.active_end)
+                    self.active_start = ts
+                self.active_end = ts
+        self.last_seen = ts
+        self.lengths.add(length)
+
+        if forward:
+            if self.fwd_last is None:
+                self.init_win_fwd = window if flags is not None else 0
+            elif self.with_iat:
+                self.fwd_iat.add(ts - self.fwd_last)
+            self.fwd_last = ts
+            self.fwd_lens.add(length)
+        else:
+            if self.bwd_last is None:
+                self.init_win_bwd = window if flags is not None else 0
+            elif self.with_iat:
+                self.bwd_iat.add(ts - self.bwd_last)
+            self.bwd_last = ts
+            self.bwd_lens.add(length)
+
+        if flags is not None:
+            if self.with_header_len:
+                if forward:
+                    self.fwd_hdr_len += hdr_len
+                else:
+                    self.bwd_hdr_len += hdr_len
+            if self.with_flags:
+                self.fin += flags & 0x01
+                self.syn += (flags >> 1) & 1
+                self.rst += (flags >> 2) & 1
+                psh = (flags >> 3) & 1
+                urg = (flags >> 5) & 1
+                self.psh += psh
+                self.ack += (flags >> 4) & 1
+                self.urg += urg
+                self.ece += (flags >> 6) & 1
+                self.cwe += (flags >> 7) & 1
+                if forward:
+                    self.fwd_psh += psh
+                    self.fwd_urg += urg
+                else:
+                    self.bwd_psh += psh
+                    self.bwd_urg += urg
+
+    def features(self) -> list:
+        """Return the 78 features in ALL_78_FEATURES order."""
+        # Close the active period still open at the end of the flow
+        if self.active_end > self.active_start:
+            self.active.add(self.active_end - self.active_start)
+            self.active_start = self.active_end
+
+        fwd, bwd, flow_iat, fwd_iat, bwd_iat = self.fwd_lens, self.bwd_lens, self.flow_iat, self.fwd_iat, self.bwd_iat
+        active, idle = self.active, self.idle
+
+        total_pkts = fwd.n + bwd.n
+        total_len = fwd.total + bwd.total
+        duration = self.last_seen - self.start
+
+        # Rates
+        flow_bytes_per_s = total_len / duration if duration > 0 else 0
+        flow_pkts_per_s = total_pkts / duration if duration > 0 else 0
+        fwd_pkts_per_s = fwd.n / duration if duration > 0 else 0
+        bwd_pkts_per_s = bwd.n / duration if duration > 0 else 0
+
+        return [
+            self.dport, duration, fwd.n, bwd.n, fwd.total, bwd.total,
+            fwd.max, fwd.min, fwd.mean, fwd.std(),
+            bwd.max, bwd.min, bwd.mean, bwd.std(),
+            flow_bytes_per_s, flow_pkts_per_s,
+            flow_iat.mean, flow_iat.std(), flow_iat.max, flow_iat.min,
+            fwd_iat.total, fwd_iat.mean, fwd_iat.std(), fwd_iat.max, fwd_iat.min,
+            bwd_iat.total, bwd_iat.mean, bwd_iat.std(), bwd_iat.max, bwd_iat.min,
+            self.fwd_psh, self.bwd_psh, self.fwd_urg, self.bwd_urg,
+            self.fwd_hdr_len, self.bwd_hdr_len, fwd_pkts_per_s, bwd_pkts_per_s,
+            self.lengths.min, self.lengths.max, self.lengths.mean, self.lengths.std(), self.lengths.var(),
+            self.fin, self.syn, self.rst, self.psh, self.ack, self.urg, self.cwe, self.ece,
+            (bwd.n / fwd.n) if fwd.n > 0 else 0,  # Down/Up Ratio
+            total_len / total_pkts if total_pkts > 0 else 0,  # Average Packet Size
+            fwd.mean, bwd.mean, self.fwd_hdr_len,
+            0, 0, 0, 0, 0, 0,  # Bulk features are not computed
+            fwd.n, fwd.total, bwd.n, bwd.total,  # Subflow (simple approximation: the whole flow)
+            self.init_win_fwd, self.init_win_bwd, fwd.n, fwd.min,
+            active.mean, active.std(), active.max, active.min,
+            idle.mean, idle.std(), idle.max, idle.min,
+        ]
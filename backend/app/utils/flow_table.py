@@ -0,0 +1,111 @@
+import os
+from collections import deque
+from app.utils.flow_state import FlowState
+
+# CICFlowMeter defaults: a flow is cut 120s after its first packet; flows with no
+# traffic for FLOW_IDLE_TIMEOUT seconds are evicted from the table
+FLOW_ACTIVE_TIMEOUT = float(os.getenv("FLOW_ACTIVE_TIMEOUT", "120"))
+FLOW_IDLE_TIMEOUT = float(os.getenv("FLOW_IDLE_TIMEOUT", "120"))
+# How often (in capture time) idle flows are swept out of the table
+FLOW_SWEEP_INTERVAL = 1.0
+
+TCP_FIN = 0x01
+TCP_RST = 0x04
+
+
+def flow_key(src: int, sport: int, dst: int, dport: int, proto: int) -> tuple:
+    """
+    Canonical bidirectional flow key: (low endpoint, high endpoint, proto).
+
+    An endpoint is an integer address shifted left 16 bits with the port in the
+    low bits, so both directions of a conversation map to the same key.
+    """
+    src_ep = src << 16 | sport
+    dst_ep = dst << 16 | dport
+    return (src_ep, dst_ep, proto) if src_ep <= dst_ep else (dst_ep, src_ep, proto)
+
+
+class FlowTable:
+    """
+    Live flow table with CICFlowMeter-style termination.
+
+    Flows are bidirectional: both directions of a conversation share one
+    canonical key, and the endpoint that sent the first packet is treated as
+    the forward (initiator) side. Keys are small integer tuples (see flow_key).
+
+    A flow ends when it exceeds the active timeout, has been idle longer than the
+    idle timeout, or carries a TCP FIN or RST. Finished flows are queued in
+    `finished` as (key, FlowState) as soon as they end, so callers can hand them
+    downstream while the capture is still being read.
+
+    Packets are expected in timestamp order. One that is older than the latest
+    packet of its flow (multi-queue NICs, merged captures) is counted in
+    `reordered` and folded in at that latest time, so inter-arrival and
+    active/idle times never go negative.
+    """
+
+    def __init__(self, active_timeout: float = None, idle_timeout: float = None, flow_factory=FlowState):
+        # flow_factory(initiator, dport, ts) builds the per-flow state; anything
+        # with start/last_seen/initiator attributes and FlowState's add() works
+        self.flow_factory = flow_factory
+        self.active_timeout = FLOW_ACTIVE_TIMEOUT if active_timeout is None else active_timeout
+        self.idle_timeout = FLOW_IDLE_TIMEOUT if idle_timeout is None else idle_timeout
+        # Ordered by last packet time: every update moves the flow to the end
+        self.flows = {}
+        self.finished = deque()
+        self.next_sweep = None
+        self.reordered = 0
+
+    def add(self, ts: float, length: int, headers):
+        """Route one decoded packet (see packet_decoder.decode_frame) to its flow."""
+        src, dst, sport, dport, proto, flags, hdr_len, window = headers
+        # flow_key(), inlined: the source endpoint is needed for the direction too
+        src_ep = src << 16 | sport
+        dst_ep = dst << 16 | dport
+        key = (src_ep, dst_ep, proto) if src_ep <= dst_ep else (dst_ep, src_ep, proto)
+
+        flow = self.flows.pop(key, None)
+        if flow is not None and (ts - flow.last_seen > self.idle_timeout or ts - flow.start > self.active_timeout):
+            self.finished.append((key, flow))
+            flow = None
+        if flow is None:
+            flow = self.flow_factory(src_ep, dport, ts)
+        elif ts < flow.last_seen:
+            self.reordered += 1
+            ts = flow.last_seen
+        flow.add(ts, length, src_ep == flow.initiator, flags, hdr_len, window)
+
+        if flags is not None and flags & (TCP_FIN | TCP_RST):
+            self.finished.append((key, flow))
+        else:
+            self.flows[key] = flow
+
+        if self.next_sweep is None:
+            self.next_sweep = ts + FLOW_SWEEP_INTERVAL
+        elif ts >= self.next_sweep:
+            self.sweep(ts)
+
+    def sweep(self, now: float):
+        """Evict flows that have been idle longer than the idle timeout."""
+        flows = self.flows
+        while flows:
+            key = next(iter(flows))
+            if now - flows[key].last_seen <= self.idle_timeout:
+                break
+            self.finished.append((key, flows.pop(key)))
+        self.next_sweep = now + FLOW_SWEEP_INTERVAL
+
+    def drain(self):
+        """Yield and forget the flows that have finished so far."""
+        finished = self.finished
+        while finished:
+            yield finished.popleft()
+
+    def flush(self):
+        """End every remaining flow (e.g. at end of capture) and yield all finished flows."""
+        self.finished.extend(self.flows.items())
+        self.flows = {}
+        yield from self.drain()
+
+    def __len__(self):
+        return len(self.flows)
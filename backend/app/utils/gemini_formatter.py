@@ -1,12 +1,32 @@
+import hashlib
 import os
 import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 import google.generativeai as genai
-from typing import Dict, Any
+from typing import Dict, Any, Tuple
 
 # Configure Gemini
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "GEMINI_API_KEY")
+# Alternative API host (e.g. http://127.0.0.1:8765 for a local stub server); uses the REST transport
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
 if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
+    if GEMINI_API_ENDPOINT:
+        genai.configure(api_key=GEMINI_API_KEY, transport="rest", client_options={"api_endpoint": GEMINI_API_ENDPOINT})
+    else:
+        genai.configure(api_key=GEMINI_API_KEY)
+
+# Latency budget for a report, from the moment it is requested; past it the
+# model-based summary (generate_dummy_response) is used instead
+GEMINI_TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "20"))
+# Reports requested at once; the rest wait for a free slot (within their budget)
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "4"))
+# Gemini responses are cached by prompt hash, least recently used first out
+REPORT_CACHE_SIZE = int(os.getenv("REPORT_CACHE_SIZE", "256"))
+REPORT_CACHE_TTL_SECONDS = float(os.getenv("REPORT_CACHE_TTL_SECONDS", "3600"))
 
 SYSTEM_PROMPT = """
 You are a cybersecurity expert analyzing network traffic data. Based on the model prediction results, generate a detailed threat analysis report.
@@ -33,56 +53,177 @@ Return a JSON object with the following structure:
 }
 
 Provide realistic and specific threat analysis based on the model output.
+Take sourceIP, destinationIP and port only from the flows in "top_flagged_flows"; use null when no flow applies.
 """
 
-def format_with_gemini(model_output: Dict[str, Any], filename: str) -> Dict[str, Any]:
+
+class ReportCache:
+    """Thread-safe LRU cache whose entries also expire ttl seconds after they were stored"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (stored at, value)
+        self.lock = threading.Lock()
+
+    def get(self, key: str):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[0] > self.ttl:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: str, value):
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+
+report_cache = ReportCache(REPORT_CACHE_SIZE, REPORT_CACHE_TTL_SECONDS)
+report_executor = ThreadPoolExecutor(max_workers=REPORT_WORKERS, thread_name_prefix="report")
+# Prompt hash -> Future of the Gemini call in flight, shared by identical requests
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+def build_prompt(model_output: Dict[str, Any]) -> str:
     """
-    Send model output to Gemini and get formatted threat analysis
+    The Gemini prompt for a model output. It depends on nothing else (not the
+    file name), so identical summaries share a cached report.
     """
-    try:
-        if not GEMINI_API_KEY:
-            # Return dummy formatted response if no API key
-            return generate_dummy_response(model_output, filename)
-        
-        # Initialize Gemini model
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        
-        # Prepare prompt
-        prompt = f"""
+    return f"""
 {SYSTEM_PROMPT}
 
-File analyzed: {filename}
-Model prediction: {json.dumps(model_output, indent=2)}
+Model prediction: {json.dumps(model_output, indent=2, sort_keys=True)}
 
 Generate the threat analysis report in JSON format.
 """
-        # Get response from Gemini
-        response = model.generate_content(prompt)
-        
-        # Extract and clean response text
-        response_text = response.text.strip()
-        
-        # Extract JSON if wrapped in Markdown code block
-        if "```json" in response_text:
-            json_start = response_text.find("```json") + len("```json")
-            json_end = response_text.find("```", json_start)
-            response_text = response_text[json_start:json_end].strip()
-        elif "```" in response_text:
-            json_start = response_text.find("```") + len("```")
-            json_end = response_text.find("```", json_start)
-            response_text = response_text[json_start:json_end].strip()
-        
-        # Parse JSON
-        result = json.loads(response_text)
-        return result
 
+
+def parse_report(response_text: str) -> Dict[str, Any]:
+    """Parse the JSON report out of a Gemini response, with or without a Markdown code block"""
+    response_text = response_text.strip()
+    if "```json" in response_text:
+        json_start = response_text.find("```json") + len("```json")
+        json_end = response_text.find("```", json_start)
+        response_text = response_text[json_start:json_end].strip()
+    elif "```" in response_text:
+        json_start = response_text.find("```") + len("```")
+        json_end = response_text.find("```", json_start)
+        response_text = response_text[json_start:json_end].strip()
+    return json.loads(response_text)
+
+
+def _request_report(prompt: str, timeout: float) -> Dict[str, Any]:
+    model = genai.GenerativeModel(GEMINI_MODEL)
+    response = model.generate_content(prompt, request_options={"timeout": timeout})
+    return parse_report(response.text)
+
+
+def _fetch_report(key: str, prompt: str, timeout: float, future: Future):
+    try:
+        report = _request_report(prompt, timeout)
+        report_cache.put(key, report)
+        future.set_result(report)
+    except BaseException as e:
+        future.set_exception(e)
+    finally:
+        with _in_flight_lock:
+            del _in_flight[key]
+
+
+def _shared_request(key: str, prompt: str, timeout: float) -> Future:
+    """
+    Future of the Gemini call for a prompt. Identical prompts requested while
+    one is in flight share that call; a call that outlives the budget of whoever
+    waits on it still fills the cache.
+    """
+    with _in_flight_lock:
+        future = _in_flight.get(key)
+        if future is not None:
+            return future
+        future = Future()
+        _in_flight[key] = future
+    threading.Thread(target=_fetch_report, args=(key, prompt, timeout, future), name="gemini-call", daemon=True).start()
+    return future
+
+
+def generate_report(model_output: Dict[str, Any], deadline: float = None) -> Tuple[Dict[str, Any], str]:
+    """
+    Threat report for a model output, within the latency budget ending at
+    deadline (time.monotonic(); default GEMINI_TIMEOUT_SECONDS from now).
+
+    Returns (report, source): source is "gemini", "cache" or "fallback"
+    (generate_dummy_response, when there is no API key, the budget ran out or
+    the call failed).
+    """
+    if not GEMINI_API_KEY:
+        return generate_dummy_response(model_output), "fallback"
+    if deadline is None:
+        deadline = time.monotonic() + GEMINI_TIMEOUT_SECONDS
+    prompt = build_prompt(model_output)
+    key = hashlib.sha256(f"{GEMINI_MODEL}\n{prompt}".encode()).hexdigest()
+    cached = report_cache.get(key)
+    if cached is not None:
+        return cached, "cache"
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        print("⏱️ Report budget spent before the Gemini call; using the model summary")
+        return generate_dummy_response(model_output), "fallback"
+    try:
+        return _shared_request(key, prompt, remaining).result(timeout=remaining), "gemini"
+    except TimeoutError:
+        print(f"⏱️ Gemini report exceeded its {GEMINI_TIMEOUT_SECONDS:g}s budget; using the model summary")
+        return generate_dummy_response(model_output), "fallback"
     except Exception as e:
         print(f"Error with Gemini API: {e}")
-        return generate_dummy_response(model_output, filename)
+        return generate_dummy_response(model_output), "fallback"
+
+
+def submit_report(model_output: Dict[str, Any]) -> Future:
+    """
+    Start generate_report on report_executor; the future resolves to
+    (report, source). The budget starts now, so time spent queued counts.
+    """
+    deadline = time.monotonic() + GEMINI_TIMEOUT_SECONDS
+    return report_executor.submit(generate_report, model_output, deadline)
+
+
+def format_with_gemini(model_output: Dict[str, Any], filename: str = None) -> Dict[str, Any]:
+    """
+    Send model output to Gemini and get formatted threat analysis
+    (filename is accepted for compatibility; reports do not name the file)
+    """
+    return generate_report(model_output)[0]
+
+
+def report_summary(report: Dict[str, Any]) -> Tuple[int, int, str]:
+    """(threat count, risk score, severity) of a report, as listed by /history"""
+    summary = report.get("summary") or {}
+    threats = int(summary.get("totalThreats") or 0)
+    risk_score = int(summary.get("riskScore") or 0)
+    if risk_score >= 70:
+        severity = "High"
+    elif risk_score >= 40:
+        severity = "Medium"
+    else:
+        severity = "Low"
+    return threats, risk_score, severity
 
 
-def generate_dummy_response(model_output: Dict[str, Any], filename: str) -> Dict[str, Any]:
-    """Generate a dummy response based on model output"""
+def generate_dummy_response(model_output: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Generate a dummy response based on model output. Like the Gemini prompt it
+    does not name the file, so the cached result of a capture suits any upload of it.
+    """
     threat_level = model_output.get("threat_level", "low")
     confidence = model_output.get("confidence", 0.5)
     prediction = model_output.get("prediction", "").lower()
@@ -100,6 +241,19 @@ def generate_dummy_response(model_output: Dict[str, Any], filename: str) -> Dict
         threat_count = 0
         risk_score = 15
 
+    # Attribute threats to the most confident flagged flows; never invent endpoints
+    flagged_flows = model_output.get("top_flagged_flows") or []
+
+    def attribution(i):
+        if i >= len(flagged_flows):
+            return {"sourceIP": None, "destinationIP": None, "port": None}
+        flow = flagged_flows[i]
+        return {
+            "sourceIP": flow.get("source_ip"),
+            "destinationIP": flow.get("destination_ip"),
+            "port": flow.get("destination_port"),
+        }
+
     threats_list = []
     if threat_count > 0:
         threats_list.append({
@@ -108,9 +262,7 @@ def generate_dummy_response(model_output: Dict[str, Any], filename: str) -> Dict
             "severity": severity,
             "description": f"Unusual network pattern detected in packet flow with {confidence:.0%} confidence.",
             "confidence": confidence,
-            "sourceIP": "192.168.1.100",
-            "destinationIP": "10.0.0.50",
-            "port": 443
+            **attribution(0)
         })
 
         if threat_count >= 2:
@@ -120,9 +272,7 @@ def generate_dummy_response(model_output: Dict[str, Any], filename: str) -> Dict
                 "severity": severity,
                 "description": "Detected patterns matching known malware behavior.",
                 "confidence": round(confidence * 0.9, 2),
-                "sourceIP": "192.168.1.105",
-                "destinationIP": "203.0.113.42",
-                "port": 8080
+                **attribution(1)
             })
 
         if threat_count >= 3:
@@ -132,25 +282,23 @@ def generate_dummy_response(model_output: Dict[str, Any], filename: str) -> Dict
                 "severity": severity,
                 "description": "Large data transfer to suspicious external IP.",
                 "confidence": round(confidence * 0.85, 2),
-                "sourceIP": "192.168.1.100",
-                "destinationIP": "198.51.100.23",
-                "port": 22
+                **attribution(2)
             })
 
     # Recommendation message
     if severity == "High":
         recommendation = (
-            f"The analyzed file '{filename}' shows a HIGH risk level. "
+            "The analyzed capture shows a HIGH risk level. "
             "Immediate action recommended — isolate affected systems and conduct a thorough investigation."
         )
     elif severity == "Medium":
         recommendation = (
-            f"The analyzed file '{filename}' shows a MEDIUM risk level. "
+            "The analyzed capture shows a MEDIUM risk level. "
             "Monitor for suspicious activity and review security logs."
         )
     else:
         recommendation = (
-            f"The analyzed file '{filename}' shows a LOW risk level. "
+            "The analyzed capture shows a LOW risk level. "
             "No immediate action required — continue routine monitoring."
         )
 
@@ -0,0 +1,276 @@
+import os
+import queue
+import secrets
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing.connection import Client, Listener
+import numpy as np
+
+# Largest merged batch (flows) handed to the model in one call
+INFERENCE_MAX_BATCH = int(os.getenv("INFERENCE_MAX_BATCH", "65536"))
+# How long the first request of a batch may wait for others to join it
+INFERENCE_MAX_DELAY_MS = float(os.getenv("INFERENCE_MAX_DELAY_MS", "5"))
+
+
+class _Request:
+    __slots__ = ("features", "model", "scaler", "future")
+
+    def __init__(self, features: np.ndarray, model, scaler):
+        self.features = features
+        self.model = model
+        self.scaler = scaler
+        self.future = Future()
+
+
+class InferenceService:
+    """
+    Shared micro-batching front end for a batch predict function.
+
+    Jobs submit feature matrices from their own threads; a single worker
+    thread drains the queue, waits up to max_delay for more requests, stacks
+    the matrices of requests that use the same model and scaler into one
+    batch of at most max_batch flows, scores it with one predict_fn call and
+    hands each job its slice of the (labels, confidences) result.
+    """
+
+    def __init__(self, predict_fn, max_batch: int = None, max_delay_ms: float = None):
+        # predict_fn(features, model, scaler) -> (labels, confidences)
+        self.predict_fn = predict_fn
+        self.max_batch = max_batch or INFERENCE_MAX_BATCH
+        self.max_delay = (INFERENCE_MAX_DELAY_MS if max_delay_ms is None else max_delay_ms) / 1000
+        self.requests = queue.Queue()
+        self.lock = threading.Lock()
+        self.worker = None
+        self.batches = 0
+        self.batched_requests = 0
+        self.batched_flows = 0
+
+    def submit(self, features: np.ndarray, model, scaler) -> Future:
+        """Queue one feature matrix; the future resolves to (labels, confidences)."""
+        self._ensure_worker()
+        request = _Request(features, model, scaler)
+        self.requests.put(request)
+        return request.future
+
+    def predict(self, features: np.ndarray, model, scaler):
+        """Blocking submit(); matrices larger than max_batch are split first."""
+        futures = [
+            self.submit(features[i:i + self.max_batch], model, scaler)
+            for i in range(0, len(features), self.max_batch)
+        ]
+        if len(futures) == 1:
+            return futures[0].result()
+        parts = [future.result() for future in futures]
+        return np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+
+    def _ensure_worker(self):
+        with self.lock:
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self._run, name="inference-service", daemon=True)
+                self.worker.start()
+
+    def _collect(self) -> list:
+        """Block for one request, then gather more until the batch is full or the delay is up."""
+        pending = [self.requests.get()]
+        rows = len(pending[0].features)
+        deadline = time.monotonic() + self.max_delay
+        while rows < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                request = self.requests.get(timeout=timeout) if timeout > 0 else self.requests.get_nowait()
+            except queue.Empty:
+                break
+            pending.append(request)
+            rows += len(request.features)
+        return pending
+
+    def _run(self):
+        while True:
+            pending = self._collect()
+            # Requests for different models (or scalers) cannot share a batch
+            groups = {}
+            for request in pending:
+                groups.setdefault((id(request.model), id(request.scaler)), []).append(request)
+            for group in groups.values():
+                self._score(group)
+
+    def _score(self, group: list):
+        # Keep each model call within max_batch flows
+        batch, rows = [], 0
+        for request in group:
+            if batch and rows + len(request.features) > self.max_batch:
+                self._score_batch(batch)
+                batch, rows = [], 0
+            batch.append(request)
+            rows += len(request.features)
+        if batch:
+            self._score_batch(batch)
+
+    def _score_batch(self, batch: list):
+        first = batch[0]
+        try:
+            features = first.features if len(batch) == 1 else np.concatenate([r.features for r in batch])
+            labels, confidences = self.predict_fn(features, first.model, first.scaler)
+        except Exception as e:
+            for request in batch:
+                request.future.set_exception(e)
+            return
+        with self.lock:
+            self.batches += 1
+            self.batched_requests += len(batch)
+            self.batched_flows += len(features)
+        offset = 0
+        for request in batch:
+            end = offset + len(request.features)
+            request.future.set_result((labels[offset:end], confidences[offset:end]))
+            offset = end
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "max_batch": self.max_batch,
+                "max_delay_ms": self.max_delay * 1000,
+                "batches": self.batches,
+                "requests": self.batched_requests,
+                "flows": self.batched_flows,
+                "avg_requests_per_batch": round(self.batched_requests / self.batches, 2) if self.batches else 0,
+                "queued": self.requests.qsize(),
+            }
+
+
+def new_server_address():
+    """Private (Unix socket path, authkey) for an InferenceServer started by this process"""
+    return os.path.join(tempfile.gettempdir(), f"ids-inference-{os.getpid()}.sock"), secrets.token_hex(16)
+
+
+class InferenceServer:
+    """
+    Serves an InferenceService to other processes over a
+    multiprocessing.connection socket, so that requests from several job
+    worker processes merge into the same micro-batches.
+
+    A request is a header, (model name, scaler name, shape), followed by the
+    float64 feature matrix as raw bytes; the reply is ("ok", labels,
+    confidences) or ("error", message). ("stats",) returns service.stats().
+    Models and scalers are looked up by name with load (e.g. registry.get).
+    """
+
+    def __init__(self, service: InferenceService, load, address: str, authkey: str):
+        self.service = service
+        self.load = load
+        self.address = address
+        self.authkey = authkey
+        self.listener = None
+
+    def start(self):
+        if os.path.exists(self.address):
+            os.remove(self.address)  # left by a previous run
+        self.listener = Listener(self.address, authkey=self.authkey.encode())
+        threading.Thread(target=self._accept, name="inference-server", daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                connection = self.listener.accept()
+            except OSError:
+                return  # stopped
+            except Exception as e:
+                print(f"⚠️ Rejected inference connection: {e}")
+                continue
+            threading.Thread(target=self._serve, args=(connection,), name="inference-conn", daemon=True).start()
+
+    def _serve(self, connection):
+        with connection:
+            while True:
+                try:
+                    header = connection.recv()
+                    if header[0] == "stats":
+                        connection.send(self.service.stats())
+                        continue
+                    model_name, scaler_name, shape = header
+                    features = np.frombuffer(connection.recv_bytes(), dtype=np.float64).reshape(shape)
+                except (EOFError, OSError):
+                    return
+                try:
+                    labels, confidences = self.service.predict(features, self.load(model_name), self.load(scaler_name))
+                    reply = ("ok", labels, confidences)
+                except Exception as e:
+                    reply = ("error", f"{type(e).__name__}: {e}")
+                try:
+                    connection.send(reply)
+                except (EOFError, OSError):
+                    return
+
+    def stop(self):
+        if self.listener is not None:
+            self.listener.close()
+            self.listener = None
+
+
+class InferenceClient:
+    """
+    Connection to an InferenceServer. predict() and stats() return None while
+    the server is unreachable, so callers can score locally instead.
+    """
+
+    RETRY_SECONDS = 5
+
+    def __init__(self, address: str, authkey: str):
+        self.address = address
+        self.authkey = authkey.encode()
+        self.lock = threading.Lock()
+        self.connection = None
+        self.retry_at = 0
+
+    def _request(self, header, payload=None):
+        with self.lock:
+            if self.connection is None:
+                if time.monotonic() < self.retry_at:
+                    return None
+                try:
+                    self.connection = Client(self.address, authkey=self.authkey)
+                except Exception as e:
+                    print(f"⚠️ Inference service unreachable, scoring locally: {e}")
+                    self.retry_at = time.monotonic() + self.RETRY_SECONDS
+                    return None
+            try:
+                self.connection.send(header)
+                if payload is not None:
+                    self.connection.send_bytes(payload)
+                return self.connection.recv()
+            except (OSError, EOFError, ValueError):
+                self.connection.close()
+                self.connection = None
+                self.retry_at = time.monotonic() + self.RETRY_SECONDS
+                return None
+
+    def predict(self, features: np.ndarray, model_name: str, scaler_name: str):
+        """(labels, confidences) from the server, or None if it could not be reached"""
+        features = np.ascontiguousarray(features, dtype=np.float64)
+        reply = self._request((model_name, scaler_name, features.shape), memoryview(features).cast("B"))
+        if reply is None:
+            return None
+        if reply[0] == "error":
+            raise RuntimeError(f"Inference service: {reply[1]}")
+        return reply[1], reply[2]
+
+    def stats(self):
+        return self._request(("stats",))
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def remote_client():
+    """Client of the shared InferenceServer named by INFERENCE_ADDRESS/INFERENCE_AUTHKEY, or None"""
+    global _client
+    address, authkey = os.getenv("INFERENCE_ADDRESS"), os.getenv("INFERENCE_AUTHKEY")
+    if not address or not authkey:
+        return None
+    with _client_lock:
+        if _client is None or _client.address != address:
+            _client = InferenceClient(address, authkey)
+        return _client
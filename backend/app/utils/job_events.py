@@ -0,0 +1,237 @@
+"""
+Job status events: status changes and progress, pushed to /status/{job_id}/stream.
+
+The API process keeps an in-process hub that stream subscribers listen on.
+Job workers run in other processes, so they send their events over a
+multiprocessing.connection socket (the broker) that the API serves and
+republishes into the hub. Delivery is best effort: a stream that misses an
+event still reaches the job's final status from the database.
+"""
+import asyncio
+import os
+import secrets
+import tempfile
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from multiprocessing.connection import Client, Listener
+
+# Broker address: "host:port", or a Unix socket path. Unset, the API serves a
+# private socket and passes it (and the key) to the workers it starts; a
+# standalone `python -m app.worker` needs both set to reach the API.
+JOB_EVENTS_ADDRESS = os.getenv("JOB_EVENTS_ADDRESS")
+JOB_EVENTS_AUTHKEY = os.getenv("JOB_EVENTS_AUTHKEY")
+# Shortest gap between two progress events of one job
+JOB_PROGRESS_INTERVAL = float(os.getenv("JOB_PROGRESS_INTERVAL", "0.25"))
+# Last event kept per job for new subscribers; oldest jobs go first
+LATEST_EVENTS = 10000
+
+TERMINAL_STATUSES = ("completed", "failed")
+
+
+def _parse_address(address: str):
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit() and "/" not in address:
+        return host or "127.0.0.1", int(port)
+    return address
+
+
+class EventHub:
+    """In-process pub/sub of job events; subscribers are asyncio queues, publishers any thread"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = defaultdict(set)  # job_id -> {(loop, queue)}
+        self.latest = OrderedDict()  # job_id -> last event
+
+    def publish(self, event: dict):
+        job_id = event["job_id"]
+        with self.lock:
+            latest = {**self.latest.pop(job_id, {}), **event}
+            self.latest[job_id] = latest
+            while len(self.latest) > LATEST_EVENTS:
+                self.latest.popitem(last=False)
+            subscribers = list(self.subscribers.get(job_id, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, latest)
+            except RuntimeError:
+                pass  # the subscriber's event loop is closed
+
+    def subscribe(self, job_id: int):
+        """Queue of the job's events (call from the event loop), and its last event so far, or None"""
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue())
+        with self.lock:
+            self.subscribers[job_id].add(subscriber)
+            latest = self.latest.get(job_id)
+        return subscriber, latest
+
+    def unsubscribe(self, job_id: int, subscriber):
+        with self.lock:
+            subscribers = self.subscribers.get(job_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self.subscribers[job_id]
+
+
+class EventBroker:
+    """Receives events from worker processes and republishes them in a hub"""
+
+    def __init__(self, hub: EventHub, address: str = None, authkey: str = None):
+        self.hub = hub
+        self.address = address or os.path.join(tempfile.gettempdir(), f"ids-job-events-{os.getpid()}.sock")
+        self.authkey = authkey or secrets.token_hex(16)
+        self.listener = None
+
+    def start(self):
+        address = _parse_address(self.address)
+        if isinstance(address, str) and os.path.exists(address):
+            os.remove(address)  # left by a previous run
+        self.listener = Listener(address, authkey=self.authkey.encode())
+        threading.Thread(target=self._accept, name="job-events-broker", daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                connection = self.listener.accept()
+            except OSError:
+                return  # stopped
+            except Exception as e:
+                print(f"⚠️ Rejected job events connection: {e}")
+                continue
+            threading.Thread(target=self._receive, args=(connection,), name="job-events-conn", daemon=True).start()
+
+    def _receive(self, connection):
+        with connection:
+            while True:
+                try:
+                    event = connection.recv()
+                except (EOFError, OSError):
+                    return
+                if isinstance(event, dict) and "job_id" in event:
+                    self.hub.publish(event)
+
+    def stop(self):
+        if self.listener is not None:
+            self.listener.close()
+            self.listener = None
+
+
+class EventPublisher:
+    """Worker-side connection to the broker; events are dropped while it is unreachable"""
+
+    RETRY_SECONDS = 5
+
+    def __init__(self, address: str, authkey: str):
+        self.address = _parse_address(address)
+        self.authkey = authkey.encode()
+        self.lock = threading.Lock()
+        self.connection = None
+        self.retry_at = 0
+
+    def send(self, event: dict):
+        with self.lock:
+            if self.connection is None:
+                if time.monotonic() < self.retry_at:
+                    return
+                try:
+                    self.connection = Client(self.address, authkey=self.authkey)
+                except Exception as e:
+                    print(f"⚠️ Job events broker unreachable: {e}")
+                    self.retry_at = time.monotonic() + self.RETRY_SECONDS
+                    return
+            try:
+                self.connection.send(event)
+            except (OSError, EOFError, ValueError):
+                self.connection.close()
+                self.connection = None
+
+
+hub = EventHub()
+_broker = None
+_publisher = None
+_publisher_lock = threading.Lock()
+
+
+def start_broker():
+    """Serve the broker from this (the API) process; workers started afterwards inherit its address"""
+    global _broker
+    _broker = EventBroker(hub, os.getenv("JOB_EVENTS_ADDRESS", JOB_EVENTS_ADDRESS), os.getenv("JOB_EVENTS_AUTHKEY", JOB_EVENTS_AUTHKEY))
+    _broker.start()
+    # Spawned worker processes read these from their environment
+    os.environ["JOB_EVENTS_ADDRESS"] = _broker.address
+    os.environ["JOB_EVENTS_AUTHKEY"] = _broker.authkey
+    return _broker
+
+
+def stop_broker():
+    global _broker
+    if _broker is not None:
+        _broker.stop()
+        _broker = None
+
+
+def _get_publisher():
+    global _publisher
+    address, authkey = os.getenv("JOB_EVENTS_ADDRESS"), os.getenv("JOB_EVENTS_AUTHKEY")
+    if not address or not authkey:
+        return None
+    with _publisher_lock:
+        if _publisher is None:
+            _publisher = EventPublisher(address, authkey)
+        return _publisher
+
+
+def publish(job_id: int, status: str = None, **fields):
+    """
+    Publish a job event: status (pending, processing, completed, failed) and/or
+    progress fields. In the API process (or with no broker configured) it goes
+    straight to the hub; in a worker process, through the broker.
+    """
+    event = {"job_id": job_id, **({"status": status} if status else {}), **fields, "time": time.time()}
+    publisher = None if _broker is not None else _get_publisher()
+    if publisher is None:
+        hub.publish(event)
+    else:
+        publisher.send(event)
+
+
+class JobProgress:
+    """
+    Progress events for one running job, at most one per JOB_PROGRESS_INTERVAL.
+
+    progress is an overall percentage: parsing packets covers 0-70 (by bytes
+    read, when the capture size is known), scoring flows 70-95, and the
+    rest is storing results.
+    """
+
+    PARSE_END, SCORE_END = 70, 95
+
+    def __init__(self, job_id: int, total_bytes: int = None):
+        self.job_id = job_id
+        self.total_bytes = total_bytes
+        self.sent_at = 0
+
+    def _send(self, stage: str, progress: float = None, force: bool = False, **fields):
+        now = time.monotonic()
+        if not force and now - self.sent_at < JOB_PROGRESS_INTERVAL:
+            return
+        self.sent_at = now
+        if progress is not None:
+            fields["progress"] = round(min(progress, 100), 1)
+        publish(self.job_id, "processing", stage=stage, **fields)
+
+    def stage(self, stage: str, progress: float = None):
+        self._send(stage, progress, force=True)
+
+    def parsing(self, packets: int, bytes_read: int, flows: int):
+        progress = None
+        if self.total_bytes:
+            progress = self.PARSE_END * min(bytes_read / self.total_bytes, 0.99)
+        self._send("parsing", progress, packets=packets, flows=flows)
+
+    def scoring(self, batches: int, total_batches: int, flows_scored: int):
+        progress = self.PARSE_END + (self.SCORE_END - self.PARSE_END) * batches / max(total_batches, 1)
+        self._send("scoring", progress, force=batches == total_batches,
+                   batches=batches, total_batches=total_batches, flows_scored=flows_scored)
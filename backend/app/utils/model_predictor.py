@@ -1,145 +1,117 @@
 import os
-import joblib
+import warnings
 import pandas as pd
 import numpy as np
 from typing import Dict, Any
+from app.utils.features import ALL_78_FEATURES
+from app.utils.feature_store import iter_feature_batches
+from app.utils.fast_inference import FAST_INFERENCE, get_fast_predictor
+from app.utils.inference_service import InferenceService, remote_client
+from app.utils.model_registry import model_features, registry
 
 
 def load_model(model_path: str):
-    """Load joblib model with error handling."""
+    """Get a joblib model from the model registry (loaded once, reloaded when the file changes)."""
     try:
-        print(f"📦 Loading model from {model_path} ...")
-        model = joblib.load(model_path)
-        print("✅ Model loaded successfully.")
-        return model
+        return registry.get(model_path)
     except Exception as e:
         print(f"⚠️ Error loading model: {e}")
         return None
 
 
-def predict_from_csv(csv_path: str, model_path: str, scaler_path: str, is_multiclass: bool = False) -> Dict[str, Any]:
-    """
-    Runs model inference on the given CSV with support for both binary and multi-class classification.
-    
-    Args:
-        csv_path: Path to input CSV file (must have all 78 features)
-        model_path: Path to trained model (.joblib)
-        scaler_path: Path to fitted scaler (.joblib)
-        is_multiclass: If True, performs multi-class classification (15 classes)
-                      If False, performs binary classification (BENIGN vs ATTACK)
-    
-    Returns:
-        Dictionary containing predictions, confidence scores, and analysis results
+# Flows scaled and scored per model call; bounds the scaled copy and the
+# probability matrix held at any one time
+PREDICT_BATCH_SIZE = int(os.getenv("PREDICT_BATCH_SIZE", "65536"))
+# Score batches through the shared micro-batching service, which merges
+# batches from concurrent jobs into fewer, larger model calls. It runs in its
+# own process, started by WorkerPool when there are two or more job workers;
+# with one worker (one job at a time) batches are scored in place
+INFERENCE_SERVICE = os.getenv("INFERENCE_SERVICE", "true").lower() == "true"
+
+
+# Multi-class label mapping (matching your training data)
+MULTICLASS_LABELS = {
+    0: "BENIGN",
+    1: "Bot",
+    2: "DDoS",
+    3: "DoS GoldenEye",
+    4: "DoS Hulk",
+    5: "DoS Slowhttptest",
+    6: "DoS slowloris",
+    7: "FTP-Patator",
+    8: "Heartbleed",
+    9: "Infiltration",
+    10: "PortScan",
+    11: "SSH-Patator",
+    12: "Web Attack – Brute Force",
+    13: "Web Attack – Sql Injection",
+    14: "Web Attack – XSS"
+}
+
+
+def label_names(labels: np.ndarray, is_multiclass: bool = False) -> list:
+    """Class names for predicted labels (BENIGN/ATTACK for the binary models)."""
+    if is_multiclass:
+        return [MULTICLASS_LABELS.get(int(label), f"Unknown-{label}") for label in labels]
+    return ["BENIGN" if int(label) == 0 else "ATTACK" for label in labels]
+
+
+def _load_model_and_scaler(model_path: str, scaler_path: str):
+    model = load_model(model_path)
+    if model is None:
+        raise ValueError("Model could not be loaded.")
+
+    scaler = registry.get(scaler_path)
+    return model, scaler
+
+
+class PredictionSummary:
     """
-    
-    # Multi-class label mapping (matching your training data)
-    MULTICLASS_LABELS = {
-        0: "BENIGN",
-        1: "Bot",
-        2: "DDoS",
-        3: "DoS GoldenEye",
-        4: "DoS Hulk",
-        5: "DoS Slowhttptest",
-        6: "DoS slowloris",
-        7: "FTP-Patator",
-        8: "Heartbleed",
-        9: "Infiltration",
-        10: "PortScan",
-        11: "SSH-Patator",
-        12: "Web Attack – Brute Force",
-        13: "Web Attack – Sql Injection",
-        14: "Web Attack – XSS"
-    }
-    
-    # ALL 78 features in EXACT order expected by the model
-    ALL_78_FEATURES = [
-        "Destination Port", "Flow Duration", "Total Fwd Packets", "Total Backward Packets",
-        "Total Length of Fwd Packets", "Total Length of Bwd Packets", "Fwd Packet Length Max",
-        "Fwd Packet Length Min", "Fwd Packet Length Mean", "Fwd Packet Length Std",
-        "Bwd Packet Length Max", "Bwd Packet Length Min", "Bwd Packet Length Mean",
-        "Bwd Packet Length Std", "Flow Bytes/s", "Flow Packets/s", "Flow IAT Mean",
-        "Flow IAT Std", "Flow IAT Max", "Flow IAT Min", "Fwd IAT Total", "Fwd IAT Mean",
-        "Fwd IAT Std", "Fwd IAT Max", "Fwd IAT Min", "Bwd IAT Total", "Bwd IAT Mean",
-        "Bwd IAT Std", "Bwd IAT Max", "Bwd IAT Min", "Fwd PSH Flags", "Bwd PSH Flags",
-        "Fwd URG Flags", "Bwd URG Flags", "Fwd Header Length", "Bwd Header Length",
-        "Fwd Packets/s", "Bwd Packets/s", "Min Packet Length", "Max Packet Length",
-        "Packet Length Mean", "Packet Length Std", "Packet Length Variance",
-        "FIN Flag Count", "SYN Flag Count", "RST Flag Count", "PSH Flag Count",
-        "ACK Flag Count", "URG Flag Count", "CWE Flag Count", "ECE Flag Count",
-        "Down/Up Ratio", "Average Packet Size", "Avg Fwd Segment Size",
-        "Avg Bwd Segment Size", "Fwd Header Length.1", "Fwd Avg Bytes/Bulk",
-        "Fwd Avg Packets/Bulk", "Fwd Avg Bulk Rate", "Bwd Avg Bytes/Bulk",
-        "Bwd Avg Packets/Bulk", "Bwd Avg Bulk Rate", "Subflow Fwd Packets",
-        "Subflow Fwd Bytes", "Subflow Bwd Packets", "Subflow Bwd Bytes",
-        "Init_Win_bytes_forward", "Init_Win_bytes_backward", "act_data_pkt_fwd",
-        "min_seg_size_forward", "Active Mean", "Active Std", "Active Max",
-        "Active Min", "Idle Mean", "Idle Std", "Idle Max", "Idle Min"
-    ]
+    Running aggregates over batches of predictions.
 
-    try:
-        # Load model and scaler
-        model = load_model(model_path)
-        if model is None:
-            raise ValueError("Model could not be loaded.")
-        
-        scaler = joblib.load(scaler_path)
-        print(f"✓ Loaded scaler from {os.path.basename(scaler_path)}")
+    Only per-class counts and a confidence sum are kept, so summarizing a
+    capture takes constant memory however many flows it has.
+    """
 
-        # Load CSV
-        df = pd.read_csv(csv_path)
-        print(f"✓ Loaded {len(df)} samples from {os.path.basename(csv_path)}")
+    def __init__(self, is_multiclass: bool = False):
+        self.is_multiclass = is_multiclass
+        self.n_samples = 0
+        self.class_counts = {}
+        self.confidence_sum = 0.0
 
-        # Ensure only numeric features
-        df_numeric = df.select_dtypes(include=['number']).fillna(0)
-        if df_numeric.empty:
-            raise ValueError("No numeric columns found in CSV for prediction.")
+    def update(self, labels: np.ndarray, confidences: np.ndarray):
+        self.n_samples += len(labels)
+        self.confidence_sum += float(np.sum(confidences))
+        for label, count in zip(*np.unique(labels, return_counts=True)):
+            label = int(label)
+            self.class_counts[label] = self.class_counts.get(label, 0) + int(count)
 
-        # Check for missing features
-        csv_features = df_numeric.columns.tolist()
-        missing_features = [f for f in ALL_78_FEATURES if f not in csv_features]
-        
-        # if missing_features:
-        #     raise ValueError(f"CSV is missing required features: {missing_features}... (showing first 10)")
-        
-        # Select ALL 78 features in EXACT order
-        df_aligned = df_numeric[ALL_78_FEATURES]
-        
-        print("🔧 Preprocessing data with all 78 features...")
-        df_scaled = scaler.transform(df_aligned)
-
-        # Predict
-        classification_type = "Multi-class" if is_multiclass else "Binary"
-        print(f"🔍 Evaluating {classification_type} classification...")
-        predictions = model.predict(df_scaled)
-
-        # Calculate confidence
-        if hasattr(model, "predict_proba"):
-            confidences = model.predict_proba(df_scaled)
-            avg_confidence = float(np.mean(np.max(confidences, axis=1)))
-        else:
-            avg_confidence = 0.8  # fallback
+    def result(self) -> Dict[str, Any]:
+        n_samples = self.n_samples
+        if n_samples == 0:
+            raise ValueError("No flows to predict on.")
+        avg_confidence = self.confidence_sum / n_samples
 
         # Analyze results
-        if is_multiclass:
+        if self.is_multiclass:
             # Multi-class analysis
-            unique_preds, counts = np.unique(predictions, return_counts=True)
             pred_distribution = {
-                MULTICLASS_LABELS.get(int(pred), f"Unknown-{pred}"): int(count)
-                for pred, count in zip(unique_preds, counts)
+                MULTICLASS_LABELS.get(pred, f"Unknown-{pred}"): count
+                for pred, count in sorted(self.class_counts.items())
             }
-            
+
             benign_count = pred_distribution.get("BENIGN", 0)
-            attack_count = len(df) - benign_count
-            
-            benign_ratio = benign_count / len(df)
-            anomaly_ratio = attack_count / len(df)
-            
+            attack_count = n_samples - benign_count
+
+            benign_ratio = benign_count / n_samples
+            anomaly_ratio = attack_count / n_samples
+
             overall_pred = "benign" if benign_ratio > 0.8 else "malicious"
             threat_level = "low" if overall_pred == "benign" else "high"
-            
+
             result = {
                 "classification_type": "multi-class",
-                "total_samples": len(df),
+                "total_samples": n_samples,
                 "avg_confidence": round(avg_confidence, 3),
                 "benign_ratio": float(round(benign_ratio, 3)),
                 "anomaly_ratio": float(round(anomaly_ratio, 3)),
@@ -152,18 +124,18 @@ def predict_from_csv(csv_path: str, model_path: str, scaler_path: str, is_multic
                     reverse=True
                 )[:5]
             }
-            
+
         else:
             # Binary analysis
-            benign_ratio = (predictions == 0).mean()  # 0 = BENIGN
-            anomaly_ratio = (predictions == 1).mean()  # 1 = ATTACK
-            
+            benign_ratio = self.class_counts.get(0, 0) / n_samples  # 0 = BENIGN
+            anomaly_ratio = self.class_counts.get(1, 0) / n_samples  # 1 = ATTACK
+
             overall_pred = "benign" if benign_ratio > 0.8 else "malicious"
             threat_level = "low" if overall_pred == "benign" else "high"
-            
+
             result = {
                 "classification_type": "binary",
-                "total_samples": len(df),
+                "total_samples": n_samples,
                 "avg_confidence": round(avg_confidence, 3),
                 "benign_ratio": float(round(benign_ratio, 3)),
                 "anomaly_ratio": float(round(anomaly_ratio, 3)),
@@ -171,10 +143,216 @@ def predict_from_csv(csv_path: str, model_path: str, scaler_path: str, is_multic
                 "threat_level": threat_level,
             }
 
-        print("✅ Final Result Summary")
-        print(result)
         return result
 
+
+def scale_features(scaler, features: np.ndarray, feature_names: list) -> np.ndarray:
+    """
+    Apply the scaler to a matrix whose columns are feature_names.
+
+    The scaler was fitted on all 78 features; for a subset (e.g. the top-20
+    model) each column is standardized with its own mean and scale.
+    """
+    scaler_features = list(getattr(scaler, "feature_names_in_", ALL_78_FEATURES))
+    if list(feature_names) == scaler_features:
+        return scaler.transform(features)
+    columns = [scaler_features.index(name) for name in feature_names]
+    X_scaled = np.array(features, dtype=np.float64)
+    if getattr(scaler, "mean_", None) is not None:
+        X_scaled -= scaler.mean_[columns]
+    if getattr(scaler, "scale_", None) is not None:
+        X_scaled /= scaler.scale_[columns]
+    return X_scaled
+
+
+def predict_batch(features: np.ndarray, model, scaler):
+    """
+    Scale one feature batch (columns in model_features(model) order) and classify it.
+
+    The model runs once: labels are the argmax of predict_proba, which is what
+    predict() would return. With FAST_INFERENCE, supported models score raw
+    features through fast_inference (scaler folded into the model).
+    Returns (labels, confidences).
+    """
+    fast = get_fast_predictor(model, scaler) if FAST_INFERENCE else None
+    if fast is not None:
+        probabilities = fast.predict_proba(features)
+        best = np.argmax(probabilities, axis=1)
+        return fast.classes_[best], probabilities[np.arange(len(best)), best]
+
+    with warnings.catch_warnings():
+        # Scaler and models were fitted on a named DataFrame; a bare matrix in
+        # the same column order is equivalent
+        warnings.filterwarnings("ignore", message="X does not have valid feature names")
+        X_scaled = scale_features(scaler, features, model_features(model))
+        if not hasattr(model, "predict_proba"):
+            return model.predict(X_scaled), np.full(len(X_scaled), 0.8)  # fallback confidence
+        probabilities = model.predict_proba(X_scaled)
+    best = np.argmax(probabilities, axis=1)
+    classes = getattr(model, "classes_", None)
+    labels = best if classes is None else np.asarray(classes)[best]
+    return labels, probabilities[np.arange(len(best)), best]
+
+
+# Served to the job workers by the inference process (see INFERENCE_SERVICE)
+inference_service = InferenceService(predict_batch)
+
+
+def batch_scorer(model_path: str, scaler_path: str):
+    """
+    Function scoring one batch like predict_batch(features, model, scaler).
+
+    With INFERENCE_SERVICE and a shared inference process to send to, batches
+    go there to be merged with other jobs' batches; otherwise (or while it is
+    unreachable) they are scored in this process.
+    """
+    client = remote_client() if INFERENCE_SERVICE else None
+    if client is None:
+        return predict_batch
+
+    def score(features: np.ndarray, model, scaler):
+        result = client.predict(features, model_path, scaler_path)
+        return predict_batch(features, model, scaler) if result is None else result
+    return score
+
+
+def inference_stats() -> dict:
+    """Micro-batching counters of the shared inference process, if there is one"""
+    client = remote_client() if INFERENCE_SERVICE else None
+    stats = client.stats() if client is not None else None
+    if stats is None:
+        return {"shared": False}
+    return {"shared": True, **stats}
+
+
+def _predict_batches(batches, model, scaler, is_multiclass: bool, on_batch=None, score=predict_batch) -> Dict[str, Any]:
+    """
+    Run score (predict_batch, or a batch_scorer) over an iterable of feature
+    batches and summarize incrementally.
+
+    on_batch(labels, confidences), if given, receives every batch's per-flow predictions.
+    """
+    classification_type = "Multi-class" if is_multiclass else "Binary"
+    print(f"🔍 Evaluating {classification_type} classification in batches of up to {PREDICT_BATCH_SIZE} flows...")
+    summary = PredictionSummary(is_multiclass)
+    for batch in batches:
+        labels, confidences = score(batch, model, scaler)
+        summary.update(labels, confidences)
+        if on_batch is not None:
+            on_batch(labels, confidences)
+
+    result = summary.result()
+    print("✅ Final Result Summary")
+    print(result)
+    return result
+
+
+def _predict(features: np.ndarray, model, scaler, is_multiclass: bool, on_batch=None, score=predict_batch) -> Dict[str, Any]:
+    """Scale a feature matrix in model_features(model) order, run the model and summarize."""
+    batches = (features[i:i + PREDICT_BATCH_SIZE] for i in range(0, len(features), PREDICT_BATCH_SIZE))
+    return _predict_batches(batches, model, scaler, is_multiclass, on_batch, score)
+
+
+def predict_from_array(features: np.ndarray, model_path: str, scaler_path: str, is_multiclass: bool = False, feature_names: list = None, on_batch=None) -> Dict[str, Any]:
+    """
+    Runs model inference on an in-memory feature matrix (no CSV round trip).
+
+    Args:
+        features: (n_flows, n_features) matrix as returned by
+                  pcap_converter.extract_flow_features
+        model_path: Path to trained model (.joblib)
+        scaler_path: Path to fitted scaler (.joblib)
+        is_multiclass: If True, performs multi-class classification (15 classes)
+                      If False, performs binary classification (BENIGN vs ATTACK)
+        feature_names: Columns of features (default ALL_78_FEATURES); it must
+                      include every feature the model uses
+        on_batch: Optional callback receiving (labels, confidences) for each
+                  batch of flows, in row order
+
+    Returns:
+        Dictionary containing predictions, confidence scores, and analysis results
+    """
+    try:
+        feature_names = list(ALL_78_FEATURES if feature_names is None else feature_names)
+        features = np.asarray(features, dtype=np.float64)
+        if features.ndim != 2 or features.shape[1] != len(feature_names):
+            raise ValueError(f"Expected a (n, {len(feature_names)}) feature matrix, got {features.shape}")
+        if len(features) == 0:
+            raise ValueError("No flows to predict on.")
+
+        model, scaler = _load_model_and_scaler(model_path, scaler_path)
+        needed = model_features(model)
+        if needed != feature_names:
+            missing = [name for name in needed if name not in feature_names]
+            if missing:
+                raise ValueError(f"Feature matrix is missing features the model needs: {missing[:10]}")
+            features = features[:, [feature_names.index(name) for name in needed]]
+        print(f"✓ Received {len(features)} samples")
+        return _predict(np.nan_to_num(features), model, scaler, is_multiclass, on_batch, batch_scorer(model_path, scaler_path))
+
+    except Exception as e:
+        print(f"❌ Error during prediction: {e}")
+        return {"error": str(e)}
+
+
+def predict_from_store(store_path: str, model_path: str, scaler_path: str, is_multiclass: bool = False) -> Dict[str, Any]:
+    """
+    Re-scores flows saved by feature_store.write_flow_features.
+
+    Only the columns the model uses are read from the Parquet file, one batch
+    at a time; see predict_from_array for the arguments and return value.
+    """
+    try:
+        model, scaler = _load_model_and_scaler(model_path, scaler_path)
+        print(f"✓ Streaming samples from {os.path.basename(store_path)}")
+        columns = model_features(model)
+        batches = (np.nan_to_num(batch) for batch in iter_feature_batches(store_path, columns, PREDICT_BATCH_SIZE))
+        return _predict_batches(batches, model, scaler, is_multiclass, score=batch_scorer(model_path, scaler_path))
+
+    except Exception as e:
+        print(f"❌ Error during prediction: {e}")
+        return {"error": str(e)}
+
+
+def _csv_batches(csv_path: str, columns: list):
+    """Feature matrices with the given columns, PREDICT_BATCH_SIZE rows at a time."""
+    wanted = set(columns)
+    for chunk in pd.read_csv(csv_path, usecols=lambda column: column in wanted, chunksize=PREDICT_BATCH_SIZE):
+        # Ensure only numeric features
+        df_numeric = chunk.select_dtypes(include=['number']).fillna(0)
+        if df_numeric.empty:
+            raise ValueError("No numeric columns found in CSV for prediction.")
+
+        # Select the model's features in EXACT order
+        yield df_numeric[columns].to_numpy(dtype=np.float64)
+
+
+def predict_from_csv(csv_path: str, model_path: str, scaler_path: str, is_multiclass: bool = False) -> Dict[str, Any]:
+    """
+    Runs model inference on the given CSV with support for both binary and multi-class classification.
+
+    The CSV is read and scored PREDICT_BATCH_SIZE rows at a time, so memory use
+    does not grow with the number of flows.
+    
+    Args:
+        csv_path: Path to input CSV file (must have every feature the model uses)
+        model_path: Path to trained model (.joblib)
+        scaler_path: Path to fitted scaler (.joblib)
+        is_multiclass: If True, performs multi-class classification (15 classes)
+                      If False, performs binary classification (BENIGN vs ATTACK)
+    
+    Returns:
+        Dictionary containing predictions, confidence scores, and analysis results
+    """
+    
+    try:
+        # Load model and scaler
+        model, scaler = _load_model_and_scaler(model_path, scaler_path)
+
+        print(f"✓ Streaming samples from {os.path.basename(csv_path)}")
+        return _predict_batches(_csv_batches(csv_path, model_features(model)), model, scaler, is_multiclass,
+                                score=batch_scorer(model_path, scaler_path))
+
     except Exception as e:
         print(f"❌ Error during prediction: {e}")
         return {"error": str(e)}
@@ -0,0 +1,132 @@
+import os
+import threading
+import time
+from datetime import datetime
+import joblib
+from app.utils.features import ALL_78_FEATURES
+
+# Directory model and scaler names are resolved against
+MODELS_DIR = os.getenv("MODELS_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models"))
+# Artifacts loaded when the app starts (comma separated); anything else loads on first use
+PRELOAD_MODELS = [
+    name.strip()
+    for name in os.getenv("PRELOAD_MODELS", "xgboost_model.joblib,xgboost_top20.joblib,lr.joblib,standard_scaler.pkl").split(",")
+    if name.strip()
+]
+
+
+def model_features(model) -> list:
+    """Features a model expects, in order: its feature_names_in_, else all 78."""
+    names = getattr(model, "feature_names_in_", None)
+    return ALL_78_FEATURES if names is None else [str(name) for name in names]
+
+
+def _rss_bytes():
+    """Resident set size of this process (Linux only, otherwise None)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class LoadedArtifact:
+    """A deserialized model/scaler and what it cost to load."""
+
+    def __init__(self, path: str, obj, mtime: float, file_bytes: int, load_seconds: float, memory_bytes):
+        self.path = path
+        self.obj = obj
+        self.mtime = mtime
+        self.file_bytes = file_bytes
+        self.load_seconds = load_seconds
+        # RSS growth across the load: approximate (other threads allocate too)
+        self.memory_bytes = memory_bytes
+        self.loaded_at = datetime.utcnow()
+        self.loads = 1
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "type": type(self.obj).__name__,
+            "n_features": getattr(self.obj, "n_features_in_", None),
+            "file_bytes": self.file_bytes,
+            "memory_bytes": self.memory_bytes,
+            "load_seconds": round(self.load_seconds, 4),
+            "loaded_at": self.loaded_at.isoformat(),
+            "loads": self.loads,
+        }
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of joblib artifacts (models and scalers).
+
+    Each file is deserialized once and kept in memory. Every get() stats the
+    file and reloads it when its mtime has changed, so replacing a model on
+    disk takes effect on the next job without restarting the server. If a
+    reload fails (e.g. the file is still being copied) the previous version
+    keeps serving.
+    """
+
+    def __init__(self, models_dir: str = None):
+        self.models_dir = models_dir or MODELS_DIR
+        self.artifacts = {}
+        self.lock = threading.Lock()
+
+    def resolve(self, name: str) -> str:
+        """Absolute path for a model name: as given if it exists, otherwise under models_dir."""
+        if os.path.exists(name):
+            return os.path.abspath(name)
+        return os.path.join(self.models_dir, name)
+
+    def get(self, name: str):
+        """Return the loaded object for a model/scaler file, (re)loading it if needed."""
+        path = self.resolve(name)
+        with self.lock:
+            loaded = self.artifacts.get(path)
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                if loaded is not None:
+                    return loaded.obj
+                raise FileNotFoundError(f"Model file not found: {path}")
+            if loaded is not None and loaded.mtime == mtime:
+                return loaded.obj
+            try:
+                artifact = self._load(path, mtime)
+            except Exception as e:
+                if loaded is None:
+                    raise
+                print(f"⚠️ Reload of {os.path.basename(path)} failed, keeping previous version: {e}")
+                return loaded.obj
+            if loaded is not None:
+                artifact.loads = loaded.loads + 1
+                print(f"🔄 Reloaded {os.path.basename(path)} (file changed)")
+            self.artifacts[path] = artifact
+            return artifact.obj
+
+    def _load(self, path: str, mtime: float) -> LoadedArtifact:
+        print(f"📦 Loading model from {path} ...")
+        rss_before = _rss_bytes()
+        started = time.perf_counter()
+        obj = joblib.load(path)
+        load_seconds = time.perf_counter() - started
+        rss_after = _rss_bytes()
+        memory_bytes = rss_after - rss_before if rss_before is not None and rss_after is not None else None
+        print(f"✅ Loaded {os.path.basename(path)} in {load_seconds:.3f}s")
+        return LoadedArtifact(path, obj, mtime, os.path.getsize(path), load_seconds, memory_bytes)
+
+    def preload(self, names: list = None):
+        """Load the given (default PRELOAD_MODELS) artifacts now; missing files are skipped."""
+        for name in PRELOAD_MODELS if names is None else names:
+            try:
+                self.get(name)
+            except Exception as e:
+                print(f"⚠️ Could not preload {name}: {e}")
+
+    def stats(self) -> list:
+        with self.lock:
+            return [artifact.stats() for artifact in self.artifacts.values()]
+
+
+registry = ModelRegistry()
@@ -0,0 +1,338 @@
+import ipaddress
+import mmap
+import os
+import socket
+import struct
+import time
+from scapy.all import conf, IP, IPv6, TCP, UDP
+from scapy.utils import RawPcapReader
+
+# Link-layer types decoded directly from the frame bytes
+DLT_NULL = 0
+DLT_EN10MB = 1
+DLT_RAW = 101
+DLT_LOOP = 108
+DLT_LINUX_SLL = 113
+DLT_IPV4 = 228
+DLT_IPV6 = 229
+DLT_LINUX_SLL2 = 276
+
+ETH_P_IP = 0x0800
+ETH_P_IPV6 = 0x86DD
+VLAN_ETHERTYPES = (0x8100, 0x88A8, 0x9100)
+
+PROTO_TCP = 6
+PROTO_UDP = 17
+# IPv6 extension headers that are skipped to reach the transport header
+IPV6_EXT_HEADERS = (0, 43, 60)
+IPV6_FRAGMENT = 44
+IPV6_AH = 51
+
+# IPv4 addresses are stored in the IPv4-mapped IPv6 range (::ffff:a.b.c.d) so
+# both families share one integer address space
+IPV4_MAPPED = 0xFFFF << 32
+
+_u16 = struct.Struct("!H")
+_ports = struct.Struct("!HH")
+_addrs4 = struct.Struct("!II")
+
+# Classic libpcap stream format (what `tcpdump -w -` writes)
+PCAP_MAGIC_USEC = 0xA1B2C3D4
+PCAP_MAGIC_NSEC = 0xA1B23C4D
+PCAPNG_MAGIC = 0x0A0D0D0A
+PCAP_GLOBAL_HEADER_LEN = 24
+PCAP_RECORD_HEADER_LEN = 16
+
+
+class UnsupportedLinkType(ValueError):
+    """decode_frame cannot parse this link type; decode the frame with decode_with_scapy instead."""
+
+    def __init__(self, linktype: int):
+        super().__init__(f"Unsupported link type {linktype}")
+        self.linktype = linktype
+
+
+def format_ip(address: int) -> str:
+    """Render an integer address from decode_frame as an IPv4 or IPv6 string."""
+    ip = ipaddress.IPv6Address(address)
+    return str(ip.ipv4_mapped or ip)
+
+
+def iter_raw_frames(pcap_path: str):
+    """
+    Stream (timestamp, linktype, frame_bytes) from a pcap or pcapng capture.
+
+    Frames are returned as raw bytes; no scapy dissection happens here.
+    """
+    reader = RawPcapReader(pcap_path)  # picks the pcapng reader from the file magic
+    try:
+        if hasattr(reader, "interfaces"):
+            # pcapng: linktype and timestamp resolution come per interface
+            for data, meta in reader:
+                ts = ((meta.tshigh << 32) + meta.tslow) / meta.tsresol
+                yield ts, meta.linktype, data
+        else:
+            linktype = reader.linktype
+            scale = 1_000_000_000 if reader.nano else 1_000_000
+            for data, meta in reader:
+                yield (meta.sec * scale + meta.usec) / scale, linktype, data
+    finally:
+        reader.close()
+
+
+def _network_offset(linktype: int, data: bytes):
+    """Return (ethertype, offset) of the network header, or None if not IP."""
+    if linktype == DLT_EN10MB:
+        if len(data) < 14:
+            return None
+        ethertype = _u16.unpack_from(data, 12)[0]
+        offset = 14
+        while ethertype in VLAN_ETHERTYPES and len(data) >= offset + 4:
+            ethertype = _u16.unpack_from(data, offset + 2)[0]
+            offset += 4
+        return ethertype, offset
+    if linktype in (DLT_RAW, DLT_IPV4, DLT_IPV6):
+        if not data:
+            return None
+        version = data[0] >> 4
+        return (ETH_P_IP if version == 4 else ETH_P_IPV6 if version == 6 else None), 0
+    if linktype in (DLT_NULL, DLT_LOOP):
+        # 4-byte address family in host (NULL) or network (LOOP) byte order; IPv6
+        # families differ between BSDs, so sniff the version nibble instead
+        if len(data) < 5:
+            return None
+        version = data[4] >> 4
+        return (ETH_P_IP if version == 4 else ETH_P_IPV6 if version == 6 else None), 4
+    if linktype == DLT_LINUX_SLL:
+        if len(data) < 16:
+            return None
+        return _u16.unpack_from(data, 14)[0], 16
+    if linktype == DLT_LINUX_SLL2:
+        if len(data) < 20:
+            return None
+        return _u16.unpack_from(data, 0)[0], 20
+    raise UnsupportedLinkType(linktype)
+
+
+def decode_frame(linktype: int, data: bytes):
+    """
+    Decode Ethernet/IPv4/IPv6/TCP/UDP headers straight from the frame bytes.
+
+    Returns (src, dst, sport, dport, proto, tcp_flags, tcp_header_len, tcp_window)
+    with addresses as integers (see IPV4_MAPPED), or None if the frame does not
+    carry IP. tcp_flags is None when the packet is not TCP. Raises
+    UnsupportedLinkType for link types this decoder does not understand.
+    """
+    net = _network_offset(linktype, data)
+    if net is None:
+        return None
+    ethertype, off = net
+
+    if ethertype == ETH_P_IP:
+        if len(data) < off + 20:
+            return None
+        ihl = (data[off] & 0x0F) * 4
+        proto = data[off + 9]
+        src, dst = _addrs4.unpack_from(data, off + 12)
+        src |= IPV4_MAPPED
+        dst |= IPV4_MAPPED
+        # Only the first fragment carries the transport header
+        if _u16.unpack_from(data, off + 6)[0] & 0x1FFF:
+            return src, dst, 0, 0, proto, None, 0, 0
+        l4 = off + ihl
+    elif ethertype == ETH_P_IPV6:
+        if len(data) < off + 40:
+            return None
+        proto = data[off + 6]
+        src = int.from_bytes(data[off + 8:off + 24], "big")
+        dst = int.from_bytes(data[off + 24:off + 40], "big")
+        l4 = off + 40
+        while True:
+            if proto in IPV6_EXT_HEADERS:
+                if len(data) < l4 + 2:
+                    break
+                proto, l4 = data[l4], l4 + (data[l4 + 1] + 1) * 8
+            elif proto == IPV6_AH:
+                if len(data) < l4 + 2:
+                    break
+                proto, l4 = data[l4], l4 + (data[l4 + 1] + 2) * 4
+            elif proto == IPV6_FRAGMENT:
+                if len(data) < l4 + 8:
+                    break
+                if _u16.unpack_from(data, l4 + 2)[0] & 0xFFF8:
+                    return src, dst, 0, 0, data[l4], None, 0, 0
+                proto, l4 = data[l4], l4 + 8
+            else:
+                break
+    else:
+        return None
+
+    if proto == PROTO_TCP and len(data) >= l4 + 16:
+        sport, dport = _ports.unpack_from(data, l4)
+        flags = ((data[l4 + 12] & 0x01) << 8) | data[l4 + 13]
+        window = _u16.unpack_from(data, l4 + 14)[0]
+        return src, dst, sport, dport, proto, flags, (data[l4 + 12] >> 4) * 4, window
+    if proto == PROTO_UDP and len(data) >= l4 + 4:
+        sport, dport = _ports.unpack_from(data, l4)
+        return src, dst, sport, dport, proto, None, 0, 0
+    return src, dst, 0, 0, proto, None, 0, 0
+
+
+def decode_with_scapy(linktype: int, data: bytes):
+    """Fallback for link types decode_frame cannot handle; same return shape."""
+    cls = conf.l2types.num2layer.get(linktype, conf.raw_layer)
+    pkt = cls(data)
+    if IP in pkt:
+        ip = pkt[IP]
+        src = int.from_bytes(socket.inet_aton(ip.src), "big") | IPV4_MAPPED
+        dst = int.from_bytes(socket.inet_aton(ip.dst), "big") | IPV4_MAPPED
+        proto = ip.proto
+    elif IPv6 in pkt:
+        ip = pkt[IPv6]
+        src = int.from_bytes(socket.inet_pton(socket.AF_INET6, ip.src), "big")
+        dst = int.from_bytes(socket.inet_pton(socket.AF_INET6, ip.dst), "big")
+        proto = ip.nh
+    else:
+        return None
+    if TCP in pkt:
+        tcp = pkt[TCP]
+        return src, dst, tcp.sport, tcp.dport, PROTO_TCP, int(tcp.flags), tcp.dataofs * 4, tcp.window
+    if UDP in pkt:
+        return src, dst, pkt[UDP].sport, pkt[UDP].dport, PROTO_UDP, None, 0, 0
+    return src, dst, 0, 0, proto, None, 0, 0
+
+
+def _read_exact(stream, size: int, follow: bool, poll_interval: float):
+    """Read exactly size bytes; None at end of stream (unless following it)."""
+    data = b""
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if chunk:
+            data += chunk
+        elif follow:
+            time.sleep(poll_interval)  # growing file or writer-less FIFO: wait for more
+        else:
+            return None
+    return data
+
+
+def is_pcap_stream(header: bytes) -> bool:
+    """Whether bytes start with a classic pcap header (readable by iter_stream_frames)."""
+    return len(header) >= 4 and (
+        struct.unpack_from("<I", header)[0] in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC)
+        or struct.unpack_from(">I", header)[0] in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC)
+    )
+
+
+def pcap_format(header: bytes):
+    """(byte order, timestamp fraction scale, linktype) from a classic pcap file header."""
+    for endian in ("<", ">"):
+        magic = struct.unpack_from(endian + "I", header)[0]
+        if magic in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC):
+            break
+    else:
+        if struct.unpack_from("<I", header)[0] == PCAPNG_MAGIC:
+            raise ValueError("pcapng streams are not supported; write classic pcap (e.g. tcpdump -w -)")
+        raise ValueError("Not a pcap stream")
+    scale = 1_000_000_000 if magic == PCAP_MAGIC_NSEC else 1_000_000
+    linktype = struct.unpack_from(endian + "I", header, 20)[0] & 0x0FFFFFFF
+    return endian, scale, linktype
+
+
+def iter_stream_frames(stream, follow: bool = False, poll_interval: float = 0.2):
+    """
+    Stream (timestamp, linktype, frame_bytes) from a classic pcap byte stream.
+
+    stream is any binary file object: stdin, a named pipe or a capture file
+    that is still being written. Records are read as they arrive, so this
+    never needs to seek. At end of stream iteration stops, or with follow=True
+    waits for more data (like `tail -f`). pcapng streams are not supported.
+    """
+    header = _read_exact(stream, PCAP_GLOBAL_HEADER_LEN, follow, poll_interval)
+    if header is None:
+        return
+    endian, scale, linktype = pcap_format(header)
+    record = struct.Struct(endian + "IIII")
+    while True:
+        record_header = _read_exact(stream, PCAP_RECORD_HEADER_LEN, follow, poll_interval)
+        if record_header is None:
+            return
+        sec, frac, incl_len, _ = record.unpack(record_header)
+        data = _read_exact(stream, incl_len, follow, poll_interval)
+        if data is None:
+            return  # truncated last record
+        yield (sec * scale + frac) / scale, linktype, data
+
+
+def pcap_record_ranges(pcap_path: str, parts: int):
+    """
+    Split a classic pcap file into up to `parts` byte ranges of about equal
+    size, each starting on a record boundary, as (start, end) offsets for
+    iter_pcap_range. Returns None for other formats (pcapng is not split).
+
+    Only the 16-byte record headers are read to find the boundaries.
+    """
+    size = os.path.getsize(pcap_path)
+    with open(pcap_path, "rb") as f:
+        header = f.read(PCAP_GLOBAL_HEADER_LEN)
+        if len(header) < PCAP_GLOBAL_HEADER_LEN or not is_pcap_stream(header):
+            return None
+        if size < PCAP_GLOBAL_HEADER_LEN + PCAP_RECORD_HEADER_LEN:
+            return [(PCAP_GLOBAL_HEADER_LEN, size)]
+        incl_len = struct.Struct(pcap_format(header)[0] + "I").unpack_from
+        step = (size - PCAP_GLOBAL_HEADER_LEN) / max(parts, 1)
+        bounds = [PCAP_GLOBAL_HEADER_LEN]
+        offset, cut = PCAP_GLOBAL_HEADER_LEN, PCAP_GLOBAL_HEADER_LEN + step
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            while offset + PCAP_RECORD_HEADER_LEN <= size:
+                if offset >= cut:
+                    bounds.append(offset)
+                    cut = bounds[0] + step * len(bounds)
+                offset += PCAP_RECORD_HEADER_LEN + incl_len(mm, offset + 8)[0]
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def iter_pcap_range(pcap_path: str, start: int, end: int):
+    """
+    Stream (timestamp, linktype, frame_bytes) from the records of a classic pcap
+    file that start in [start, end); start must be a record boundary (see
+    pcap_record_ranges).
+    """
+    with open(pcap_path, "rb") as f:
+        endian, scale, linktype = pcap_format(f.read(PCAP_GLOBAL_HEADER_LEN))
+        record = struct.Struct(endian + "IIII")
+        f.seek(start)
+        offset = start
+        while offset < end:
+            record_header = f.read(PCAP_RECORD_HEADER_LEN)
+            if len(record_header) < PCAP_RECORD_HEADER_LEN:
+                return
+            sec, frac, incl_len, _ = record.unpack(record_header)
+            data = f.read(incl_len)
+            if len(data) < incl_len:
+                return  # truncated last record
+            offset += PCAP_RECORD_HEADER_LEN + incl_len
+            yield (sec * scale + frac) / scale, linktype, data
+
+
+def decode_records(frames):
+    """
+    Decode (timestamp, linktype, frame_bytes) into (timestamp, length,
+    decoded_headers) for every IP packet.
+
+    Headers come from decode_frame; frames with unsupported link types are
+    dissected with scapy instead.
+    """
+    for ts, linktype, data in frames:
+        try:
+            headers = decode_frame(linktype, data)
+        except UnsupportedLinkType:
+            headers = decode_with_scapy(linktype, data)
+        if headers is not None:
+            yield ts, len(data), headers
+
+
+def iter_packet_records(pcap_path: str):
+    """Stream (timestamp, length, decoded_headers) for every IP packet in a capture."""
+    return decode_records(iter_raw_frames(pcap_path))
@@ -1,262 +1,275 @@
 import os
-import pandas as pd
+import multiprocessing
+import pickle
+import tempfile
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Tuple
 import numpy as np
-from scapy.all import *
+import pandas as pd
 from tqdm import tqdm
-from collections import defaultdict
+from app.utils.batch_features import extract_flow_matrix_batch
+from app.utils.features import ALL_78_FEATURES, ALL_FEATURE_GROUPS, FLOW_METADATA_COLUMNS, feature_groups_for, feature_indices
+from app.utils.flow_state import FlowState
+from app.utils.flow_table import FlowTable
+from app.utils.packet_decoder import decode_records, format_ip, iter_packet_records, iter_pcap_range, iter_stream_frames, pcap_record_ranges
+
+# Worker processes used for feature extraction (1 = extract in the calling process)
+FEATURE_WORKERS = int(os.getenv("FEATURE_WORKERS", "1"))
+# "stream": per-flow online accumulators; "batch": columnar NumPy engine (holds
+# every packet's header fields in memory, single process)
+FEATURE_ENGINE = os.getenv("FEATURE_ENGINE", "stream")
+FLOW_DURATION_INDEX = ALL_78_FEATURES.index("Flow Duration")
+# Packets between two progress callbacks
+PROGRESS_PACKETS = 4096
+# Classic pcap framing around packet data: file header, per-record header
+PCAP_HEADER_BYTES, PCAP_RECORD_BYTES = 24, 16
+# Decoded packets pickled per write when spilling shards (workers > 1)
+SHARD_BATCH_PACKETS = 16384
+
+
+def flow_shard(headers, shards: int) -> int:
+    """Shard index of a decoded packet; both directions of a flow share a shard."""
+    src, dst, sport, dport = headers[:4]
+    return ((src << 16 | sport) ^ (dst << 16 | dport)) % shards
+
+
+def iter_flows(pcap_path: str, active_timeout: float = None, idle_timeout: float = None, groups: frozenset = ALL_FEATURE_GROUPS, stream=None, progress=None):
+    """
+    Stream finished flows from a capture as (flow_key, FlowState).
+
+    Flows are emitted as soon as they end (timeout, FIN or RST), before the rest
+    of the capture has been read; whatever is still open at EOF comes last.
+    groups limits the optional feature passes (see FlowState). With stream (a
+    binary file object holding classic pcap) packets are read from it instead
+    of pcap_path. progress(packets, bytes read, flows finished) is called every
+    PROGRESS_PACKETS packets and at the end; bytes read assumes classic pcap
+    framing.
+
+    Flow statistics assume packets in timestamp order; packets that arrive
+    earlier than the latest one of their flow are folded in at that latest
+    time (see FlowTable), and their count is reported at the end.
+    """
+    records = iter_packet_records(pcap_path) if stream is None else decode_records(iter_stream_frames(stream))
+    records = tqdm(records, desc="Processing packets", unit="pkt")
+    return iter_record_flows(records, active_timeout, idle_timeout, groups, progress)
+
+
+def iter_record_flows(records, active_timeout: float = None, idle_timeout: float = None, groups: frozenset = ALL_FEATURE_GROUPS, progress=None):
+    """iter_flows over already decoded (timestamp, length, headers) packet records."""
+    table = FlowTable(active_timeout, idle_timeout, partial(FlowState, groups=groups))
+    packets, bytes_read, flows = 0, PCAP_HEADER_BYTES, 0
+    for ts, length, headers in records:
+        table.add(ts, length, headers)
+        if table.finished:
+            finished = list(table.drain())
+            flows += len(finished)
+            yield from finished
+        if progress is not None:
+            packets += 1
+            bytes_read += PCAP_RECORD_BYTES + length
+            if packets % PROGRESS_PACKETS == 0:
+                progress(packets, bytes_read, flows)
+    remaining = list(table.flush())
+    if table.reordered:
+        print(f"⚠️ {table.reordered} packets were older than earlier packets of their flow; counted at the flow's latest time")
+    if progress is not None:
+        progress(packets, bytes_read, flows + len(remaining))
+    yield from remaining
+
 
-def convert_pcap_to_csv(pcap_path: str, output_dir: str) -> str:
+def _collect_flows(flows) -> Tuple[np.ndarray, list]:
     """
-    Convert a PCAP file into a detailed flow-based CSV with all 78 CICIDS-style features.
+    Feature matrix and (key, initiator, start) tuples of (key, FlowState)
+    pairs, in the order given.
+
+    Each flow's features go into one flat float64 buffer as soon as the flow
+    ends, so no per-flow Python rows are kept: the table costs what the
+    returned matrix does.
+    """
+    features, meta = array("d"), []
+    for key, flow in flows:
+        features.extend(flow.features())
+        meta.append((key, flow.initiator, flow.start))
+    return np.frombuffer(features, dtype=np.float64).reshape(len(meta), len(ALL_78_FEATURES)), meta
+
+
+def _in_flow_order(features: np.ndarray, meta: list) -> Tuple[np.ndarray, list]:
+    """Sort rows by (flow start, flow key); stable, so flows sharing both keep their emission order."""
+    order = sorted(range(len(meta)), key=lambda i: (meta[i][2], meta[i][0]))
+    return features[order], [meta[i] for i in order]
+
+
+def _decode_part(pcap_path: str, part: int, byte_range, shards: int, out_dir: str) -> int:
+    """
+    Decode one byte range of a capture (or all of it, with byte_range None)
+    and append its packets to one spill file per flow shard,
+    <out_dir>/<part>-<shard>.pkl, as pickled batches of packet records.
+    """
+    records = iter_packet_records(pcap_path) if byte_range is None else decode_records(iter_pcap_range(pcap_path, *byte_range))
+    files = [open(os.path.join(out_dir, f"{part}-{shard}.pkl"), "wb") for shard in range(shards)]
+    batches = [[] for _ in range(shards)]
+    packets = 0
+    try:
+        for record in records:
+            shard = flow_shard(record[2], shards)
+            batch = batches[shard]
+            batch.append(record)
+            if len(batch) >= SHARD_BATCH_PACKETS:
+                pickle.dump(batch, files[shard], pickle.HIGHEST_PROTOCOL)
+                batch.clear()
+            packets += 1
+        for f, batch in zip(files, batches):
+            if batch:
+                pickle.dump(batch, f, pickle.HIGHEST_PROTOCOL)
+    finally:
+        for f in files:
+            f.close()
+    return packets
+
+
+def _read_spill(paths: list):
+    """Packet records from spill files, file by file and batch by batch."""
+    for path in paths:
+        with open(path, "rb") as f:
+            while True:
+                try:
+                    yield from pickle.load(f)
+                except EOFError:
+                    break
+
+
+def _extract_shard(paths: list, active_timeout: float, idle_timeout: float, groups: frozenset) -> Tuple[np.ndarray, list]:
+    """Build one shard's flows from its spill files (in capture order); rows in emission order."""
+    return _collect_flows(iter_record_flows(_read_spill(paths), active_timeout, idle_timeout, groups))
+
+
+def _extract_sharded(pcap_path: str, active_timeout: float, idle_timeout: float, workers: int, groups: frozenset) -> Tuple[np.ndarray, list]:
     """
+    Two-stage parallel extraction; every packet is read and decoded once.
 
-    if not os.path.exists(pcap_path):
+    1. The capture is split into byte ranges at record boundaries and each
+       worker decodes one range, spilling its packets to per-shard files
+       (shard = symmetric hash of the flow's endpoints). pcapng captures are
+       not split: one worker decodes the whole capture.
+    2. Each worker reads one shard's spill files in range order, which is
+       capture order, and builds that shard's flows.
+
+    A flow never spans two shards, so after sorting the rows match the
+    serial path exactly.
+    """
+    ranges = pcap_record_ranges(pcap_path, workers) or [None]
+    # spawn: forking the multi-threaded API server process is not safe
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    with pool, tempfile.TemporaryDirectory(prefix="ids_shards_") as spill_dir:
+        list(pool.map(_decode_part, [pcap_path] * len(ranges), range(len(ranges)), ranges, [workers] * len(ranges), [spill_dir] * len(ranges)))
+        shard_paths = [[os.path.join(spill_dir, f"{part}-{shard}.pkl") for part in range(len(ranges))] for shard in range(workers)]
+        parts = list(pool.map(_extract_shard, shard_paths, [active_timeout] * workers, [idle_timeout] * workers, [groups] * workers))
+    features = np.concatenate([features for features, _ in parts])
+    return _in_flow_order(features, [row for _, meta in parts for row in meta])
+
+
+def flow_metadata(flows: list, features: np.ndarray) -> pd.DataFrame:
+    """
+    Build the flow-metadata table from (key, initiator, start) tuples and the
+    matching rows of the full (ALL_78_FEATURES) feature matrix.
+
+    Source is the endpoint that opened the flow, matching the forward direction
+    of the features.
+    """
+    records = []
+    for (lo, hi, proto), initiator, start in flows:
+        responder = hi if lo == initiator else lo
+        records.append((
+            format_ip(initiator >> 16), initiator & 0xFFFF,
+            format_ip(responder >> 16), responder & 0xFFFF,
+            proto, start,
+        ))
+    meta = pd.DataFrame(records, columns=FLOW_METADATA_COLUMNS[:-1])
+    meta["Duration"] = features[:, FLOW_DURATION_INDEX]
+    return meta
+
+
+def extract_flow_features(pcap_path: str, active_timeout: float = None, idle_timeout: float = None, workers: int = None, engine: str = None, feature_names: list = None, stream=None, progress=None) -> Tuple[np.ndarray, pd.DataFrame]:
+    """
+    Compute the 78 features for every flow in a capture, in memory.
+
+    Returns a C-contiguous float64 matrix in ALL_78_FEATURES order and a
+    flow-metadata DataFrame (FLOW_METADATA_COLUMNS) with one row per flow.
+
+    With feature_names (e.g. a model's feature_names_in_) the matrix holds just
+    those columns, in that order, and the optional passes (IAT, active/idle,
+    header lengths, flags; see FEATURE_GROUPS) run only if one of the
+    requested features needs them.
+
+    Rows are ordered by flow start time (then flow key). With workers > 1
+    decoding and flow building both run on a process pool, with flows sharded
+    by bidirectional flow key (see _extract_sharded); the result is identical
+    to the serial path. A daemonic process cannot start that pool, so there
+    extraction falls back to serial.
+
+    engine="batch" computes the same table with the vectorized engine in
+    batch_features (workers is ignored).
+
+    With stream (a binary file object holding classic pcap, e.g. an upload
+    that is still arriving) packets are parsed from it as they can be read,
+    serially with the streaming engine; pcap_path only names the capture.
+
+    progress (see iter_flows) is called while the serial streaming engine
+    reads packets; the batch engine and the sharded path do not report it.
+    """
+    if stream is None and not os.path.exists(pcap_path):
         raise FileNotFoundError(f"PCAP file not found: {pcap_path}")
 
-    print(f"📥 Reading packets from {pcap_path} ...")
-    packets = rdpcap(pcap_path)
-
-    flows = defaultdict(list)
-
-    def get_flow_key(pkt):
-        if IP in pkt:
-            proto = pkt[IP].proto
-            if TCP in pkt or UDP in pkt:
-                sport = pkt.sport
-                dport = pkt.dport
-            else:
-                sport = dport = 0
-            return (pkt[IP].src, pkt[IP].dst, sport, dport, proto)
-        return None
-
-    for pkt in tqdm(packets, desc="Processing packets"):
-        key = get_flow_key(pkt)
-        if key:
-            flows[key].append(pkt)
-
-    def safe_mean(arr): return float(np.mean(arr)) if len(arr) > 0 else 0.0
-    def safe_std(arr): return float(np.std(arr)) if len(arr) > 1 else 0.0
-    def safe_var(arr): return float(np.var(arr)) if len(arr) > 1 else 0.0
-
-    flow_features = []
-
-    for key, pkts in tqdm(flows.items(), desc="Computing flow features"):
-        src, dst, sport, dport, proto = key
-        pkts = sorted(pkts, key=lambda x: x.time)
-        times = np.array([float(p.time) for p in pkts])
-        lengths = np.array([len(p) for p in pkts])
-        fwd_pkts = [p for p in pkts if p[IP].src == src]
-        bwd_pkts = [p for p in pkts if p[IP].src == dst]
-
-        # Flow duration
-        flow_duration = (times[-1] - times[0]) if len(times) > 1 else 0.0
-
-        # IATs
-        flow_iats = np.diff(times) if len(times) > 1 else [0]
-        flow_iat_mean, flow_iat_std, flow_iat_max, flow_iat_min = safe_mean(flow_iats), safe_std(flow_iats), max(flow_iats), min(flow_iats)
-
-        # Forward/Backward IATs
-        def get_iats(pkts):
-            t = [float(p.time) for p in pkts]
-            return np.diff(sorted(t)) if len(t) > 1 else [0]
-
-        fwd_iats = get_iats(fwd_pkts)
-        bwd_iats = get_iats(bwd_pkts)
-
-        fwd_iat_total, fwd_iat_mean, fwd_iat_std, fwd_iat_max, fwd_iat_min = sum(fwd_iats), safe_mean(fwd_iats), safe_std(fwd_iats), max(fwd_iats), min(fwd_iats)
-        bwd_iat_total, bwd_iat_mean, bwd_iat_std, bwd_iat_max, bwd_iat_min = sum(bwd_iats), safe_mean(bwd_iats), safe_std(bwd_iats), max(bwd_iats), min(bwd_iats)
-
-        # Flags
-        fin=syn=rst=psh=ack=urg=cwe=ece=0
-        fwd_psh=bwd_psh=fwd_urg=bwd_urg=0
-        fwd_hdr_len=bwd_hdr_len=0
-
-        for p in pkts:
-            if TCP in p:
-                flags = p[TCP].flags
-                fin += bool(flags & 0x01)
-                syn += bool(flags & 0x02)
-                rst += bool(flags & 0x04)
-                psh += bool(flags & 0x08)
-                ack += bool(flags & 0x10)
-                urg += bool(flags & 0x20)
-                ece += bool(flags & 0x40)
-                cwe += bool(flags & 0x80)
-
-                if p[IP].src == src:
-                    fwd_hdr_len += p[TCP].dataofs * 4
-                    fwd_psh += bool(flags & 0x08)
-                    fwd_urg += bool(flags & 0x20)
-                else:
-                    bwd_hdr_len += p[TCP].dataofs * 4
-                    bwd_psh += bool(flags & 0x08)
-                    bwd_urg += bool(flags & 0x20)
-
-        # Lengths
-        fwd_lens = [len(p) for p in fwd_pkts] or [0]
-        bwd_lens = [len(p) for p in bwd_pkts] or [0]
-
-        # Basic features
-        total_fwd_pkts, total_bwd_pkts = len(fwd_pkts), len(bwd_pkts)
-        total_len_fwd, total_len_bwd = sum(fwd_lens), sum(bwd_lens)
-        total_pkts = total_fwd_pkts + total_bwd_pkts
-        total_len = total_len_fwd + total_len_bwd
-
-        min_pkt_len, max_pkt_len = min(lengths), max(lengths)
-        pkt_len_mean, pkt_len_std, pkt_len_var = safe_mean(lengths), safe_std(lengths), safe_var(lengths)
-
-        # Rates
-        flow_bytes_per_s = total_len / flow_duration if flow_duration > 0 else 0
-        flow_pkts_per_s = total_pkts / flow_duration if flow_duration > 0 else 0
-        fwd_pkts_per_s = total_fwd_pkts / flow_duration if flow_duration > 0 else 0
-        bwd_pkts_per_s = total_bwd_pkts / flow_duration if flow_duration > 0 else 0
-
-        # Derived
-        down_up_ratio = (total_bwd_pkts / total_fwd_pkts) if total_fwd_pkts > 0 else 0
-        avg_pkt_size = total_len / total_pkts if total_pkts > 0 else 0
-        avg_fwd_seg_size = safe_mean(fwd_lens)
-        avg_bwd_seg_size = safe_mean(bwd_lens)
-
-        # Active / Idle Times
-        actives, idles = [], []
-        if len(times) > 1:
-            diffs = np.diff(times)
-            threshold = np.mean(diffs) + np.std(diffs)
-            active, idle = [], []
-            for d in diffs:
-                if d <= threshold:
-                    active.append(d)
-                else:
-                    idle.append(d)
-            actives = active
-            idles = idle
-
-        active_mean, active_std, active_max, active_min = safe_mean(actives), safe_std(actives), max(actives, default=0), min(actives, default=0)
-        idle_mean, idle_std, idle_max, idle_min = safe_mean(idles), safe_std(idles), max(idles, default=0), min(idles, default=0)
-
-        # Subflow (simple approximation)
-        subflow_fwd_pkts = total_fwd_pkts
-        subflow_bwd_pkts = total_bwd_pkts
-        subflow_fwd_bytes = total_len_fwd
-        subflow_bwd_bytes = total_len_bwd
-
-        # TCP window & data pkt approximation
-        init_win_fwd = fwd_pkts[0][TCP].window if (fwd_pkts and TCP in fwd_pkts[0]) else 0
-        init_win_bwd = bwd_pkts[0][TCP].window if (bwd_pkts and TCP in bwd_pkts[0]) else 0
-        act_data_pkt_fwd = sum(1 for p in fwd_pkts if len(p) > 0)
-        min_seg_size_fwd = min((len(p) for p in fwd_pkts), default=0)
-
-        # ALL 78 FEATURES
-        flow_features.append({
-            "Destination Port": dport,
-            "Flow Duration": flow_duration,
-            "Total Fwd Packets": total_fwd_pkts,
-            "Total Backward Packets": total_bwd_pkts,
-            "Total Length of Fwd Packets": total_len_fwd,
-            "Total Length of Bwd Packets": total_len_bwd,
-            "Fwd Packet Length Max": max(fwd_lens),
-            "Fwd Packet Length Min": min(fwd_lens),
-            "Fwd Packet Length Mean": safe_mean(fwd_lens),
-            "Fwd Packet Length Std": safe_std(fwd_lens),
-            "Bwd Packet Length Max": max(bwd_lens),
-            "Bwd Packet Length Min": min(bwd_lens),
-            "Bwd Packet Length Mean": safe_mean(bwd_lens),
-            "Bwd Packet Length Std": safe_std(bwd_lens),
-            "Flow Bytes/s": flow_bytes_per_s,
-            "Flow Packets/s": flow_pkts_per_s,
-            "Flow IAT Mean": flow_iat_mean,
-            "Flow IAT Std": flow_iat_std,
-            "Flow IAT Max": flow_iat_max,
-            "Flow IAT Min": flow_iat_min,
-            "Fwd IAT Total": fwd_iat_total,
-            "Fwd IAT Mean": fwd_iat_mean,
-            "Fwd IAT Std": fwd_iat_std,
-            "Fwd IAT Max": fwd_iat_max,
-            "Fwd IAT Min": fwd_iat_min,
-            "Bwd IAT Total": bwd_iat_total,
-            "Bwd IAT Mean": bwd_iat_mean,
-            "Bwd IAT Std": bwd_iat_std,
-            "Bwd IAT Max": bwd_iat_max,
-            "Bwd IAT Min": bwd_iat_min,
-            "Fwd PSH Flags": fwd_psh,
-            "Bwd PSH Flags": bwd_psh,
-            "Fwd URG Flags": fwd_urg,
-            "Bwd URG Flags": bwd_urg,
-            "Fwd Header Length": fwd_hdr_len,
-            "Bwd Header Length": bwd_hdr_len,
-            "Fwd Packets/s": fwd_pkts_per_s,
-            "Bwd Packets/s": bwd_pkts_per_s,
-            "Min Packet Length": min_pkt_len,
-            "Max Packet Length": max_pkt_len,
-            "Packet Length Mean": pkt_len_mean,
-            "Packet Length Std": pkt_len_std,
-            "Packet Length Variance": pkt_len_var,
-            "FIN Flag Count": fin,
-            "SYN Flag Count": syn,
-            "RST Flag Count": rst,
-            "PSH Flag Count": psh,
-            "ACK Flag Count": ack,
-            "URG Flag Count": urg,
-            "CWE Flag Count": cwe,
-            "ECE Flag Count": ece,
-            "Down/Up Ratio": down_up_ratio,
-            "Average Packet Size": avg_pkt_size,
-            "Avg Fwd Segment Size": avg_fwd_seg_size,
-            "Avg Bwd Segment Size": avg_bwd_seg_size,
-            "Fwd Header Length.1": fwd_hdr_len,
-            "Fwd Avg Bytes/Bulk": 0,
-            "Fwd Avg Packets/Bulk": 0,
-            "Fwd Avg Bulk Rate": 0,
-            "Bwd Avg Bytes/Bulk": 0,
-            "Bwd Avg Packets/Bulk": 0,
-            "Bwd Avg Bulk Rate": 0,
-            "Subflow Fwd Packets": subflow_fwd_pkts,
-            "Subflow Fwd Bytes": subflow_fwd_bytes,
-            "Subflow Bwd Packets": subflow_bwd_pkts,
-            "Subflow Bwd Bytes": subflow_bwd_bytes,
-            "Init_Win_bytes_forward": init_win_fwd,
-            "Init_Win_bytes_backward": init_win_bwd,
-            "act_data_pkt_fwd": act_data_pkt_fwd,
-            "min_seg_size_forward": min_seg_size_fwd,
-            "Active Mean": active_mean,
-            "Active Std": active_std,
-            "Active Max": active_max,
-            "Active Min": active_min,
-            "Idle Mean": idle_mean,
-            "Idle Std": idle_std,
-            "Idle Max": idle_max,
-            "Idle Min": idle_min,
-            "Subflow Bwd Bytes": total_len_bwd
-        })
-        '''
-        flow_features.append({
-            "Destination Port": dport,
-            "Average Packet Size": avg_pkt_size,
-            "Init_Win_bytes_forward": init_win_fwd,
-            "Packet Length Std": pkt_len_std,
-            "Min Packet Length": min_pkt_len,
-            "Max Packet Length": max_pkt_len,
-            "Bwd Packet Length Std": safe_std(bwd_lens),
-            "Init_Win_bytes_backward": init_win_bwd,
-            "Packet Length Variance": pkt_len_var,
-            "Bwd Packet Length Max": max(bwd_lens),
-            "Bwd Packet Length Min": min(bwd_lens),
-            "Subflow Fwd Bytes": subflow_fwd_bytes,
-            "Fwd Packet Length Max": max(fwd_lens),
-            "Fwd Packet Length Min": min(fwd_lens),
-            "Avg Bwd Segment Size": avg_bwd_seg_size,
-            "Packet Length Mean": pkt_len_mean,
-            "Bwd Packet Length Mean": safe_mean(bwd_lens),
-            "Fwd Packet Length Mean": safe_mean(fwd_lens),
-            "Bwd Header Length": bwd_hdr_len,
-            "Subflow Bwd Bytes": subflow_bwd_bytes,
-        })
-        '''
-        
-    # Save CSV
+    print(f"📥 Streaming packets from {pcap_path} ...")
+    workers = FEATURE_WORKERS if workers is None else workers
+    engine = engine or FEATURE_ENGINE
+    groups = feature_groups_for(feature_names)
+    if stream is not None:
+        features, flows = _in_flow_order(*_collect_flows(iter_flows(pcap_path, active_timeout, idle_timeout, groups, stream, progress)))
+        return _select_features(features, feature_names), flow_metadata(flows, features)
+    if engine == "batch":
+        features, flows = extract_flow_matrix_batch(pcap_path, active_timeout, idle_timeout, groups)
+        return _select_features(features, feature_names), flow_metadata(flows, features)
+
+    if workers > 1 and multiprocessing.current_process().daemon:
+        print("⚠️ Running in a daemonic process, which cannot start a worker pool; extracting serially")
+        workers = 1
+    if workers <= 1:
+        features, flows = _in_flow_order(*_collect_flows(iter_flows(pcap_path, active_timeout, idle_timeout, groups, progress=progress)))
+    else:
+        print(f"⚙️ Extracting features with {workers} worker processes ...")
+        features, flows = _extract_sharded(pcap_path, active_timeout, idle_timeout, workers, groups)
+    return _select_features(features, feature_names), flow_metadata(flows, features)
+
+
+def _select_features(features: np.ndarray, feature_names: list = None) -> np.ndarray:
+    if feature_names is None:
+        return np.ascontiguousarray(features)
+    return np.ascontiguousarray(features[:, feature_indices(feature_names)])
+
+
+def export_features_csv(features: np.ndarray, pcap_path: str, output_dir: str, feature_names: list = None) -> str:
+    """Write a feature matrix from extract_flow_features to <output_dir>/<pcap name>_flows.csv."""
     os.makedirs(output_dir, exist_ok=True)
     base_name = os.path.splitext(os.path.basename(pcap_path))[0]
     csv_path = os.path.join(output_dir, f"{base_name}_flows.csv")
-    pd.DataFrame(flow_features).to_csv(csv_path, index=False)
-    print(f"✅ Saved complete flow feature CSV with all 78 features: {csv_path}")
+    columns = list(ALL_78_FEATURES if feature_names is None else feature_names)
+    pd.DataFrame(features, columns=columns).to_csv(csv_path, index=False)
+    print(f"✅ Saved flow feature CSV with {len(columns)} features: {csv_path}")
     return csv_path
+
+
+def convert_pcap_to_csv(pcap_path: str, output_dir: str, active_timeout: float = None, idle_timeout: float = None, workers: int = None, engine: str = None, feature_names: list = None) -> str:
+    """
+    Convert a PCAP file into a detailed flow-based CSV with all 78 CICIDS-style features
+    (or just feature_names).
+
+    Packets are streamed from disk, decoded from their raw header bytes and folded
+    into per-flow features; see extract_flow_features for row order, workers and engine.
+    Packets are expected in capture-time order: within a flow, one older than
+    the flow's latest packet is counted at that latest time (see iter_flows).
+    """
+    features, _ = extract_flow_features(pcap_path, active_timeout, idle_timeout, workers, engine, feature_names)
+    return export_features_csv(features, pcap_path, output_dir, feature_names)
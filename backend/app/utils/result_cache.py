@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from app.models import AnalysisCache
+from app.utils.feature_store import flow_store_path, flow_verdicts_path
+from app.utils.flow_table import FLOW_ACTIVE_TIMEOUT, FLOW_IDLE_TIMEOUT
+from app.utils.model_registry import model_features, registry
+
+# Reuse the analysis of a capture that was already analysed with the same model
+RESULT_CACHE = os.getenv("RESULT_CACHE", "true").lower() == "true"
+# Cached flow stores live here, named by content hash and analysis version
+CACHE_FOLDER = os.getenv("CACHE_FOLDER", "result_cache")
+# Eviction: least recently used entries go once the cache holds more than
+# CACHE_MAX_BYTES; entries not used for CACHE_MAX_AGE_DAYS always go
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(5 * 1024 ** 3)))
+CACHE_MAX_AGE_DAYS = float(os.getenv("CACHE_MAX_AGE_DAYS", "30"))
+# Bumped when cached results change shape, so older entries stop matching
+# (2: fallback reports no longer name the uploaded file)
+RESULT_FORMAT = 2
+
+
+def _file_identity(path: str) -> list:
+    stat = os.stat(path)
+    return [os.path.basename(path), stat.st_size, stat.st_mtime_ns]
+
+
+def analysis_version(model_path: str, scaler_path: str) -> str:
+    """
+    Short digest of everything besides the capture that shapes a result: the
+    model and scaler files, the model's feature set, the flow timeouts and
+    the result format.
+    Replacing a model on disk changes it, so older entries stop matching.
+    """
+    model = registry.get(model_path)
+    registry.get(scaler_path)
+    identity = [
+        _file_identity(registry.resolve(model_path)),
+        _file_identity(registry.resolve(scaler_path)),
+        model_features(model),
+        FLOW_ACTIVE_TIMEOUT,
+        FLOW_IDLE_TIMEOUT,
+        RESULT_FORMAT,
+    ]
+    return hashlib.sha256(json.dumps(identity).encode()).hexdigest()[:16]
+
+
+def _remove(path: str):
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+def _link_or_copy(src: str, dest: str):
+    # Hard links share the file's blocks; copy across filesystems
+    _remove(dest)
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copyfile(src, dest)
+
+
+def lookup(db, sha256: str, version: str):
+    """Cached analysis for a capture hash and analysis version, or None."""
+    if not RESULT_CACHE or not sha256:
+        return None
+    entry = db.query(AnalysisCache).filter(
+        AnalysisCache.sha256 == sha256,
+        AnalysisCache.version == version
+    ).first()
+    if entry is None:
+        return None
+    if entry.last_used_at < datetime.utcnow() - timedelta(days=CACHE_MAX_AGE_DAYS):
+        _evict_entry(db, entry)
+        db.commit()
+        return None
+    entry.hits += 1
+    entry.last_used_at = datetime.utcnow()
+    db.commit()
+    return entry
+
+
+def _link_cached(cached_path: str, job_path: str):
+    if not cached_path or not os.path.exists(cached_path):
+        return None
+    _link_or_copy(cached_path, job_path)
+    return job_path
+
+
+def link_features(entry, pcap_path: str, output_dir: str = None):
+    """Give a job its own link to the entry's flow store; returns its path, or None."""
+    return _link_cached(entry.features_path, flow_store_path(pcap_path, output_dir))
+
+
+def link_verdicts(entry, pcap_path: str, output_dir: str = None):
+    """Give a job its own link to the entry's per-flow verdicts; returns its path, or None."""
+    return _link_cached(entry.verdicts_path, flow_verdicts_path(pcap_path, output_dir))
+
+
+def _stage_file(path: str, cached_name: str):
+    """Link path into CACHE_FOLDER under a temporary name; returns (temporary, final) paths, or None."""
+    if not path or not os.path.exists(path):
+        return None
+    os.makedirs(CACHE_FOLDER, exist_ok=True)
+    cached_path = os.path.join(CACHE_FOLDER, cached_name)
+    staged_path = f"{cached_path}.{uuid.uuid4().hex}.tmp"
+    _link_or_copy(path, staged_path)
+    return staged_path, cached_path
+
+
+def store(db, sha256: str, version: str, result: str, features_path: str = None, verdicts_path: str = None):
+    """
+    Cache a finished analysis (the result JSON and, if given, the flow store
+    and per-flow verdicts).
+
+    Files are linked into CACHE_FOLDER, so the job that produced them and the
+    cache can each delete their copy on their own. They are linked under
+    temporary names and take their final names only once the entry is
+    committed: a worker that loses the race to cache the same capture leaves
+    the winner's files alone.
+    """
+    if not RESULT_CACHE or not sha256:
+        return None
+    staged = [
+        _stage_file(features_path, f"{sha256}_{version}.parquet"),
+        _stage_file(verdicts_path, f"{sha256}_{version}_verdicts.parquet"),
+    ]
+    try:
+        cached_features, cached_verdicts = (files[1] if files else None for files in staged)
+        size = len(result) + sum(os.path.getsize(files[0]) for files in staged if files)
+        entry = AnalysisCache(
+            sha256=sha256,
+            version=version,
+            result=result,
+            features_path=cached_features,
+            verdicts_path=cached_verdicts,
+            size_bytes=size
+        )
+        db.add(entry)
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another worker cached the same capture first; its entry (and files) win
+            db.rollback()
+            return None
+        for files in staged:
+            if files:
+                os.replace(*files)
+        staged = []
+    finally:
+        for files in staged:
+            if files:
+                _remove(files[0])
+    evict(db)
+    return entry
+
+
+def _evict_entry(db, entry):
+    _remove(entry.features_path)
+    _remove(entry.verdicts_path)
+    db.delete(entry)
+
+
+def evict(db):
+    """Drop entries older than CACHE_MAX_AGE_DAYS, then LRU entries beyond CACHE_MAX_BYTES."""
+    cutoff = datetime.utcnow() - timedelta(days=CACHE_MAX_AGE_DAYS)
+    for entry in db.query(AnalysisCache).filter(AnalysisCache.last_used_at < cutoff):
+        _evict_entry(db, entry)
+    db.flush()
+    total = sum(size for (size,) in db.query(AnalysisCache.size_bytes))
+    if total > CACHE_MAX_BYTES:
+        for entry in db.query(AnalysisCache).order_by(AnalysisCache.last_used_at):
+            if total <= CACHE_MAX_BYTES:
+                break
+            total -= entry.size_bytes
+            _evict_entry(db, entry)
+    db.commit()
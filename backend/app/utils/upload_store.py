@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+
+# Largest capture accepted for analysis (bytes)
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(2 * 1024 ** 3)))
+# Bytes copied (and hashed) per read
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Multipart framing and small form fields allowed on top of the file itself
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+class UploadTooLarge(ValueError):
+    """The upload exceeds the size limit."""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(f"File exceeds the maximum upload size of {max_bytes} bytes")
+        self.max_bytes = max_bytes
+
+
+class _BodyTooLarge(Exception):
+    pass
+
+
+class UploadSizeLimit:
+    """
+    ASGI middleware rejecting upload requests over MAX_UPLOAD_BYTES with 413
+    before the multipart body is parsed (and spooled to disk).
+
+    A Content-Length over the limit is refused without reading the body; a
+    body without one (chunked transfer encoding) is counted as it arrives
+    and the request is aborted once it crosses the limit. Only POSTs to
+    paths are checked.
+    """
+
+    def __init__(self, app, paths=(), max_bytes: int = None):
+        self.app = app
+        self.paths = frozenset(paths)
+        max_bytes = MAX_UPLOAD_BYTES if max_bytes is None else max_bytes
+        self.max_file_bytes = max_bytes
+        self.max_body_bytes = max_bytes + MULTIPART_OVERHEAD_BYTES
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            return await self.app(scope, receive, send)
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_body_bytes:
+            return await self._reject(send)
+
+        received = 0
+        started = too_large = False
+
+        async def limited_receive():
+            nonlocal received, too_large
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_bytes:
+                    too_large = True
+                    raise _BodyTooLarge()
+            return message
+
+        async def tracked_send(message):
+            nonlocal started
+            if too_large and not started:
+                return  # the app's own error response for the aborted body (FastAPI answers 400)
+            started = started or message["type"] == "http.response.start"
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except _BodyTooLarge:
+            if started:
+                raise
+        if too_large and not started:
+            await self._reject(send)
+
+    async def _reject(self, send):
+        body = json.dumps({"detail": str(UploadTooLarge(self.max_file_bytes))}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()), (b"connection", b"close")],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def copy_hashed(src, dest, hasher=None, max_bytes: int = None, written: int = 0) -> int:
+    """
+    Copy a binary file object into dest chunk by chunk, feeding hasher.
+
+    One reusable UPLOAD_CHUNK_SIZE buffer is read into and written out, so
+    memory use does not depend on the file size. Raises UploadTooLarge once
+    written (bytes already in dest) plus the copied bytes exceed max_bytes.
+    Returns the new total.
+    """
+    buffer = bytearray(UPLOAD_CHUNK_SIZE)
+    view = memoryview(buffer)
+    while True:
+        n = src.readinto(buffer)
+        if not n:
+            return written
+        written += n
+        if max_bytes is not None and written > max_bytes:
+            raise UploadTooLarge(max_bytes)
+        if hasher is not None:
+            hasher.update(view[:n])
+        dest.write(view[:n])
+
+
+def save_upload(src, dest_path: str, max_bytes: int = None):
+    """
+    Stream a file object to dest_path, hashing it on the way.
+
+    Returns (size, sha256 hex digest). On any error (including
+    UploadTooLarge) the partial file is removed.
+    """
+    max_bytes = MAX_UPLOAD_BYTES if max_bytes is None else max_bytes
+    hasher = hashlib.sha256()
+    try:
+        with open(dest_path, "wb") as dest:
+            size = copy_hashed(src, dest, hasher, max_bytes)
+    except BaseException:
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        raise
+    return size, hasher.hexdigest()
+
+
+def file_sha256(path: str) -> str:
+    """SHA-256 of a file already on disk, read one chunk at a time."""
+    hasher = hashlib.sha256()
+    buffer = bytearray(UPLOAD_CHUNK_SIZE)
+    view = memoryview(buffer)
+    with open(path, "rb") as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                return hasher.hexdigest()
+            hasher.update(view[:n])
@@ -0,0 +1,549 @@
+"""
+PCAP analysis job queue and worker processes.
+
+Jobs are rows of the pcap_files table: uploads insert them as "pending" and
+worker processes claim them with an atomic UPDATE that takes a time-limited
+lease. A running job renews its lease; if a worker dies, its lease runs out
+and another worker picks the job up again. Failed jobs are retried up to
+JOB_MAX_ATTEMPTS times.
+
+Workers are started with the API (JOB_WORKERS), or on their own with:
+    python -m app.worker
+"""
+import atexit
+import json
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+import numpy as np
+from sqlalchemy import and_, or_, update
+from app.database import SessionLocal
+from app.models import PcapFile
+from app.utils.pcap_converter import extract_flow_features, export_features_csv
+from app.utils.feature_store import FEATURE_FOLDER, write_flow_features, write_flow_verdicts
+from app.utils.model_predictor import INFERENCE_SERVICE, PREDICT_BATCH_SIZE, inference_service, label_names, predict_from_array
+from app.utils.model_registry import model_features, registry
+from app.utils.inference_service import InferenceServer, new_server_address
+from app.utils.gemini_formatter import GEMINI_API_KEY, GEMINI_TIMEOUT_SECONDS, generate_dummy_response, report_summary, submit_report
+from app.utils import result_cache
+from app.utils.upload_store import file_sha256
+from app.utils.chunked_upload import PIPELINE_STALL_SECONDS, idle_uploads, open_upload_stream, sweep_expired_uploads
+from app.utils import job_events
+
+CSV_FOLDER = os.getenv("CSV_FOLDER", "csv_files")
+# Paths, or file names under MODELS_DIR (see model_registry)
+MODEL_PATH = os.getenv("MODEL_PATH") or "xgboost_model.joblib"
+SCALAR_PATH = os.getenv("SCALAR_PATH") or "standard_scaler.pkl"
+# Also write the per-flow feature CSV (the Parquet flow store is always written)
+EXPORT_CSV = os.getenv("EXPORT_CSV", "true").lower() == "true"
+
+# Worker processes started with the API; 0 = run `python -m app.worker` separately
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))
+# A claimed job belongs to its worker until the lease expires; running jobs renew it
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# How often an idle worker checks for new jobs
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+# How often the first worker removes chunked uploads that were never merged
+UPLOAD_SWEEP_INTERVAL = float(os.getenv("UPLOAD_SWEEP_INTERVAL", "600"))
+
+# Flagged flows listed in the model output (and so in the report)
+TOP_FLAGGED_FLOWS = 5
+
+# Feature files are written off the critical path of the analysis
+feature_export_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="feature-export")
+
+
+def export_features(pcap_id: int, features, flow_meta, pcap_path: str, feature_names: list):
+    """Write the flow store (and CSV) for a job and record their paths once written; returns the flow store path"""
+    db = SessionLocal()
+    try:
+        features_path = write_flow_features(features, flow_meta, pcap_path, FEATURE_FOLDER, feature_names)
+        csv_path = export_features_csv(features, pcap_path, CSV_FOLDER, feature_names) if EXPORT_CSV else None
+        pcap_file = db.query(PcapFile).filter(PcapFile.id == pcap_id).first()
+        if pcap_file:
+            pcap_file.features_path = features_path
+            pcap_file.csv_path = csv_path
+            db.commit()
+        return features_path
+    except Exception as e:
+        print(f"⚠️ Feature export failed for job {pcap_id}: {e}")
+        return None
+    finally:
+        db.close()
+
+
+def store_verdicts(flow_meta, batches: list, pcap_path: str, is_multiclass: bool = False):
+    """
+    Write a job's per-flow verdicts from the (labels, confidences) batches of
+    predict_from_array; returns (verdicts path, top flagged flows for the report).
+    """
+    labels = np.concatenate([labels for labels, _ in batches]) if batches else np.zeros(0, dtype=np.int64)
+    confidences = np.concatenate([confidences for _, confidences in batches]) if batches else np.zeros(0)
+    names = label_names(labels, is_multiclass)
+    verdicts_path = write_flow_verdicts(flow_meta, labels, confidences, names, pcap_path, FEATURE_FOLDER)
+
+    flagged = np.flatnonzero(labels != 0)
+    top = flagged[np.argsort(-confidences[flagged], kind="stable")][:TOP_FLAGGED_FLOWS]
+    top_flows = [
+        {
+            "source_ip": flow_meta["Source IP"].iat[i],
+            "destination_ip": flow_meta["Destination IP"].iat[i],
+            "destination_port": int(flow_meta["Destination Port"].iat[i]),
+            "protocol": int(flow_meta["Protocol"].iat[i]),
+            "class": names[i],
+            "confidence": round(float(confidences[i]), 4),
+        }
+        for i in top
+    ]
+    return verdicts_path, top_flows
+
+
+def cache_result(sha256: str, version: str, result: str, verdicts_path: str, export):
+    """Add a finished analysis to the result cache once its flow store is written"""
+    db = SessionLocal()
+    try:
+        result_cache.store(db, sha256, version, result, export.result(), verdicts_path)
+    except Exception as e:
+        print(f"⚠️ Could not cache result: {e}")
+    finally:
+        db.close()
+
+
+def finish_report(pcap_id: int, cache_args, export, report):
+    """
+    Replace a completed job's model-based report with the Gemini report once it
+    arrives (report: future of gemini_formatter.generate_report), then cache the
+    analysis. cache_args is (sha256, version, verdicts_path), or None to skip caching.
+    """
+    try:
+        narrative, source = report.result()
+    except Exception as e:
+        print(f"⚠️ Report for job {pcap_id} failed: {e}")
+        narrative, source = None, "fallback"
+    db = SessionLocal()
+    try:
+        pcap_file = db.query(PcapFile).filter(PcapFile.id == pcap_id).first()
+        if not pcap_file:
+            return
+        if source != "fallback":
+            set_result(pcap_file, json.dumps(narrative))
+        pcap_file.report_status = "fallback" if source == "fallback" else "ready"
+        db.commit()
+        result = pcap_file.result
+    except Exception as e:
+        print(f"⚠️ Could not store the report for job {pcap_id}: {e}")
+        return
+    finally:
+        db.close()
+    # A fallback stands in for a report that failed: cache it only if Gemini is off
+    if cache_args and (source != "fallback" or not GEMINI_API_KEY):
+        sha256, version, verdicts_path = cache_args
+        cache_result(sha256, version, result, verdicts_path, export)
+
+
+def process_pcap_file(pcap_id: int, pcap_path: str, filename: str):
+    """Analyse one claimed PCAP job and store its result; errors propagate to the worker"""
+    db = SessionLocal()
+    try:
+        # Get PCAP record
+        pcap_file = db.query(PcapFile).filter(PcapFile.id == pcap_id).first()
+        if not pcap_file:
+            return
+
+        version = result_cache.analysis_version(MODEL_PATH, SCALAR_PATH)
+        feature_names = model_features(registry.get(MODEL_PATH))
+        progress = job_events.JobProgress(pcap_id)
+
+        # Pipelined chunked upload (upload_id set): parse it while it arrives
+        upload_stream = open_upload_stream(pcap_file.upload_id) if pcap_file.upload_id else None
+        if upload_stream is not None:
+            print(f"Extracting flow features while upload {pcap_file.upload_id} arrives")
+            pcap_path = pcap_file.upload_id  # names the exported feature files
+            progress.total_bytes = upload_stream.file_size
+            with upload_stream:
+                features, flow_meta = extract_flow_features(pcap_path, feature_names=feature_names, stream=upload_stream, progress=progress.parsing)
+                upload_stream.drain()  # finish the hash
+            pcap_file.sha256 = upload_stream.sha256()
+            pcap_file.size_bytes = upload_stream.position
+            db.commit()
+        else:
+            if pcap_file.upload_id:
+                pcap_path = _merged_path(db, pcap_file)
+
+            # Chunked uploads are hashed here rather than in the API
+            if pcap_file.sha256 is None and result_cache.RESULT_CACHE:
+                progress.stage("hashing", 0)
+                pcap_file.sha256 = file_sha256(pcap_path)
+                db.commit()
+
+            # Same capture already analysed with the same model: reuse that analysis
+            cached = result_cache.lookup(db, pcap_file.sha256, version)
+            if cached:
+                print(f"♻️ Reusing cached analysis for job {pcap_id}")
+                pcap_file.features_path = result_cache.link_features(cached, pcap_path, FEATURE_FOLDER)
+                pcap_file.verdicts_path = result_cache.link_verdicts(cached, pcap_path, FEATURE_FOLDER)
+                _complete(db, pcap_file, cached.result)
+                return
+
+            # Step 1: Extract flow features in memory (only those the model uses)
+            print("Extracting flow features")
+            progress.total_bytes = os.path.getsize(pcap_path)
+            progress.stage("parsing", 0)
+            features, flow_meta = extract_flow_features(pcap_path, feature_names=feature_names, progress=progress.parsing)
+        print(f"Extracted {len(features)} flows")
+        export = feature_export_executor.submit(export_features, pcap_id, features, flow_meta, pcap_path, feature_names)
+
+        # Step 2: Run model prediction
+        print("SENT FOR MODEL EVALUATION")
+        batches = []
+        total_batches = -(-len(features) // PREDICT_BATCH_SIZE)
+        progress.stage("scoring", progress.PARSE_END)
+
+        def on_batch(labels, confidences):
+            batches.append((labels, confidences))
+            progress.scoring(len(batches), total_batches, sum(len(batch) for batch, _ in batches))
+
+        model_output = predict_from_array(features, MODEL_PATH, SCALAR_PATH, feature_names=feature_names, on_batch=on_batch)
+        progress.stage("storing", progress.SCORE_END)
+        verdicts_path = None
+        if "error" not in model_output:
+            verdicts_path, model_output["top_flagged_flows"] = store_verdicts(flow_meta, batches, pcap_path)
+        print(model_output)
+        # Step 3: Request the Gemini report, and meanwhile complete the job with
+        # the model-based one; finish_report swaps it in when it arrives
+        report = submit_report(model_output)
+        result = json.dumps(generate_dummy_response(model_output))
+        cache_args = (pcap_file.sha256, version, verdicts_path) if "error" not in model_output else None
+        pcap_file.verdicts_path = verdicts_path
+        pcap_file.report_status = "pending" if GEMINI_API_KEY else "fallback"
+        _complete(db, pcap_file, result)
+        report.add_done_callback(partial(finish_report, pcap_id, cache_args, export))
+    finally:
+        db.close()
+
+
+def _merged_path(db, pcap_file) -> str:
+    """Final path of a pipelined upload that was merged before the job started."""
+    # merge-chunks commits the new path right after moving the file
+    for _ in range(50):
+        db.refresh(pcap_file)
+        if os.path.exists(pcap_file.filepath):
+            break
+        time.sleep(0.1)
+    return pcap_file.filepath
+
+
+def set_result(pcap_file, result: str):
+    """Store a job's result JSON along with its summary columns"""
+    pcap_file.result = result
+    try:
+        summary = report_summary(json.loads(result))
+    except (ValueError, TypeError, AttributeError):
+        summary = (0, 0, "Low")
+    pcap_file.threats_detected, pcap_file.risk_score, pcap_file.severity = summary
+
+
+def _complete(db, pcap_file, result: str):
+    set_result(pcap_file, result)
+    pcap_file.status = "completed"
+    pcap_file.error = None
+    pcap_file.completed_at = datetime.utcnow()
+    pcap_file.lease_owner = None
+    pcap_file.lease_expires = None
+    job_id = pcap_file.id
+    db.commit()
+    job_events.publish(job_id, "completed", stage="done", progress=100)
+
+
+def _claimable(now: datetime):
+    # Pending jobs, and processing jobs whose worker stopped renewing the lease
+    # (no lease at all: started by an older version of the server)
+    return or_(
+        PcapFile.status == "pending",
+        and_(
+            PcapFile.status == "processing",
+            or_(PcapFile.lease_expires.is_(None), PcapFile.lease_expires < now),
+        ),
+    )
+
+
+def claim_job(db, worker_id: str):
+    """
+    Atomically take the oldest claimable job, or return None.
+
+    The UPDATE repeats the claimable condition, so when two workers race for
+    the same row only one of them matches it.
+    """
+    while True:
+        now = datetime.utcnow()
+        candidates = [row.id for row in db.query(PcapFile.id).filter(_claimable(now)).order_by(PcapFile.id).limit(8)]
+        if not candidates:
+            return None
+        for job_id in candidates:
+            claimed = db.execute(
+                update(PcapFile)
+                .where(PcapFile.id == job_id, _claimable(now))
+                .values(
+                    status="processing",
+                    lease_owner=worker_id,
+                    lease_expires=now + timedelta(seconds=JOB_LEASE_SECONDS),
+                    attempts=PcapFile.attempts + 1,
+                )
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.commit()
+            if not claimed:
+                continue
+            job = db.query(PcapFile).filter(PcapFile.id == job_id).first()
+            if job.attempts <= JOB_MAX_ATTEMPTS:
+                return job
+            # Claimed again after its worker died on the last attempt
+            _finish_failed(db, job, job.error or "Worker stopped while processing the job")
+        # Every candidate was taken by another worker or given up on; look again
+
+
+def _finish_failed(db, job, error: str):
+    job.status = "failed"
+    job.error = f"{error} (after {job.attempts} attempt(s))"
+    job.lease_owner = None
+    job.lease_expires = None
+    job_id = job.id
+    db.commit()
+    job_events.publish(job_id, "failed", stage="failed")
+
+
+def _job_failed(job_id: int, error: Exception):
+    """Put a job back in the queue for another attempt, or mark it failed"""
+    db = SessionLocal()
+    try:
+        job = db.query(PcapFile).filter(PcapFile.id == job_id).first()
+        if not job:
+            return
+        if job.attempts < JOB_MAX_ATTEMPTS:
+            print(f"⚠️ Job {job_id} failed (attempt {job.attempts}/{JOB_MAX_ATTEMPTS}), retrying: {error}")
+            job.status = "pending"
+            job.error = str(error)
+            job.lease_owner = None
+            job.lease_expires = None
+            db.commit()
+            job_events.publish(job_id, "pending", stage="retrying", attempt=job.attempts)
+        else:
+            print(f"❌ Job {job_id} failed: {error}")
+            _finish_failed(db, job, str(error))
+    finally:
+        db.close()
+
+
+def _renew_lease(job_id: int, worker_id: str, done: threading.Event):
+    """Extend the lease of a running job until it finishes"""
+    while not done.wait(JOB_LEASE_SECONDS / 3):
+        db = SessionLocal()
+        try:
+            db.execute(
+                update(PcapFile)
+                .where(PcapFile.id == job_id, PcapFile.lease_owner == worker_id)
+                .values(lease_expires=datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS))
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+        except Exception as e:
+            print(f"⚠️ Could not renew lease on job {job_id}: {e}")
+        finally:
+            db.close()
+
+
+def run_job(job, worker_id: str):
+    job_events.publish(job.id, "processing", stage="started", progress=0, attempt=job.attempts)
+    done = threading.Event()
+    heartbeat = threading.Thread(target=_renew_lease, args=(job.id, worker_id, done), daemon=True)
+    heartbeat.start()
+    try:
+        process_pcap_file(job.id, job.filepath, job.filename)
+    except Exception as e:
+        _job_failed(job.id, e)
+    finally:
+        done.set()
+        heartbeat.join()
+
+
+def recover_jobs():
+    """
+    Startup sweep: return jobs abandoned by a previous run to the queue.
+
+    Jobs left "processing" without a live lease (the worker died, or they were
+    started by an older version of the server) become pending again. Gemini
+    reports that never arrived leave the model-based report in place.
+    """
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        recovered = db.execute(
+            update(PcapFile)
+            .where(
+                PcapFile.status == "processing",
+                or_(PcapFile.lease_expires.is_(None), PcapFile.lease_expires < now),
+            )
+            .values(status="pending", lease_owner=None, lease_expires=None)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        # Reports still pending long after their budget belonged to a worker that is gone
+        abandoned = db.execute(
+            update(PcapFile)
+            .where(
+                PcapFile.report_status == "pending",
+                PcapFile.completed_at < now - timedelta(seconds=2 * GEMINI_TIMEOUT_SECONDS),
+            )
+            .values(report_status="fallback")
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        if recovered:
+            print(f"🔁 Re-queued {recovered} interrupted job(s)")
+        if abandoned:
+            print(f"🔁 Kept the model-based report for {abandoned} job(s) whose Gemini report was lost")
+    finally:
+        db.close()
+
+
+def sweep_uploads():
+    """Remove abandoned chunked uploads, including pipelined ones whose job has finished"""
+    idle = idle_uploads(PIPELINE_STALL_SECONDS)
+    finished = []
+    if idle:
+        db = SessionLocal()
+        try:
+            finished = [upload_id for (upload_id,) in db.query(PcapFile.upload_id).filter(
+                PcapFile.upload_id.in_(list(idle)),
+                PcapFile.status.in_(("completed", "failed"))
+            )]
+        finally:
+            db.close()
+    removed = sweep_expired_uploads(finished)
+    if removed:
+        print(f"🧹 Removed {removed} chunked upload(s) that were never merged")
+
+
+def worker_main(index: int, stop):
+    """Worker process: claim and run jobs until `stop` is set or the process that started it is gone"""
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    print(f"👷 Worker {index} started ({worker_id})")
+    registry.preload()
+    parent = multiprocessing.parent_process()
+    next_sweep = time.monotonic()
+    db = SessionLocal()
+    try:
+        while not stop.is_set() and (parent is None or parent.is_alive()):
+            if index == 0 and time.monotonic() >= next_sweep:
+                next_sweep = time.monotonic() + UPLOAD_SWEEP_INTERVAL
+                try:
+                    sweep_uploads()
+                except Exception as e:
+                    print(f"⚠️ Could not sweep chunked uploads: {e}")
+            try:
+                job = claim_job(db, worker_id)
+            except Exception as e:
+                print(f"⚠️ Worker {index} could not claim a job: {e}")
+                db.rollback()
+                job = None
+            if job is None:
+                stop.wait(JOB_POLL_INTERVAL)
+                continue
+            print(f"▶️ Worker {index} processing job {job.id} (attempt {job.attempts})")
+            run_job(job, worker_id)
+            db.expire_all()
+    finally:
+        db.close()
+
+
+def inference_main(stop):
+    """Inference process: serve the micro-batching inference service to the workers until `stop` is set"""
+    server = InferenceServer(inference_service, registry.get, os.environ["INFERENCE_ADDRESS"], os.environ["INFERENCE_AUTHKEY"])
+    server.start()
+    print(f"🧠 Inference service started ({server.address})")
+    registry.preload()
+    parent = multiprocessing.parent_process()
+    try:
+        while not stop.wait(1) and (parent is None or parent.is_alive()):
+            pass
+    finally:
+        server.stop()
+
+
+class WorkerPool:
+    """
+    Fixed-size pool of worker processes; its size bounds concurrent analyses.
+
+    Workers are not daemonic, since a job may start its own process pool
+    (FEATURE_WORKERS > 1) and daemonic processes cannot have children. They
+    are stopped through stop_event instead: by stop(), which also runs at
+    interpreter exit, or by themselves once the process that started them
+    has died.
+
+    With two or more workers and INFERENCE_SERVICE, the pool also runs an
+    inference process that scores every worker's batches, so concurrent jobs
+    share micro-batches; workers find it through INFERENCE_ADDRESS and
+    INFERENCE_AUTHKEY in their environment.
+    """
+
+    def __init__(self, workers: int = None):
+        self.workers = JOB_WORKERS if workers is None else workers
+        # spawn: forking the multi-threaded API server process is not safe
+        self.context = multiprocessing.get_context("spawn")
+        self.stop_event = self.context.Event()
+        self.processes = []
+        self.inference_stop = self.context.Event()
+        self.inference = None
+
+    def start(self):
+        if INFERENCE_SERVICE and self.workers > 1:
+            # Before the workers start: they inherit the service's address
+            os.environ["INFERENCE_ADDRESS"], os.environ["INFERENCE_AUTHKEY"] = new_server_address()
+            self.inference = self.context.Process(target=inference_main, args=(self.inference_stop,), name="inference-service")
+            self.inference.start()
+        else:
+            # One job at a time: nothing to merge with, batches are scored in place
+            os.environ.pop("INFERENCE_ADDRESS", None)
+            os.environ.pop("INFERENCE_AUTHKEY", None)
+        for index in range(self.workers):
+            process = self.context.Process(target=worker_main, args=(index, self.stop_event), name=f"pcap-worker-{index}")
+            process.start()
+            self.processes.append(process)
+        # Registered after multiprocessing's own exit handler, so it runs first:
+        # that one joins non-daemonic children and would wait on them forever
+        atexit.register(self.stop)
+
+    def stop(self, timeout: float = 10):
+        """Let workers finish their current job; stragglers are terminated (their jobs get re-queued)"""
+        self.stop_event.set()
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        self.processes = []
+        # After the workers, which may still be scoring their last job
+        if self.inference is not None:
+            self.inference_stop.set()
+            self.inference.join(timeout)
+            if self.inference.is_alive():
+                self.inference.terminate()
+                self.inference.join()
+            self.inference = None
+        atexit.unregister(self.stop)
+
+
+if __name__ == "__main__":
+    recover_jobs()
+    pool = WorkerPool(max(JOB_WORKERS, 1))
+    pool.start()
+    try:
+        for process in pool.processes:
+            process.join()
+    except KeyboardInterrupt:
+        pool.stop()
@@ -0,0 +1,177 @@
+"""
+Database contention: concurrent /status polls against concurrent job updates.
+
+Usage (from backend/):
+    python -m benchmarks.bench_database [--url sqlite:///./bench.db] [--engine both] [--pollers 16] [--writers 4] [--seconds 10]
+
+Writer processes run jobs through the queue like job workers do (claim,
+hash, lease renewal, result, report), committing after each step. Poller
+threads meanwhile run the /status query, as the API's threadpool would for
+open dashboards. "bare" is a plain create_engine(); "tuned" is make_engine()
+(WAL and busy timeout on SQLite, a sized pool elsewhere). The default URL is
+a fresh SQLite file in a temporary directory.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import load_only, sessionmaker
+from app.database import Base, make_engine
+from app.models import PcapFile, User
+
+RESULT = json.dumps({
+    "threats": [{"id": i, "type": "Suspicious Network Activity", "severity": "High", "description": "x" * 200,
+                 "confidence": 0.9, "sourceIP": "10.0.0.1", "destinationIP": "10.0.0.2", "port": 443} for i in range(3)],
+    "summary": {"totalThreats": 3, "riskScore": 85, "recommendation": "y" * 300},
+})
+
+
+def _engine(url: str, kind: str):
+    if kind == "tuned":
+        return make_engine(url)
+    if make_url(url).get_backend_name() == "sqlite":
+        return create_engine(url, connect_args={"check_same_thread": False})
+    return create_engine(url)
+
+
+def _writer(url: str, kind: str, index: int, stop, counts):
+    from app.worker import _complete, claim_job
+
+    engine = _engine(url, kind)
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    counts.put("ready")
+    commits = errors = 0
+    while not stop.is_set():
+        try:
+            job = claim_job(db, f"bench-{index}")
+            if job is None:
+                time.sleep(0.01)
+                continue
+            job.sha256 = f"{job.id:064x}"
+            db.commit()
+            job.lease_expires = datetime.utcnow()
+            db.commit()
+            job.report_status = "pending"
+            _complete(db, job, RESULT)
+            job.report_status = "ready"
+            db.commit()
+            commits += 5
+        except Exception as e:
+            errors += 1
+            db.rollback()
+            if errors <= 3:
+                print(f"  writer {index}: {type(e).__name__}: {str(e).splitlines()[0]}")
+    db.close()
+    counts.put((commits, errors))
+
+
+def _poller(Session, job_ids: list, user_id: int, stop, latencies: list, errors: list):
+    rng = np.random.default_rng(threading.get_ident() % 2 ** 32)
+    while not stop.is_set():
+        job_id = int(rng.choice(job_ids))
+        start = time.perf_counter()
+        db = Session()
+        try:
+            pcap_file = db.query(PcapFile).options(
+                load_only(PcapFile.id, PcapFile.status, PcapFile.filename)
+            ).filter(PcapFile.id == job_id, PcapFile.user_id == user_id).first()
+            pcap_file.status
+        except Exception:
+            errors.append(1)
+            db.rollback()
+        finally:
+            db.close()
+        latencies.append(time.perf_counter() - start)
+
+
+def _reset(url: str, jobs: int) -> tuple:
+    engine = _engine(url, "bare")
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    user = User(clerk_user_id="bench")
+    db.add(user)
+    db.commit()
+    db.add_all(PcapFile(user_id=user.id, filename=f"capture{i}.pcap", filepath="/dev/null", status="pending") for i in range(jobs))
+    db.commit()
+    job_ids = [row.id for row in db.query(PcapFile.id)]
+    user_id = user.id
+    db.close()
+    engine.dispose()
+    return job_ids, user_id
+
+
+def run(url: str, kind: str, pollers: int, writers: int, seconds: float, jobs: int):
+    job_ids, user_id = _reset(url, jobs)
+    engine = _engine(url, kind)
+    Session = sessionmaker(bind=engine)
+    context = multiprocessing.get_context("spawn")
+    writer_stop, counts = context.Event(), context.Queue()
+    processes = [context.Process(target=_writer, args=(url, kind, i, writer_stop, counts)) for i in range(writers)]
+    for process in processes:
+        process.start()
+    for _ in processes:
+        counts.get()  # imported and connected: start the clock
+
+    stop, latencies, errors = threading.Event(), [], []
+    threads = [threading.Thread(target=_poller, args=(Session, job_ids, user_id, stop, latencies, errors)) for _ in range(pollers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    writer_stop.set()
+    for thread in threads:
+        thread.join()
+    results = [counts.get() for _ in processes]
+    for process in processes:
+        process.join()
+    engine.dispose()
+
+    commits = sum(c for c, _ in results)
+    write_errors = sum(e for _, e in results)
+    ms = np.array(latencies) * 1000
+    print(f"  {kind:<6} polls {len(ms) / seconds:8.0f}/s  p50 {np.percentile(ms, 50):6.2f}ms  p95 {np.percentile(ms, 95):7.2f}ms  "
+          f"p99 {np.percentile(ms, 99):7.2f}ms  max {ms.max():7.1f}ms  poll errors {len(errors)}  |  "
+          f"commits {commits / seconds:6.0f}/s  write errors {write_errors}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="database URL (default: a temporary SQLite file); its tables are dropped")
+    parser.add_argument("--engine", choices=("bare", "tuned", "both"), default="both")
+    parser.add_argument("--pollers", type=int, default=16)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--jobs", type=int, default=100000, help="pending jobs created up front")
+    args = parser.parse_args()
+
+    tmp_dir = None
+    url = args.url
+    if url is None:
+        tmp_dir = tempfile.mkdtemp(prefix="bench_database_")
+        url = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+    try:
+        print(f"{make_url(url).render_as_string(hide_password=True)}: {args.pollers} pollers, {args.writers} writers, {args.seconds:g}s")
+        for kind in (("bare", "tuned") if args.engine == "both" else (args.engine,)):
+            if tmp_dir:
+                # Fresh file each run: journal_mode=WAL persists in the database
+                for name in os.listdir(tmp_dir):
+                    os.remove(os.path.join(tmp_dir, name))
+            run(url, kind, args.pollers, args.writers, args.seconds, args.jobs)
+    finally:
+        if tmp_dir:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
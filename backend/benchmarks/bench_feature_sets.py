@@ -0,0 +1,55 @@
+"""
+Feature extraction throughput: all 78 features vs. the features a model uses.
+
+Usage (from backend/):
+    python -m benchmarks.bench_feature_sets capture.pcap [model.joblib ...] [--engine stream|batch] [--repeat N]
+
+Models are resolved like MODEL_PATH (see model_registry). Each feature set
+is timed end to end (read, decode, flow table, features), best of --repeat.
+"""
+import argparse
+import contextlib
+import io
+import os
+import time
+from app.utils.features import ALL_78_FEATURES, feature_groups_for
+from app.utils.model_registry import model_features, registry
+from app.utils.pcap_converter import extract_flow_features
+
+
+def time_extraction(pcap_path: str, feature_names, engine: str, repeat: int):
+    best = None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            started = time.perf_counter()
+            features, _ = extract_flow_features(pcap_path, engine=engine, feature_names=feature_names)
+            elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(features)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pcap")
+    parser.add_argument("models", nargs="*", default=["xgboost_top20.joblib"])
+    parser.add_argument("--engine", default="stream", choices=["stream", "batch"])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    feature_sets = [("all 78", list(ALL_78_FEATURES))]
+    for name in args.models:
+        with contextlib.redirect_stdout(io.StringIO()):
+            feature_sets.append((os.path.basename(name), model_features(registry.get(name))))
+
+    print(f"{args.pcap} ({args.engine} engine, best of {args.repeat})")
+    baseline = None
+    for label, names in feature_sets:
+        seconds, n_flows = time_extraction(args.pcap, names, args.engine, args.repeat)
+        baseline = baseline or seconds
+        groups = ",".join(sorted(feature_groups_for(names))) or "-"
+        print(f"  {label:<24} {len(names):>2} features  groups={groups:<22} "
+              f"{seconds:7.3f}s  {n_flows / seconds:10.0f} flows/s  x{baseline / seconds:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Inference latency/throughput: scaler + sklearn-API model vs. the compiled
+fast-inference predictor (scaler folded into the model, see fast_inference).
+
+Usage (from backend/):
+    python -m benchmarks.bench_inference capture.pcap [model.joblib ...] [--scaler standard_scaler.pkl] [--min-flows N]
+
+Features are extracted once from the capture (tiled up to --min-flows rows)
+and each path scores the same matrix, best of --repeat. Agreement is the
+share of flows given the same label by both paths.
+"""
+import argparse
+import contextlib
+import io
+import os
+import time
+import warnings
+import numpy as np
+from app.utils.fast_inference import compile_predictor
+from app.utils.model_predictor import scale_features
+from app.utils.model_registry import model_features, registry
+from app.utils.pcap_converter import extract_flow_features
+
+
+def best_time(fn, repeat: int):
+    best, result = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pcap")
+    parser.add_argument("models", nargs="*", default=["xgboost_model.joblib", "xgboost_top20.joblib", "lr.joblib"])
+    parser.add_argument("--scaler", default="standard_scaler.pkl")
+    parser.add_argument("--min-flows", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        features, _ = extract_flow_features(args.pcap)
+        scaler = registry.get(args.scaler)
+        models = [(os.path.basename(name), registry.get(name)) for name in args.models]
+    features = np.nan_to_num(features)
+    if len(features) < args.min_flows:
+        features = np.tile(features, (-(-args.min_flows // len(features)), 1))
+    all_columns = list(model_features(None))
+    n = len(features)
+    print(f"{n} flows, best of {args.repeat}")
+
+    for label, model in models:
+        names = model_features(model)
+        X = np.ascontiguousarray(features[:, [all_columns.index(name) for name in names]])
+
+        def reference(rows):
+            with warnings.catch_warnings():
+                warnings.filterwarnings("ignore", message="X does not have valid feature names")
+                return model.predict_proba(scale_features(scaler, rows, names))
+
+        fast = compile_predictor(model, scaler)
+        if fast is None:
+            print(f"  {label}: not supported by fast_inference")
+            continue
+        ref_seconds, ref_proba = best_time(lambda: reference(X), args.repeat)
+        fast_seconds, fast_proba = best_time(lambda: fast.predict_proba(X), args.repeat)
+        single_seconds, _ = best_time(lambda: fast.predict_proba(X[:1]), 50)
+        ref_single, _ = best_time(lambda: reference(X[:1]), 50)
+        agreement = np.mean(np.argmax(ref_proba, axis=1) == np.argmax(fast_proba, axis=1))
+        print(f"  {label:<22} current {n / ref_seconds:10.0f} flows/s ({ref_seconds * 1e6 / n:6.2f} us/flow, single {ref_single * 1e3:6.2f} ms)"
+              f"  fast {n / fast_seconds:10.0f} flows/s ({fast_seconds * 1e6 / n:6.2f} us/flow, single {single_seconds * 1e3:6.2f} ms)"
+              f"  x{ref_seconds / fast_seconds:.1f}  agreement {agreement:.5%}"
+              f"  max |dp| {np.abs(ref_proba - fast_proba).max():.2e}")
+
+
+if __name__ == "__main__":
+    main()
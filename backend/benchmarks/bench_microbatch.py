@@ -0,0 +1,54 @@
+"""
+Many small concurrent jobs: direct predict_batch calls vs. the shared
+micro-batching inference service.
+
+Usage (from backend/):
+    python -m benchmarks.bench_microbatch capture.pcap [--model xgboost_model.joblib] [--jobs 64] [--flows 200] [--threads 8]
+
+Each job scores --flows rows taken from the capture's features; --threads
+jobs run at once, as concurrent background tasks would.
+"""
+import argparse
+import contextlib
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from app.utils.inference_service import InferenceService
+from app.utils.model_predictor import predict_batch
+from app.utils.model_registry import model_features, registry
+from app.utils.pcap_converter import extract_flow_features
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pcap")
+    parser.add_argument("--model", default="xgboost_model.joblib")
+    parser.add_argument("--scaler", default="standard_scaler.pkl")
+    parser.add_argument("--jobs", type=int, default=64)
+    parser.add_argument("--flows", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--delay-ms", type=float, default=5)
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        model, scaler = registry.get(args.model), registry.get(args.scaler)
+        features, _ = extract_flow_features(args.pcap, feature_names=model_features(model))
+    features = np.nan_to_num(features)
+    features = np.tile(features, (-(-args.flows // len(features)), 1)) if len(features) < args.flows else features
+    jobs = [features[(i * 7) % max(1, len(features) - args.flows):][:args.flows] for i in range(args.jobs)]
+    service = InferenceService(predict_batch, max_delay_ms=args.delay_ms)
+    predict_batch(jobs[0], model, scaler)  # compile/warm up outside the timings
+
+    print(f"{args.jobs} jobs x {args.flows} flows, {args.threads} concurrent")
+    for label, score in (("direct", predict_batch), ("micro-batched", service.predict)):
+        with ThreadPoolExecutor(args.threads) as pool:
+            cpu, wall = time.process_time(), time.perf_counter()
+            list(pool.map(lambda job: score(job, model, scaler), jobs))
+            cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+        print(f"  {label:<14} wall {wall:6.3f}s  cpu {cpu:6.3f}s  {args.jobs * args.flows / wall:9.0f} flows/s")
+    print(f"  service: {service.stats()}")
+
+
+if __name__ == "__main__":
+    main()
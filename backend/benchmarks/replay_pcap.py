@@ -0,0 +1,60 @@
+"""
+Replay a capture as a classic pcap stream at a controlled rate, for testing
+live ingestion (app/live.py) without a SPAN port.
+
+Usage (from backend/):
+    python -m benchmarks.replay_pcap capture.pcap --speed 10 | python -m app.live - --name replay
+    mkfifo /tmp/ids.fifo && python -m app.live /tmp/ids.fifo &
+    python -m benchmarks.replay_pcap capture.pcap --pps 5000 --out /tmp/ids.fifo
+
+--speed scales the capture's own inter-packet gaps (0 = as fast as possible);
+--pps sends at a fixed packet rate instead. Original timestamps are kept.
+"""
+import argparse
+import struct
+import sys
+import time
+from app.utils.packet_decoder import PCAP_MAGIC_NSEC, iter_raw_frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pcap")
+    parser.add_argument("--out", default="-", help="output path, e.g. a named pipe ('-' = stdout)")
+    parser.add_argument("--speed", type=float, default=1.0)
+    parser.add_argument("--pps", type=float, default=0)
+    args = parser.parse_args()
+
+    out = sys.stdout.buffer if args.out == "-" else open(args.out, "wb")
+    started = first_ts = None
+    sent = 0
+    try:
+        for ts, linktype, data in iter_raw_frames(args.pcap):
+            if started is None:
+                started, first_ts = time.monotonic(), ts
+                out.write(struct.pack("<IHHiIII", PCAP_MAGIC_NSEC, 2, 4, 0, 0, 262144, linktype))
+            if args.pps:
+                due = started + sent / args.pps
+            elif args.speed:
+                due = started + (ts - first_ts) / args.speed
+            else:
+                due = 0
+            delay = due - time.monotonic()
+            if delay > 0:
+                out.flush()
+                time.sleep(delay)
+            sec, nsec = divmod(round(ts * 1_000_000_000), 1_000_000_000)
+            out.write(struct.pack("<IIII", sec, nsec, len(data), len(data)))
+            out.write(data)
+            sent += 1
+        out.flush()
+    except BrokenPipeError:
+        pass
+    finally:
+        print(f"Replayed {sent} packets", file=sys.stderr)
+        if out is not sys.stdout.buffer:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
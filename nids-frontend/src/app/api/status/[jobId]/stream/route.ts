@@ -0,0 +1,43 @@
+import { NextRequest, NextResponse } from 'next/server'
+import { auth } from '@clerk/nextjs'
+
+const BACKEND_URL = process.env.FASTAPI_BACKEND_URL || 'http://localhost:8000'
+
+// Relays the backend's Server-Sent Events job status stream
+export const dynamic = 'force-dynamic'
+
+export async function GET(
+  request: NextRequest,
+  { params }: { params: { jobId: string } }
+) {
+  try {
+    const { userId, getToken } = auth()
+    if (!userId) {
+      return NextResponse.json({ error: 'Unauthorized' }, { status: 401 })
+    }
+
+    const token = await getToken()
+
+    const response = await fetch(`${BACKEND_URL}/status/${params.jobId}/stream`, {
+      headers: { 'Authorization': `Bearer ${token}` },
+      signal: request.signal,
+      cache: 'no-store',
+    })
+
+    if (!response.ok || !response.body) {
+      const data = await response.json().catch(() => ({ error: 'Status stream failed' }))
+      return NextResponse.json(data, { status: response.status })
+    }
+
+    return new Response(response.body, {
+      headers: {
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'Connection': 'keep-alive',
+      },
+    })
+
+  } catch (error) {
+    return NextResponse.json({ error: 'Internal server error' }, { status: 500 })
+  }
+}
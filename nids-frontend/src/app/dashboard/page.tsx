@@ -17,6 +17,41 @@ export default function DashboardPage() {
   const [analysisResult, setAnalysisResultState] = useState<any>(null)
   const fileInputRef = useRef<HTMLInputElement>(null)
 
+  // Status and progress pushed by the backend; falls back to polling if the stream fails
+  const watchJobStatus = (jobId: number) => {
+    const source = new EventSource(`/api/status/${jobId}/stream`)
+    let finished = false
+
+    source.addEventListener("status", (message) => {
+      const data = JSON.parse((message as MessageEvent).data)
+      if (data.status === "completed" || data.status === "failed") {
+        finished = true
+        source.close()
+        setStatus(data.status)
+        setIsProcessing(false)
+        if (data.status === "completed") {
+          fetchResult(jobId)
+        } else {
+          setAnalysisResultState({
+            status: "Failed",
+            error: "Analysis failed. Please try again.",
+            timestamp: new Date().toISOString(),
+          })
+        }
+        return
+      }
+      const stage = data.stage ? ` (${data.stage})` : ""
+      const progress = typeof data.progress === "number" ? ` ${Math.round(data.progress)}%` : ""
+      setStatus(`${data.status}${stage}${progress}`)
+    })
+
+    source.onerror = () => {
+      if (finished) return
+      source.close()
+      pollJobStatus(jobId)
+    }
+  }
+
   const pollJobStatus = (jobId: number) => {
     const interval = setInterval(async () => {
       try {
@@ -48,12 +83,16 @@ export default function DashboardPage() {
     }, 5000)
   }
 
-  const fetchResult = async (jobId: number) => {
+  const fetchResult = async (jobId: number, attempt = 0) => {
     try {
       const response = await fetch(`/api/result/${jobId}`)
       if (!response.ok) throw new Error("Result fetch failed")
       const data = await response.json()
       setAnalysisResultState(data)
+      // The model-based report is shown first; pick up the detailed one when it is ready
+      if (data.report === "pending" && attempt < 10) {
+        setTimeout(() => fetchResult(jobId, attempt + 1), 3000)
+      }
     } catch (err) {
       console.error("Result fetch failed:", err)
       setAnalysisResultState({
@@ -172,9 +211,16 @@ export default function DashboardPage() {
                       formData.append("chunkIndex", i.toString())
                       formData.append("totalChunks", totalChunks.toString())
                       formData.append("uploadId", uploadId)
+                      // The server writes each chunk at chunkIndex * chunkSize in one preallocated file
+                      formData.append("chunkSize", chunkSize.toString())
+                      formData.append("fileSize", selectedFile.size.toString())
 
                       try {
-                        const res = await fetch("/api/upload-chunk", { method: "POST", body: formData })
+                        // Re-sending a chunk just rewrites it in place, so failed chunks are retried
+                        let res = await fetch("/api/upload-chunk", { method: "POST", body: formData })
+                        for (let attempt = 1; !res.ok && res.status !== 413 && attempt < 3; attempt++) {
+                          res = await fetch("/api/upload-chunk", { method: "POST", body: formData })
+                        }
                         if (!res.ok) throw new Error(`Chunk ${i} failed`)
                         uploadedChunks++
                         setStatus(`Uploading... ${uploadedChunks}/${totalChunks}`)
@@ -191,7 +237,7 @@ export default function DashboardPage() {
                           const data = await mergeRes.json()
                           setJobId(data.job_id)
                           setStatus("Processing started...")
-                          pollJobStatus(data.job_id)
+                          watchJobStatus(data.job_id)
                         }
                       } catch (err) {
                         console.error(err)
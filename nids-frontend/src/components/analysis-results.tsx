@@ -12,9 +12,9 @@ interface Threat {
   severity: "Low" | "Medium" | "High" | "Critical"
   description: string
   confidence: number
-  sourceIP: string
-  destinationIP: string
-  port: number
+  sourceIP: string | null
+  destinationIP: string | null
+  port: number | null
 }
 
 interface AnalysisResultsProps {
@@ -175,15 +175,15 @@ export function AnalysisResults({ data }: AnalysisResultsProps) {
                         <div className="grid grid-cols-2 gap-3">
                           <div className="bg-white bg-opacity-50 p-2 rounded">
                             <p className="text-xs text-muted-foreground">Source IP</p>
-                            <p className="font-mono text-foreground">{threat.sourceIP}</p>
+                            <p className="font-mono text-foreground">{threat.sourceIP ?? "—"}</p>
                           </div>
                           <div className="bg-white bg-opacity-50 p-2 rounded">
                             <p className="text-xs text-muted-foreground">Destination IP</p>
-                            <p className="font-mono text-foreground">{threat.destinationIP}</p>
+                            <p className="font-mono text-foreground">{threat.destinationIP ?? "—"}</p>
                           </div>
                           <div className="bg-white bg-opacity-50 p-2 rounded">
                             <p className="text-xs text-muted-foreground">Port</p>
-                            <p className="font-mono text-foreground">{threat.port}</p>
+                            <p className="font-mono text-foreground">{threat.port ?? "—"}</p>
                           </div>
                           <div className="bg-white bg-opacity-50 p-2 rounded">
                             <p className="text-xs text-muted-foreground">Threat ID</p>